@@ -11,10 +11,24 @@ from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate  # type: ignore
 from flask_smorest import Api  # type: ignore
 
+import etag_cache
+import item_search
+import metrics
+from blocklist import revocation_cache
+from cli import (blocklist_cli, counters_cli, export_items, import_items,
+                 seed_data, tag_index_cli)
 from db import db
-from models import JWTBlocklist
+from jobs import job_runner
+from json_provider import OrjsonProvider
+from password_hashing import password_hasher
+from query_filters import scan_guard
+from schema_compiler import schema_compiler
+from sql_profiler import sql_profiler
+from tag_index import tag_index
 # Importing blueprints from the resources package
 from resources.item import blp as ItemBlueprint
+from resources.job import blp as JobBlueprint
+from resources.monitoring import blp as MonitoringBlueprint
 from resources.store import blp as StoreBlueprint
 from resources.tag import blp as TagBlueprint
 from resources.user import blp as UserBlueprint
@@ -24,6 +38,11 @@ def create_app(db_url=None):  # db_url parameter for database configuration flex
     """Flask application factory pattern."""
 
     app = Flask(__name__)  # Initialize Flask app
+    # Encode JSON bodies with orjson when it is installed (see json_provider.py); the
+    # provider serves jsonify(), so flask-smorest's responses and the JWT handlers below
+    # go through it too. JSON_PROVIDER=stdlib keeps Flask's default provider.
+    if os.getenv("JSON_PROVIDER", "orjson").lower() == "orjson":
+        app.json = OrjsonProvider(app)
     # load env vars from the .env file
     load_dotenv()
 
@@ -44,8 +63,85 @@ def create_app(db_url=None):  # db_url parameter for database configuration flex
     # Disable SQLAlchemy event system, which is not needed and adds overhead
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # Per-worker cache in front of the jwt_blocklist table (see blocklist.py)
+    app.config["JWT_BLOCKLIST_CACHE_ENABLED"] = os.getenv(
+        "JWT_BLOCKLIST_CACHE_ENABLED", "true").lower() == "true"
+    app.config["JWT_BLOCKLIST_CACHE_SIZE"] = int(
+        os.getenv("JWT_BLOCKLIST_CACHE_SIZE", "10000"))
+    # How stale (in seconds) a worker's view of other workers' revocations may get
+    app.config["JWT_BLOCKLIST_CACHE_POLL_SECONDS"] = float(
+        os.getenv("JWT_BLOCKLIST_CACHE_POLL_SECONDS", "1.0"))
+    # Expected number of revoked tokens for the Bloom filter, 0 disables it
+    app.config["JWT_BLOCKLIST_BLOOM_CAPACITY"] = int(
+        os.getenv("JWT_BLOCKLIST_BLOOM_CAPACITY", "0"))
+
+    # How stale (in seconds) a worker's view of other workers' catalog writes may get
+    # before it stops answering If-None-Match with 304 from memory (see etag_cache.py)
+    app.config["ETAG_VERSION_POLL_SECONDS"] = float(
+        os.getenv("ETAG_VERSION_POLL_SECONDS", "1.0"))
+
+    # Password hashing pool (see password_hashing.py): processes per gunicorn worker,
+    # hashes allowed to wait for one before requests get a 503, and pbkdf2 cost.
+    # Changing the rounds rehashes each password on its owner's next login.
+    app.config["PASSWORD_HASH_WORKERS"] = int(
+        os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    app.config["PASSWORD_HASH_QUEUE_DEPTH"] = int(
+        os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "8"))
+    app.config["PASSWORD_HASH_ROUNDS"] = int(
+        os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+
+    # Stores with at least this many items are deleted by a background job (DELETE
+    # answers 202), in transactions of STORE_DELETE_BATCH_SIZE items (see store_deletion.py)
+    app.config["STORE_DELETE_ASYNC_THRESHOLD"] = int(
+        os.getenv("STORE_DELETE_ASYNC_THRESHOLD", "10000"))
+    app.config["STORE_DELETE_BATCH_SIZE"] = int(
+        os.getenv("STORE_DELETE_BATCH_SIZE", "5000"))
+    # Threads per gunicorn worker running background jobs (see jobs.py)
+    app.config["JOB_RUNNER_WORKERS"] = int(os.getenv("JOB_RUNNER_WORKERS", "1"))
+
+    # Per-request SQL statistics in X-DB-Query-Count / Server-Timing headers and a
+    # log line (see sql_profiler.py), for a sampled fraction of the requests
+    app.config["SQL_PROFILER_ENABLED"] = os.getenv(
+        "SQL_PROFILER_ENABLED", "false").lower() == "true"
+    app.config["SQL_PROFILER_SAMPLE_RATE"] = float(
+        os.getenv("SQL_PROFILER_SAMPLE_RATE", "1.0"))
+    # Same statement shape repeated this many times in a request is logged as an N+1 suspect
+    app.config["SQL_PROFILER_N_PLUS_ONE_THRESHOLD"] = int(
+        os.getenv("SQL_PROFILER_N_PLUS_ONE_THRESHOLD", "5"))
+
+    # Answer store summaries and tag deletion checks from the trigger-maintained
+    # counters, or from aggregate queries when false (see catalog_counters.py)
+    app.config["CATALOG_COUNTERS_ENABLED"] = os.getenv(
+        "CATALOG_COUNTERS_ENABLED", "true").lower() == "true"
+
+    # Refuse GET /item filter and sort combinations whose query plan reads the
+    # whole item table, once it holds more rows than this (see query_filters.py)
+    app.config["FILTER_MAX_SCAN_ROWS"] = int(os.getenv("FILTER_MAX_SCAN_ROWS", "10000"))
+    # How stale (in seconds) the row count compared with it may get
+    app.config["FILTER_ROW_COUNT_TTL_SECONDS"] = float(
+        os.getenv("FILTER_ROW_COUNT_TTL_SECONDS", "60"))
+
+    # Answer tag-set queries of GET /store/<id>/items from a per-worker inverted
+    # index of the item tags, or always by SQL when false (see tag_index.py)
+    app.config["TAG_INDEX_ENABLED"] = os.getenv(
+        "TAG_INDEX_ENABLED", "true").lower() == "true"
+
+    # Dump the catalog schemas through generated functions (see schema_compiler.py)
+    app.config["COMPILED_SCHEMAS_ENABLED"] = os.getenv(
+        "COMPILED_SCHEMAS_ENABLED", "true").lower() == "true"
+
     db.init_app(app)  # Initialize Flask-SQLAlchemy extension
-    migrate = Migrate(app, db)  # Initialize Flask-Migrate extension
+    revocation_cache.init_app(app)
+    etag_cache.init_app(app)
+    password_hasher.init_app(app)
+    job_runner.init_app(app)
+    sql_profiler.init_app(app)
+    schema_compiler.init_app(app)
+    scan_guard.init_app(app)
+    tag_index.init_app(app)
+    metrics.init_app(app)
+    # Initialize Flask-Migrate extension, autogenerate leaves the SQLite full-text tables alone
+    migrate = Migrate(app, db, include_name=item_search.include_name)
     api = Api(app)  # Initialize Flask-Smorest
 
     # secret key for JWT signing.
@@ -135,9 +231,8 @@ def create_app(db_url=None):  # db_url parameter for database configuration flex
 
         # get jti from the payload of the current request
         jti = jwt_payload["jti"]
-        result = JWTBlocklist.query.filter_by(
-            jti=jti).first()  # find the jti in blocklist table
-        return result is not None  # return True if not None.
+        # answered from the per-worker cache when possible, from the DB otherwise
+        return revocation_cache.is_revoked(jti)
 
     @jwt.revoked_token_loader
     def revoked_token_callback(jwt_header, jwt_payload):
@@ -200,5 +295,15 @@ def create_app(db_url=None):  # db_url parameter for database configuration flex
     api.register_blueprint(StoreBlueprint)
     api.register_blueprint(TagBlueprint)
     api.register_blueprint(UserBlueprint)
+    api.register_blueprint(JobBlueprint)
+    api.register_blueprint(MonitoringBlueprint)
+
+    # Register maintenance commands with the flask CLI
+    app.cli.add_command(blocklist_cli)
+    app.cli.add_command(counters_cli)
+    app.cli.add_command(export_items)
+    app.cli.add_command(import_items)
+    app.cli.add_command(seed_data)
+    app.cli.add_command(tag_index_cli)
 
     return app
@@ -0,0 +1,183 @@
+"""
+ASGI entry point: the API served by an asyncio server, on an async engine.
+
+    uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 80 --workers 4
+
+A gunicorn sync worker serves one request at a time, and spends most of it
+waiting for the database. Here each uvicorn worker runs every request in a
+greenlet on its event loop, and the request's statements go through an
+AsyncEngine (see async_db.py): while one request waits for a query, the loop
+serves the others. It is the same Flask application, create_app() wrapped by
+AsgiApp below, so the routes, the schemas, the JWT checks and the headers
+are those of the gunicorn deployment.
+
+Concurrency is cooperative: a request holds the loop between two queries,
+so CPU-heavy work must stay off it (password hashing has its process pool,
+keep PASSWORD_HASH_WORKERS above 0).
+
+A request keeps its session's connection until it ends, so at most
+pool_size + max_overflow of them (SQLALCHEMY_ENGINE_OPTIONS, 5 + 10 by
+default) can be served at once. The others wait for their turn on the loop
+before the application sees them, holding nothing: a request waiting for a
+connection while the others wait for a lock it holds (the caches of
+etag_cache.py, blocklist.py and tag_index.py refresh under one) would stall
+them all until the pool timeout.
+"""
+
+import asyncio
+import io
+import logging
+import sys
+
+from sqlalchemy.util import greenlet_spawn
+
+import metrics
+from app import create_app
+from async_db import async_db, await_
+from db import db
+
+logger = logging.getLogger(__name__)
+
+
+def create_asgi_app(db_url=None):
+    """create_app(), with the async engine, as an ASGI application."""
+    app = create_app(db_url)
+    with app.app_context():
+        database_url = db.engine.url
+    async_db.init_app(app, database_url)
+    metrics.instrument_pool(async_db.engine.sync_engine)
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    return AsgiApp(app, options.get("pool_size", 5) + options.get("max_overflow", 10))
+
+
+class _RequestBody(io.RawIOBase):
+    """wsgi.input, reading the ASGI request body messages as they come."""
+
+    def __init__(self, receive):
+        self._receive = receive
+        self._chunk = memoryview(b"")
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and self._more:
+            message = await_(self._receive())
+            if message["type"] == "http.disconnect":
+                raise OSError("The client disconnected before the end of the request body.")
+            self._chunk = memoryview(message.get("body", b""))
+            self._more = message.get("more_body", False)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def _environ(scope, receive):
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        # WSGI strings are bytes decoded as latin-1
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BufferedReader(_RequestBody(receive)),
+        # the body ends where the server says so, chunked requests included
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        if name in environ:
+            # repeated headers are one comma separated list, but cookies are separated by "; "
+            separator = "; " if name == "HTTP_COOKIE" else ","
+            value = f"{environ[name]}{separator}{value}"
+        environ[name] = value
+    return environ
+
+
+class AsgiApp:
+    """Serves a WSGI application from ASGI, each request in a greenlet (see the module docstring)."""
+
+    def __init__(self, wsgi_app, max_requests):
+        self.wsgi_app = wsgi_app
+        # requests served at once, one per pooled connection
+        self._slots = asyncio.Semaphore(max_requests)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            async with self._slots:
+                await greenlet_spawn(self._serve, scope, receive, send)
+        else:
+            raise NotImplementedError(f"Unsupported ASGI scope {scope['type']}.")
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_db.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _serve(self, scope, receive, send):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["start"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                            for name, value in headers],
+            }
+            return lambda data: send_body(data, more=True)
+
+        def send_body(data, more):
+            if not response.get("sent"):
+                response["sent"] = True
+                await_(send(response["start"]))
+            await_(send({"type": "http.response.body", "body": data, "more_body": more}))
+
+        try:
+            body = self.wsgi_app(_environ(scope, receive), start_response)
+            try:
+                # hold each chunk back until the next one, so a body of one
+                # chunk goes out in a single message
+                pending = None
+                for chunk in body:
+                    if not chunk:
+                        continue
+                    if pending is not None:
+                        send_body(pending, more=True)
+                    pending = chunk
+                send_body(pending or b"", more=False)
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+        except Exception:
+            if response.get("sent"):
+                raise  # the server drops the connection
+            logger.exception("Exception on %s %s", scope["method"], scope["path"])
+            await_(send({"type": "http.response.start", "status": 500,
+                         "headers": [(b"content-type", b"text/plain; charset=utf-8")]}))
+            await_(send({"type": "http.response.body", "body": b"Internal Server Error"}))
@@ -0,0 +1,150 @@
+"""
+Async database access for the ASGI deployment mode (see asgi.py).
+
+Under the ASGI server every request runs in a greenlet on the event loop,
+and the statements of its session go through the sync facade of an
+AsyncEngine (aiosqlite or asyncpg): each round trip to the database suspends
+the greenlet and lets the loop serve other requests in the meantime, the
+same mechanism AsyncSession is built on. The handlers, the models and
+Flask-SQLAlchemy's db.session stay as they are. Session.get_bind() picks the
+async engine inside a request greenlet, and Flask-SQLAlchemy's own engine
+everywhere else: CLI commands, migrations, the job and tag index threads.
+
+The async URL is derived from SQLALCHEMY_DATABASE_URI, the same database
+through the async driver of its dialect. ASYNC_DATABASE_URL overrides it,
+for options the async driver spells differently (asyncpg takes ssl= rather
+than sslmode=, for one). The engine takes SQLALCHEMY_ENGINE_OPTIONS too.
+
+A request greenlet must not block the loop's thread: Lock and wait() below
+stand in for threading.Lock and Future.result() where the wait can be long,
+and yield to the loop instead while a request greenlet waits.
+"""
+
+import asyncio
+import collections
+import threading
+
+from flask_sqlalchemy.session import Session as _FlaskSession
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+try:
+    from sqlalchemy.util import await_
+except ImportError:  # SQLAlchemy 2.0 names it await_only
+    from sqlalchemy.util import await_only as await_
+from sqlalchemy.util.concurrency import in_greenlet
+
+# dialect -> asyncio driver
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def async_database_url(url):
+    """Returns the URL of the same database through the async driver of its dialect."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver is configured for {backend} databases, "
+                           f"set ASYNC_DATABASE_URL.")
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        raise RuntimeError("An in-memory SQLite database belongs to one connection, "
+                           "the ASGI mode needs a database file.")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+class AsyncDatabase:
+    """The AsyncEngine of the ASGI mode, None under a WSGI server."""
+
+    def __init__(self):
+        self.engine = None
+
+    def init_app(self, app, database_url):
+        """Creates the async engine. ``database_url`` is the resolved URL of db.engine."""
+        url = app.config.setdefault("ASYNC_DATABASE_URL", None) or async_database_url(database_url)
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+        self.engine = create_async_engine(url, **options)
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+async_db = AsyncDatabase()
+
+
+class Session(_FlaskSession):
+    """Flask-SQLAlchemy's session, on the async engine in the requests of the ASGI server."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and async_db.engine is not None and in_greenlet():
+            return async_db.engine.sync_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class Lock:
+    """threading.Lock, which a request greenlet waits for by yielding to the event loop.
+
+    The request greenlets share the loop's thread: one blocking on a lock
+    held by another, suspended in a query, would never get it. A greenlet
+    finding the lock taken waits on a future instead, which release() (from
+    any thread) resolves for the first waiter, and tries again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._guard = threading.Lock()  # held briefly, around the waiters
+        self._waiters = collections.deque()
+
+    def acquire(self):
+        if self._lock.acquire(blocking=False):
+            return True
+        if not in_greenlet():
+            return self._lock.acquire()
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._guard:
+                if self._lock.acquire(blocking=False):
+                    return True
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+            try:
+                await_(waiter)
+            except BaseException:
+                # cancelled: pass a wake-up it may have taken on to the next waiter
+                with self._guard:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    self._wake_next()
+                raise
+
+    def release(self):
+        with self._guard:
+            self._lock.release()
+            self._wake_next()
+
+    def _wake_next(self):
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def wait(future, timeout=None):
+    """Returns ``future.result(timeout)``, yielding to the event loop in a request greenlet.
+
+    Raises TimeoutError when the timeout expires.
+    """
+    if not in_greenlet():
+        return future.result(timeout)
+    return await_(asyncio.wait_for(asyncio.wrap_future(future), timeout))
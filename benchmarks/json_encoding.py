@@ -0,0 +1,93 @@
+"""
+JSON encoding of a large response: stdlib provider vs orjson provider.
+
+A store with --items items (each with its tags) is seeded, and its GET /store/<id>
+body, the StoreSchema dump with every item embedded, is timed in three parts:
+
+- dump: StoreSchema().dump() of the loaded store, the same for both providers
+- encode: app.json.response() of the dump, for each provider
+- request: the whole GET /store/<id> through the test client, for each provider
+
+Run from the repository root:
+
+    python benchmarks/json_encoding.py --items 10000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-key-0123456789")
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+from app import create_app  # noqa: E402
+from db import db  # noqa: E402
+from json_provider import OrjsonProvider, orjson  # noqa: E402
+from models import StoreModel  # noqa: E402
+from schemas import StoreSchema  # noqa: E402
+from seeding import Seeder  # noqa: E402
+
+PROVIDERS = {"stdlib": DefaultJSONProvider, "orjson": OrjsonProvider}
+
+
+def timed(func, repeat):
+    """Returns the median seconds of ``repeat`` calls of func, after one warm-up call."""
+    func()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    if orjson is None:
+        sys.exit("orjson is not installed, both providers would use the stdlib encoder.")
+
+    app = create_app("sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    with app.app_context():
+        db.create_all()
+        Seeder().seed(stores=1, items=args.items, tags=args.tags, users=0, blocklisted=0)
+
+    with app.test_request_context():
+        store = db.session.get(StoreModel, 1)
+        dump_seconds = timed(lambda: StoreSchema().dump(store), args.repeat)
+        payload = StoreSchema().dump(store)
+
+        encode_seconds, bodies = {}, {}
+        for name, provider_class in PROVIDERS.items():
+            provider = provider_class(app)
+            encode_seconds[name] = timed(lambda: provider.response(payload), args.repeat)
+            bodies[name] = provider.response(payload).get_data()
+    if bodies["stdlib"] != bodies["orjson"]:
+        sys.exit("The providers encoded the payload differently.")
+
+    request_seconds = {}
+    client = app.test_client()
+    for name, provider_class in PROVIDERS.items():
+        app.json = provider_class(app)
+        request_seconds[name] = timed(lambda: client.get("/store/1").get_data(), args.repeat)
+
+    print(f"GET /store/1 with {args.items} items, {len(bodies['stdlib']) / 1e6:.1f} MB of JSON")
+    print(f"  marshmallow dump     {dump_seconds * 1000:8.1f} ms")
+    for name in PROVIDERS:
+        print(f"  encode ({name:<6})      {encode_seconds[name] * 1000:8.1f} ms"
+              f"   request {request_seconds[name] * 1000:8.1f} ms")
+    print(f"Encoding is {encode_seconds['stdlib'] / encode_seconds['orjson']:.1f}x faster, "
+          f"{(request_seconds['stdlib'] - request_seconds['orjson']) * 1000:.1f} ms "
+          f"saved per request.")
+
+
+if __name__ == "__main__":
+    main()
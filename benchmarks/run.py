@@ -0,0 +1,302 @@
+"""
+Load benchmark of every API route, with a regression check against a baseline.
+
+The app is built with create_app(db_url=...), the catalog is seeded with the
+deterministic generator of ``flask seed`` (seeding.py), and each scenario below sends
+a fixed number of requests from --concurrency threads, each with its own test
+client. Requests go through the whole WSGI app (JWT checks, validation, DB,
+serialization) but not through an HTTP server, so the numbers track the
+application's own cost. Queries per request come from the SQL profiler's
+X-DB-Query-Count header.
+
+    python benchmarks/run.py                                   # SQLite
+    python benchmarks/run.py --database-url postgresql://...   # scratch PostgreSQL
+    python benchmarks/run.py --save-baseline                   # store the reference
+    python benchmarks/run.py --baseline benchmarks/baseline.json
+
+Results are written as JSON (--output). With --baseline the run is compared
+scenario by scenario, and the exit status is 1 when any scenario failed
+requests, runs more queries per request, or is slower than the baseline by
+more than --tolerance (p95 latency up, or throughput down). Baselines are only
+comparable on the same machine and database.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-key-0123456789")
+# every request reports its query count in X-DB-Query-Count
+os.environ["SQL_PROFILER_ENABLED"] = "true"
+os.environ["SQL_PROFILER_SAMPLE_RATE"] = "1.0"
+
+import sqlalchemy  # noqa: E402
+from flask_jwt_extended import (create_access_token,  # noqa: E402
+                                create_refresh_token, decode_token)
+
+from app import create_app  # noqa: E402
+from db import db  # noqa: E402
+from pagination import encode_cursor  # noqa: E402
+from seeding import DESCRIPTION_WORDS, Seeder  # noqa: E402
+
+BENCH_USER = {"username": "benchmark", "password": "benchmark-password"}
+
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class Env:
+    """What scenarios need to build their requests."""
+
+    def __init__(self, app, sizes, token, user_id):
+        self.app = app
+        self.sizes = sizes
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.user_id = user_id
+        # ids and names of rows created by write scenarios, never colliding with the dataset
+        self.new_ids = itertools.count(sizes["items"] + 1_000_000)
+
+    def item_id(self, i):
+        return i % self.sizes["items"] + 1
+
+    def store_id(self, i):
+        return i % self.sizes["stores"] + 1
+
+    def tag_id(self, i):
+        return i % self.sizes["tags"] + 1
+
+
+# Each scenario builds request number i as (method, path, keyword arguments of
+# the test client call, expected status codes). Building happens before timing.
+SCENARIOS = {
+    "item_get": lambda env, i: (
+        "GET", f"/item/{env.item_id(i * 7919)}", {"headers": env.auth}, {200}),
+    "item_list": lambda env, i: (
+        "GET", "/item?limit=20", {"headers": env.auth}, {200}),
+    "item_list_deep_page": lambda env, i: (
+        "GET", f"/item?limit=20&cursor={encode_cursor([env.sizes['items'] - 40])}",
+        {"headers": env.auth}, {200}),
+    "item_list_sparse": lambda env, i: (
+        "GET", "/item?limit=20&fields=id,name,price&include=",
+        {"headers": env.auth}, {200}),
+    # the rarest description words, each found in 2 to 3% of the items
+    "item_search": lambda env, i: (
+        "GET", f"/item/search?q={DESCRIPTION_WORDS[-1 - i % 30]}&limit=20",
+        {"headers": env.auth}, {200}),
+    "item_list_filtered": lambda env, i: (
+        "GET", f"/item?limit=20&store_id={env.store_id(i)}&price[gte]={i % 900}&sort=-price",
+        {"headers": env.auth}, {200}),
+    # popular tags, so "all" has matches; answered by the tag index once it is built
+    "store_items_tagged": lambda env, i: (
+        "GET", f"/store/{env.store_id(i)}/items?tags={i % 5 + 1},{i % 7 + 6}&match={('all', 'any')[i % 2]}",
+        {}, {200}),
+    "item_create": lambda env, i: (
+        "POST", "/item",
+        {"headers": env.auth, "json": {"name": f"bench-post-{next(env.new_ids)}",
+                                       "price": 9.99, "store_id": env.store_id(i)}},
+        {201}),
+    "item_put_create": lambda env, i: _put_create(env, i),
+    "store_get": lambda env, i: (
+        "GET", f"/store/{env.store_id(i)}", {}, {200}),
+    "store_list": lambda env, i: (
+        "GET", "/store?limit=5", {}, {200}),
+    "store_tags": lambda env, i: (
+        "GET", f"/store/{env.store_id(i)}/tags", {}, {200}),
+    "tag_get": lambda env, i: (
+        "GET", f"/tag/{env.tag_id(i)}", {}, {200}),
+    "tag_link": lambda env, i: (
+        "POST", f"/item/{env.item_id(i * 31)}/tag/{env.tag_id(i)}", {}, {200}),
+    "login": lambda env, i: (
+        "POST", "/login", {"json": BENCH_USER}, {200}),
+    "refresh": lambda env, i: _with_token(env, "/refresh", create_refresh_token),
+    "logout": lambda env, i: _with_token(env, "/logout", create_access_token),
+}
+
+
+def _put_create(env, i):
+    new_id = next(env.new_ids)
+    return ("PUT", f"/item/{new_id}",
+            {"headers": dict(env.auth, **{"If-None-Match": "*"}),
+             "json": {"name": f"bench-put-{new_id}", "price": 1.5,
+                      "store_id": env.store_id(i)}},
+            {200})
+
+
+def _with_token(env, path, create_token):
+    # both endpoints revoke the token they are called with, so each request needs its own
+    with env.app.app_context():
+        token = create_token(identity=str(env.user_id))
+    return "POST", path, {"headers": {"Authorization": f"Bearer {token}"}}, {200}
+
+
+def percentile(quantiles, p):
+    return quantiles[p - 1] * 1000
+
+
+def run_scenario(env, name, requests, concurrency, warmup):
+    build = SCENARIOS[name]
+    calls = [build(env, i) for i in range(warmup + requests)]
+    client = env.app.test_client()
+    for method, path, kwargs, _ in calls[:warmup]:
+        client.open(path, method=method, **kwargs)
+    calls = calls[warmup:]
+
+    latencies, queries, failures = [], [], []
+    lock = threading.Lock()
+
+    def worker(share):
+        client = env.app.test_client()
+        local_latencies, local_queries, local_failures = [], [], []
+        for method, path, kwargs, expected in share:
+            started = time.perf_counter()
+            response = client.open(path, method=method, **kwargs)
+            response.get_data()
+            local_latencies.append(time.perf_counter() - started)
+            local_queries.append(int(response.headers.get("X-DB-Query-Count", 0)))
+            if response.status_code not in expected:
+                local_failures.append(response.status_code)
+        with lock:
+            latencies.extend(local_latencies)
+            queries.extend(local_queries)
+            failures.extend(local_failures)
+
+    threads = [threading.Thread(target=worker, args=(calls[n::concurrency],))
+               for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "failed": len(failures),
+        "failed_statuses": sorted(set(failures)),
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 3),
+            "p50": round(percentile(quantiles, 50), 3),
+            "p95": round(percentile(quantiles, 95), 3),
+            "p99": round(percentile(quantiles, 99), 3),
+        },
+        "queries_per_request": round(statistics.fmean(queries), 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns (scenario, reason) pairs for every regression against the baseline."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        if current["failed"]:
+            regressions.append((name, f"{current['failed']} failed requests "
+                                      f"(statuses {current['failed_statuses']})"))
+        reference = baseline.get("scenarios", {}).get(name)
+        if reference is None:
+            continue
+        if current["queries_per_request"] > reference["queries_per_request"] + 0.01:
+            regressions.append((name, f"queries per request {reference['queries_per_request']}"
+                                      f" -> {current['queries_per_request']}"))
+        if current["latency_ms"]["p95"] > reference["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append((name, f"p95 {reference['latency_ms']['p95']} ms"
+                                      f" -> {current['latency_ms']['p95']} ms"))
+        if current["throughput_rps"] < reference["throughput_rps"] * (1 - tolerance):
+            regressions.append((name, f"throughput {reference['throughput_rps']}"
+                                      f" -> {current['throughput_rps']} req/s"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url",
+                        help="Scratch database, emptied and seeded. A temporary SQLite file by default.")
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=500, help="Timed requests per scenario.")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Run only this scenario (repeatable).")
+    parser.add_argument("--output", default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", help="Results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative p95/throughput degradation.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"Also write the results to {DEFAULT_BASELINE}.")
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = create_app(database_url)
+
+    with app.app_context():
+        db.create_all()
+        counts = Seeder(seed=args.seed).seed(
+            stores=args.stores, items=args.items, tags=args.tags, users=0, blocklisted=0)
+    sizes = {"stores": args.stores, "items": args.items, "tags": args.tags,
+             "links": counts["items_tags"]}
+
+    client = app.test_client()
+    client.post("/register", json=BENCH_USER)
+    tokens = client.post("/login", json=BENCH_USER).get_json()
+    with app.app_context():
+        user_id = int(decode_token(tokens["access_token"])["sub"])
+    env = Env(app, sizes, tokens["access_token"], user_id)
+
+    results = {
+        "meta": {
+            "database": sqlalchemy.engine.make_url(database_url).get_backend_name(),
+            "dataset": dict(sizes, seed=args.seed),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "scenarios": {},
+    }
+
+    print(f"{'scenario':<22} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'queries':>8} {'failed':>7}")
+    for name in args.scenario or SCENARIOS:
+        result = run_scenario(env, name, args.requests, args.concurrency, args.warmup)
+        results["scenarios"][name] = result
+        latency = result["latency_ms"]
+        print(f"{name:<22} {result['throughput_rps']:>9.1f} {latency['p50']:>8.2f} "
+              f"{latency['p95']:>8.2f} {latency['p99']:>8.2f} "
+              f"{result['queries_per_request']:>8.2f} {result['failed']:>7}")
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+        print(f"Baseline written to {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, reason in regressions:
+            print(f"REGRESSION {name}: {reason}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
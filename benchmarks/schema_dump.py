@@ -0,0 +1,89 @@
+"""
+Compiled schema dumps (schema_compiler.py) against marshmallow.
+
+A seeded catalog is loaded once with every relationship, then dumped with
+each response schema, and with pruned copies of them like ?fields= and
+?include= build, twice: through marshmallow (compiled path off) and through
+the generated functions, and both are timed. That the two write the same
+JSON is checked by tests/test_schema_dump.py.
+
+Run from the repository root:
+
+    python benchmarks/schema_dump.py
+    python benchmarks/schema_dump.py --items 50000 --repeat 3
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-key-0123456789")
+
+from sqlalchemy.orm import selectinload  # noqa: E402
+
+from app import create_app  # noqa: E402
+from db import db  # noqa: E402
+from models import ItemModel, StoreModel, TagModel  # noqa: E402
+from schema_compiler import schema_compiler  # noqa: E402
+from schemas import ItemSchema, PlainItemSchema, StoreSchema, TagSchema  # noqa: E402
+from seeding import Seeder  # noqa: E402
+
+
+def timed(func, repeat):
+    func()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--tags", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app("sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    with app.app_context():
+        db.create_all()
+        Seeder().seed(stores=args.stores, items=args.items, tags=args.tags,
+                      users=0, blocklisted=0)
+        # everything loaded up front, so only the dumps are timed
+        items = ItemModel.query.options(
+            selectinload(ItemModel.store), selectinload(ItemModel.tags)).all()
+        stores = StoreModel.query.options(
+            selectinload(StoreModel.items), selectinload(StoreModel.tags)).all()
+        tags = TagModel.query.options(
+            selectinload(TagModel.items), selectinload(TagModel.store)).all()
+
+        cases = [
+            ("ItemSchema", ItemSchema(many=True), items),
+            ("ItemSchema ?include=", ItemSchema(many=True, only=("id", "name", "price")), items),
+            ("ItemSchema ?fields[store]=name",
+             ItemSchema(many=True, only=("id", "name", "price", "store.name", "tags.id",
+                                         "tags.name")), items),
+            ("StoreSchema", StoreSchema(many=True), stores),
+            ("TagSchema", TagSchema(many=True), tags),
+            ("PlainItemSchema", PlainItemSchema(many=True), items),
+        ]
+
+        print(f"{'schema':<32} {'rows':>6} {'marshmallow':>12} {'compiled':>10} {'speedup':>8}")
+        for name, schema, obj in cases:
+            schema_compiler.enabled = False
+            reference = timed(lambda: schema.dump(obj), args.repeat)
+            schema_compiler.enabled = True
+            compiled = timed(lambda: schema.dump(obj), args.repeat)
+            print(f"{name:<32} {len(obj):>6} {reference * 1000:>9.1f} ms "
+                  f"{compiled * 1000:>7.1f} ms {reference / compiled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
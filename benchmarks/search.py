@@ -0,0 +1,126 @@
+"""
+Item search: the full-text index (item_search.py) against a LIKE scan.
+
+A catalog of --items items is seeded (descriptions of words drawn from
+seeding.DESCRIPTION_WORDS, some frequent, some rare), then each query below
+is answered both ways and timed:
+
+- fts: the query of GET /item/search, first page of the ranked results
+- like: every word as name LIKE '%word%' OR description LIKE '%word%', first
+  page in id order, the best a search endpoint without an index could do
+
+The LIKE scan can stop early on a frequent word, whose first matches come
+soon in id order, and has to read the whole table for a rare one, or for a
+query matching nothing. The full-text lookup reads the index entries of the
+words only, but ranks every match before returning the best ones (and bm25
+reads the entries of every word of the query to weigh it): its cost grows
+with the number of matches, large for a word found in most items. Both match
+counts are printed: LIKE also matches inside words and does no stemming, so
+the counts may differ a little.
+
+Run from the repository root:
+
+    python benchmarks/search.py                      # 1M items, temporary SQLite file
+    python benchmarks/search.py --items 100000 --repeat 3
+    python benchmarks/search.py --database-url postgresql://...   # scratch database
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-key-0123456789")
+
+from sqlalchemy import and_, func, or_, select  # noqa: E402
+
+from app import create_app  # noqa: E402
+from db import db  # noqa: E402
+from item_search import search_keys, search_query, search_words  # noqa: E402
+from models import ItemModel  # noqa: E402
+from seeding import DESCRIPTION_WORDS, Seeder  # noqa: E402
+
+PAGE_SIZE = 20
+
+# From the most frequent description word to combinations of rare ones
+QUERIES = [
+    DESCRIPTION_WORDS[0],
+    DESCRIPTION_WORDS[10],
+    DESCRIPTION_WORDS[-1],
+    f"{DESCRIPTION_WORDS[3]} {DESCRIPTION_WORDS[20]}",
+    f"{DESCRIPTION_WORDS[-2]} {DESCRIPTION_WORDS[-3]}",
+    "item 424242",
+    "no such words",
+]
+
+
+def like_condition(text_query):
+    return and_(*(or_(ItemModel.name.like(f"%{word}%"), ItemModel.description.like(f"%{word}%"))
+                  for word in search_words(text_query)))
+
+
+def fts_page(text_query):
+    keys = search_keys(text_query)
+    return search_query(text_query).order_by(*keys).limit(PAGE_SIZE).all()
+
+
+def like_page(text_query):
+    return (ItemModel.query.filter(like_condition(text_query))
+            .order_by(ItemModel.id).limit(PAGE_SIZE).all())
+
+
+def fts_count(text_query):
+    return search_query(text_query).order_by(None).count()
+
+
+def like_count(text_query):
+    return db.session.scalar(
+        select(func.count()).select_from(ItemModel).where(like_condition(text_query)))
+
+
+def timed(func, repeat):
+    func()
+    times = []
+    for _ in range(repeat):
+        db.session.expunge_all()  # every run loads its rows, as a request would
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url",
+                        help="Scratch database, emptied and seeded. A temporary SQLite file by default.")
+    parser.add_argument("--stores", type=int, default=100)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--tags", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "search.db")
+    app = create_app(database_url)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        Seeder().seed(stores=args.stores, items=args.items, tags=args.tags,
+                      users=0, blocklisted=0)
+        print(f"Seeded {args.items} items in {time.perf_counter() - started:.1f} s "
+              f"({db.engine.dialect.name}).")
+
+        print(f"{'query':<24} {'fts hits':>9} {'like hits':>10} {'fts':>10} {'like':>10} {'speedup':>8}")
+        for text_query in QUERIES:
+            fts = timed(lambda: fts_page(text_query), args.repeat)
+            like = timed(lambda: like_page(text_query), args.repeat)
+            print(f"{text_query:<24} {fts_count(text_query):>9} {like_count(text_query):>10} "
+                  f"{fts * 1000:>7.2f} ms {like * 1000:>7.2f} ms {like / fts:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
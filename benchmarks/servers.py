@@ -0,0 +1,321 @@
+"""
+Throughput of the two deployments at high concurrency: gunicorn sync workers
+(app:create_app) against uvicorn workers on the async engine (asgi.py).
+
+A database is seeded once, then each server is started on it in turn with
+--workers processes and loaded by an asyncio HTTP client holding
+--concurrency connections open, every connection sending its next request as
+soon as the previous one is answered, for --seconds per scenario:
+
+- item_get: GET /item/<id>, authenticated, a few primary-key reads
+- item_list: GET /item?limit=20, authenticated
+- store_items_tagged: GET /store/<id>/items?tags=..., the tag index once built
+- mixed: one item creation for nine of the reads above
+
+Requests per second, the latency percentiles and the failures are printed
+for each server, and the ratio of the two throughputs. A sync worker is busy
+for the whole request, so it queues what it cannot serve, while the async
+workers overlap the database waits of their requests: the gain grows with
+the database round-trip time, and is small on a local SQLite file, whose
+queries cost no network wait (and whose async driver adds a thread hop per
+statement). Pass --database-url postgresql://... (a scratch database) to
+measure a networked database, or --db-latency-ms to add a simulated round
+trip to every statement of both servers: a sleep, which the async server
+spends serving other requests.
+
+Run from the repository root:
+
+    python benchmarks/servers.py                              # temporary SQLite file
+    python benchmarks/servers.py --concurrency 256 --workers 4 --seconds 20
+    python benchmarks/servers.py --db-latency-ms 2
+    python benchmarks/servers.py --database-url postgresql://... --items 1000000
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-key-0123456789")
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+from sqlalchemy.util.concurrency import in_greenlet  # noqa: E402
+
+from app import create_app  # noqa: E402
+from asgi import create_asgi_app  # noqa: E402
+from async_db import await_  # noqa: E402
+from db import db  # noqa: E402
+from seeding import Seeder  # noqa: E402
+
+BENCH_USER = {"username": "bench-servers", "password": "bench-servers-password"}
+
+# names of the items created by the mixed scenario, unique across the servers
+_new_items = itertools.count()
+
+SERVERS = {
+    "gunicorn": lambda port, workers: [
+        sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers), "benchmarks.servers:gunicorn_app()"],
+    "uvicorn": lambda port, workers: [
+        sys.executable, "-m", "uvicorn", "--factory", "benchmarks.servers:uvicorn_app",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+        "--log-level", "warning", "--no-access-log"],
+}
+
+
+def _simulate_latency():
+    seconds = float(os.environ.get("BENCH_DB_LATENCY_MS", "0")) / 1000
+    if not seconds:
+        return
+
+    def round_trip(*args):
+        if in_greenlet():
+            await_(asyncio.sleep(seconds))
+        else:
+            time.sleep(seconds)
+
+    event.listen(Engine, "before_cursor_execute", round_trip)
+
+
+def gunicorn_app():
+    """app:create_app(), with the simulated database latency."""
+    _simulate_latency()
+    return create_app()
+
+
+def uvicorn_app():
+    """asgi:create_asgi_app(), with the simulated database latency."""
+    _simulate_latency()
+    return create_asgi_app()
+
+
+def _item_get(sizes, rng, auth):
+    return "GET", f"/item/{rng.randint(1, sizes['items'])}", auth, None
+
+
+def _item_list(sizes, rng, auth):
+    return "GET", "/item?limit=20", auth, None
+
+
+def _store_items_tagged(sizes, rng, auth):
+    tags = f"{rng.randint(1, 5)},{rng.randint(6, 12)}"
+    match = rng.choice(("all", "any"))
+    return "GET", f"/store/{rng.randint(1, sizes['stores'])}/items?tags={tags}&match={match}", {}, None
+
+
+def _mixed(sizes, rng, auth):
+    if rng.random() < 0.1:
+        body = {"name": f"bench-servers-{next(_new_items)}", "price": 9.99,
+                "store_id": rng.randint(1, sizes["stores"])}
+        return "POST", "/item", auth, body
+    return rng.choice((_item_get, _item_list, _store_items_tagged))(sizes, rng, auth)
+
+
+SCENARIOS = {
+    "item_get": _item_get,
+    "item_list": _item_list,
+    "store_items_tagged": _store_items_tagged,
+    "mixed": _mixed,
+}
+
+
+async def _request(reader, writer, method, path, headers, body):
+    payload = b"" if body is None else json.dumps(body).encode()
+    head = [f"{method} {path} HTTP/1.1", "Host: bench"]
+    head += [f"{name}: {value}" for name, value in headers.items()]
+    if body is not None:
+        head += ["Content-Type: application/json", f"Content-Length: {len(payload)}"]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("The server closed the connection.")
+    status = int(status_line.split()[1])
+    length, close, chunked = 0, False, False
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection":
+            close = value == "close"
+        elif name == "transfer-encoding":
+            chunked = value == "chunked"
+    if chunked:
+        while (size := int((await reader.readline()).strip(), 16)):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    else:
+        await reader.readexactly(length)
+    return status, close
+
+
+async def _connection(port, build, deadline, latencies, failures):
+    # a gunicorn sync worker closes the connection after each response, a
+    # client keeps it open otherwise
+    connection = None
+    while time.perf_counter() < deadline:
+        method, path, headers, body = build()
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection("127.0.0.1", port)
+            status, close = await _request(*connection, method, path, headers, body)
+        except (OSError, asyncio.IncompleteReadError):
+            failures.append("connection")
+            if connection is not None:
+                connection[1].close()
+            connection = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status >= 400:
+            failures.append(status)
+        if close:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def _load(port, build, concurrency, seconds):
+    latencies, failures = [], []
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(_connection(port, build, deadline, latencies, failures)
+                           for _ in range(concurrency)))
+    return latencies, failures
+
+
+def _wait_until_up(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with status {process.returncode}.")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/store?limit=1", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("The server did not start.")
+
+
+def _login(port):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/login", data=json.dumps(BENCH_USER).encode(),
+        headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)["access_token"]
+
+
+def run_server(name, args, sizes, env):
+    port = args.port
+    log_path = os.path.join(args.log_dir, f"{name}.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(SERVERS[name](port, args.workers), cwd=ROOT, env=env,
+                                   stdout=log, stderr=subprocess.STDOUT)
+    results = {}
+    try:
+        _wait_until_up(port, process)
+        auth = {"Authorization": f"Bearer {_login(port)}"}
+        rng = random.Random(42)
+        for scenario in args.scenario or SCENARIOS:
+            def build(scenario=scenario):
+                return SCENARIOS[scenario](sizes, rng, auth)
+
+            # warm up: connections, the tag index of every worker, the ETag caches
+            asyncio.run(_load(port, build, args.concurrency, min(args.seconds, 3)))
+            latencies, failures = asyncio.run(_load(port, build, args.concurrency, args.seconds))
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+            results[scenario] = {
+                "requests_per_second": len(latencies) / args.seconds,
+                "p50_ms": quantiles[49] * 1000,
+                "p99_ms": quantiles[98] * 1000,
+                "failed": len(failures),
+                # status code (or "connection") -> count
+                "failures": dict(collections.Counter(map(str, failures))),
+            }
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url",
+                        help="Scratch database, emptied and seeded. A temporary SQLite file by default.")
+    parser.add_argument("--stores", type=int, default=100)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--tags", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=2, help="Server processes.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Open client connections.")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db-latency-ms", type=float, default=0,
+                        help="Simulated round trip added to every statement of the servers.")
+    parser.add_argument("--server", action="append", choices=sorted(SERVERS),
+                        help="Server to run, repeatable. Both by default.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run, repeatable. All by default.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    args.log_dir = tempfile.mkdtemp()
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(args.log_dir, "servers.db")
+    sizes = {"stores": args.stores, "items": args.items, "tags": args.tags}
+    app = create_app(database_url)
+    with app.app_context():
+        db.create_all()
+        Seeder().seed(**sizes, users=0, blocklisted=0)
+        print(f"Seeded {args.items} items ({db.engine.dialect.name}).")
+    client = app.test_client()
+    client.post("/register", json=BENCH_USER)
+
+    env = {**os.environ, "DATABASE_URL": database_url,
+           "BENCH_DB_LATENCY_MS": str(args.db_latency_ms)}
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    results = {}
+    for name in args.server or SERVERS:
+        results[name] = run_server(name, args, sizes, env)
+
+    print(f"{args.workers} workers, {args.concurrency} connections, {args.seconds:g} s per scenario, "
+          f"{args.db_latency_ms:g} ms added per statement, "
+          f"server logs in {args.log_dir}")
+    print(f"{'scenario':<20} {'server':<9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    for scenario in args.scenario or SCENARIOS:
+        for name in results:
+            row = results[name][scenario]
+            print(f"{scenario:<20} {name:<9} {row['requests_per_second']:>8.1f} "
+                  f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['failed']:>7}")
+            if row["failed"]:
+                print(f"{'':<20} {'':<9} failures: {row['failures']}")
+        if len(results) == 2:
+            sync, asynchronous = (results[name][scenario]["requests_per_second"]
+                                  for name in ("gunicorn", "uvicorn"))
+            print(f"{'':<20} {'ratio':<9} {asynchronous / sync if sync else 0:>7.2f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Tag-set item queries: the per-worker tag index (tag_index.py) against SQL.
+
+A catalog of --items items is seeded (tags of Zipf distributed popularity),
+the index is built, then each query below asks for the first page of a
+store's items carrying all (or any) of a set of tags, and is answered both
+ways and timed:
+
+- index: TagIndex.lookup(), the ids of the page, without loading the items
+- sql: the query of the SQL fallback, the GROUP BY ... HAVING count(*) of
+  tagged_items() (or its plain IN for "any"), first page of ids
+
+Popular tags are the expensive case for SQL, which reads every link of every
+tag before it can group them, while the index stops after the page. A set of
+popular tags sharing few items costs the index the most: it walks the
+shortest list until the page is full. The build time and the number of
+matches are printed too.
+
+Run from the repository root:
+
+    python benchmarks/tag_index.py                      # 1M items, temporary SQLite file
+    python benchmarks/tag_index.py --items 100000 --repeat 3
+    python benchmarks/tag_index.py --database-url postgresql://...   # scratch database
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-key-0123456789")
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import create_app  # noqa: E402
+from db import db  # noqa: E402
+from models import ItemModel  # noqa: E402
+from seeding import Seeder  # noqa: E402
+from tag_index import tag_index, tagged_items  # noqa: E402
+
+PAGE_SIZE = 20
+STORE_ID = 1
+
+# (tags, match), from the most popular tags to rare ones
+QUERIES = [
+    ((1, 2), True),
+    ((1, 2, 3), True),
+    ((1, 50), True),
+    ((100, 200), True),
+    ((1, 2), False),
+    ((1, 2, 3, 4, 5), False),
+    ((500, 600, 700), False),
+]
+
+
+def sql_query(tags, match_all):
+    return (select(ItemModel.id)
+            .where(ItemModel.store_id == STORE_ID, ItemModel.id.in_(tagged_items(tags, match_all)))
+            .order_by(ItemModel.id))
+
+
+def sql_page(tags, match_all):
+    return db.session.scalars(sql_query(tags, match_all).limit(PAGE_SIZE)).all()
+
+
+def index_page(tags, match_all):
+    return tag_index.lookup(tags, match_all, STORE_ID, limit=PAGE_SIZE)[0]
+
+
+def timed(func, repeat):
+    func()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url",
+                        help="Scratch database, emptied and seeded. A temporary SQLite file by default.")
+    parser.add_argument("--stores", type=int, default=10)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--tags", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "tag_index.db")
+    app = create_app(database_url)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        Seeder().seed(stores=args.stores, items=args.items, tags=args.tags,
+                      users=0, blocklisted=0)
+        print(f"Seeded {args.items} items in {time.perf_counter() - started:.1f} s "
+              f"({db.engine.dialect.name}).")
+
+        started = time.perf_counter()
+        tag_index.lookup([1], True, STORE_ID)
+        while not tag_index.ready:
+            time.sleep(0.01)
+        print(f"Built the tag index in {time.perf_counter() - started:.1f} s.")
+
+        print(f"{'tags':<20} {'match':<6} {'hits':>8} {'index':>10} {'sql':>10} {'speedup':>8}")
+        for tags, match_all in QUERIES:
+            index_ids = index_page(tags, match_all)
+            assert index_ids == sql_page(tags, match_all), tags
+            hits = db.session.scalar(select(func.count()).select_from(
+                sql_query(tags, match_all).subquery()))
+            index = timed(lambda: index_page(tags, match_all), args.repeat)
+            sql = timed(lambda: sql_page(tags, match_all), args.repeat)
+            print(f"{','.join(map(str, tags)):<20} {('any', 'all')[match_all]:<6} {hits:>8} "
+                  f"{index * 1000:>7.2f} ms {sql * 1000:>7.2f} ms {sql / index:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
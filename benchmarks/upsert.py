@@ -0,0 +1,156 @@
+"""
+Concurrent writers: read-then-write PUT vs single-statement upsert.
+
+Each writer thread writes the same range of item ids in a shuffled order, so
+writers keep colliding on the same rows. Three strategies are compared:
+
+- read_then_write: the former PUT /item/<id> body, a SELECT by id then an
+  INSERT or UPDATE through the ORM. Two writers creating the same id race and
+  one of them fails with an IntegrityError.
+- upsert: INSERT ... ON CONFLICT (id) DO UPDATE, one statement per item.
+- bulk_upsert: the same statement for a batch of items (PUT /item/bulk).
+
+Run from the repository root:
+
+    python benchmarks/upsert.py --writers 8 --items 2000
+    python benchmarks/upsert.py --database-url postgresql://...
+
+The tables are created if missing and the items table is emptied before each
+strategy, so point it at a scratch database.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-key-0123456789")
+
+from sqlalchemy import delete  # noqa: E402
+from sqlalchemy.exc import IntegrityError, OperationalError  # noqa: E402
+
+from app import create_app  # noqa: E402
+from db import db, dialect_insert  # noqa: E402
+from models import ItemModel, ItemsTags, StoreModel  # noqa: E402
+
+
+def read_then_write(rows, done):
+    for row in rows:
+        item = db.session.get(ItemModel, row["id"])
+        if item:
+            item.name = row["name"]
+            item.price = row["price"]
+        else:
+            item = ItemModel(**row)
+        db.session.add(item)
+        db.session.commit()
+        done.append(1)
+
+
+def upsert(rows, done):
+    statement = dialect_insert(ItemModel.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["id"],
+        set_={name: statement.excluded[name] for name in ("name", "price", "store_id")},
+    )
+    for row in rows:
+        db.session.execute(statement, [row])
+        db.session.commit()
+        done.append(1)
+
+
+def bulk_upsert(rows, done, batch_size=500):
+    statement = dialect_insert(ItemModel.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["id"],
+        set_={name: statement.excluded[name] for name in ("name", "price", "store_id")},
+    )
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(statement, rows[start:start + batch_size])
+        db.session.commit()
+        done.extend(rows[start:start + batch_size])
+
+
+STRATEGIES = {
+    "read_then_write": read_then_write,
+    "upsert": upsert,
+    "bulk_upsert": bulk_upsert,
+}
+
+
+def writer(app, strategy, rows, done, errors):
+    with app.app_context():
+        try:
+            strategy(rows, done)
+        except (IntegrityError, OperationalError) as e:
+            db.session.rollback()
+            errors.append(type(e).__name__)
+
+
+def run(app, name, writers, items, store_id):
+    with app.app_context():
+        db.session.execute(delete(ItemsTags))
+        db.session.execute(delete(ItemModel))
+        db.session.commit()
+
+    threads, done, errors = [], [], []
+    for number in range(writers):
+        # the item name depends on the id only, so every writer agrees on it
+        rows = [{"id": i, "name": f"item-{i}", "price": float(number), "store_id": store_id}
+                for i in range(1, items + 1)]
+        random.Random(number).shuffle(rows)
+        threads.append(threading.Thread(
+            target=writer, args=(app, STRATEGIES[name], rows, done, errors)))
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "strategy": name,
+        "seconds": elapsed,
+        "writes_per_second": len(done) / elapsed,
+        # a failed writer abandons the rest of its rows
+        "failed_writers": len(errors),
+        "lost_writes": writers * items - len(done),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--items", type=int, default=1000)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = create_app(database_url)
+    with app.app_context():
+        db.create_all()
+        store = StoreModel.query.filter_by(name="benchmark").first()
+        if store is None:
+            store = StoreModel(name="benchmark")
+            db.session.add(store)
+            db.session.commit()
+        store_id = store.id
+
+    print(f"{args.writers} writers x {args.items} items on {database_url.split(':')[0]}")
+    print(f"{'strategy':<16} {'seconds':>8} {'writes/s':>10} {'failed writers':>15} {'lost writes':>12}")
+    for name in STRATEGIES:
+        result = run(app, name, args.writers, args.items, store_id)
+        print(f"{result['strategy']:<16} {result['seconds']:>8.2f} "
+              f"{result['writes_per_second']:>10.0f} {result['failed_writers']:>15} "
+              f"{result['lost_writes']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Per-worker revocation cache in front of the jwt_blocklist table.
+
+Every protected request asks whether its token was revoked. Instead of one
+SELECT per request, each worker keeps:
+
+- a bounded LRU of jtis known to be revoked (positive entries),
+- a bounded LRU of jtis known not to be revoked (negative entries),
+- optionally, a Bloom filter over every revoked jti, which answers
+  "definitely not revoked" without any lookup.
+
+Writers (logout, refresh) bump the "jwt_blocklist" change counter in the same
+transaction as the insert and stamp the row with the new value. Workers poll
+the counter at most every JWT_BLOCKLIST_CACHE_POLL_SECONDS and pull only the
+rows newer than the version they have seen, so the cache stays coherent
+across gunicorn workers. A token revoked in another worker may therefore be
+accepted for up to one poll interval; set the interval to 0 to read the
+counter on every request.
+"""
+
+import time
+
+from sqlalchemy import delete, func, select
+
+from async_db import Lock
+from cache import BloomFilter, LRUCache
+from db import db
+from metrics import BLOCKLIST_LOOKUPS
+from models import ChangeCounterModel, JWTBlocklist
+
+BLOCKLIST_COUNTER = "jwt_blocklist"
+
+
+class RevocationCache:
+    """Answers "is this jti revoked?" from memory whenever it safely can."""
+
+    def __init__(self):
+        self.enabled = True
+        self.poll_seconds = 1.0
+        self.bloom_capacity = 0
+        self.bloom_error_rate = 0.01
+        self._lock = Lock()  # held across the sync queries
+        self.reset(cache_size=10000)
+
+    def init_app(self, app):
+        """Reads the cache settings from the Flask config and starts from a cold cache."""
+        self.enabled = app.config.setdefault("JWT_BLOCKLIST_CACHE_ENABLED", True)
+        self.poll_seconds = app.config.setdefault(
+            "JWT_BLOCKLIST_CACHE_POLL_SECONDS", 1.0)
+        self.bloom_capacity = app.config.setdefault(
+            "JWT_BLOCKLIST_BLOOM_CAPACITY", 0)  # 0 disables the Bloom filter
+        self.bloom_error_rate = app.config.setdefault(
+            "JWT_BLOCKLIST_BLOOM_ERROR_RATE", 0.01)
+        self.reset(app.config.setdefault("JWT_BLOCKLIST_CACHE_SIZE", 10000))
+
+    def reset(self, cache_size):
+        self._revoked = LRUCache(cache_size)
+        self._not_revoked = LRUCache(cache_size)
+        self._bloom = None
+        self._seen_version = None  # None until the first sync
+        self._last_poll = 0.0
+        self._revocations = 0  # bumped by every mark_revoked()
+        self._stats = {
+            "positive_hits": 0,
+            "negative_hits": 0,
+            "bloom_hits": 0,
+            "misses": 0,
+            "syncs": 0,
+        }
+
+    def is_revoked(self, jti):
+        """Returns True if the jti is in the blocklist."""
+        if not self.enabled:
+            return self._lookup(jti)
+
+        self._maybe_sync()
+
+        if jti in self._revoked:
+            self._count("positive_hits")
+            return True
+        if self._bloom is not None and not self._bloom.might_contain(jti):
+            self._count("bloom_hits")
+            return False
+        if jti in self._not_revoked:
+            self._count("negative_hits")
+            return False
+
+        self._count("misses")
+        revocations = self._revocations
+        revoked = self._lookup(jti)
+        if revoked:
+            self._revoked.set(jti, True)
+            return True
+        self._not_revoked.set(jti, True)
+        # a sync or a logout of another thread may have revoked the jti since
+        # the lookup started (or its snapshot was taken): drop the entry then,
+        # mark_revoked() cannot have dropped it before it was set
+        if self._revocations != revocations or jti in self._revoked:
+            self._not_revoked.discard(jti)
+        return False
+
+    def _count(self, result):
+        self._stats[result] += 1
+        BLOCKLIST_LOOKUPS.labels(result).inc()
+
+    def mark_revoked(self, jti):
+        """Records a revocation made by this worker, visible to it immediately."""
+        self._revocations += 1
+        self._not_revoked.discard(jti)
+        self._revoked.set(jti, True)
+        if self._bloom is not None:
+            self._bloom.add(jti)
+
+    def stats(self):
+        """Returns this worker's hit/miss counters and hit rate."""
+        stats = dict(self._stats)
+        hits = stats["positive_hits"] + stats["negative_hits"] + stats["bloom_hits"]
+        lookups = hits + stats["misses"]
+        stats["lookups"] = lookups
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["seen_version"] = self._seen_version
+        stats["cached_revoked"] = len(self._revoked)
+        stats["cached_not_revoked"] = len(self._not_revoked)
+        stats["bloom_keys"] = self._bloom.count if self._bloom is not None else None
+        return stats
+
+    @staticmethod
+    def _lookup(jti):
+        # find the jti in blocklist table
+        return db.session.get(JWTBlocklist, jti) is not None
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if self._seen_version is not None and now - self._last_poll < self.poll_seconds:
+            return
+        with self._lock:
+            if self._seen_version is not None and now - self._last_poll < self.poll_seconds:
+                return  # another thread synced while we waited
+            self._sync()
+            self._last_poll = now
+
+    def _sync(self):
+        version = ChangeCounterModel.current(BLOCKLIST_COUNTER)
+        self._stats["syncs"] += 1
+
+        if self._seen_version is not None and version != self._seen_version:
+            # pull just the revocations committed since the last sync, which
+            # also drops them from the negative entries
+            new_jtis = db.session.execute(
+                select(JWTBlocklist.jti).where(JWTBlocklist.version > self._seen_version)
+            ).scalars()
+            for jti in new_jtis:
+                self.mark_revoked(jti)
+
+        if self._seen_version is None or (self._bloom is not None and self._bloom.saturated):
+            # cold start (or an overfilled filter): rebuild the filter from the whole table
+            if self.bloom_capacity:
+                self._rebuild_bloom()
+        self._seen_version = version
+
+    def _rebuild_bloom(self):
+        rows = db.session.scalar(select(func.count()).select_from(JWTBlocklist))
+        # room for as many revocations again, so the filter is not saturated as soon as built
+        bloom = BloomFilter(max(self.bloom_capacity, 2 * rows), self.bloom_error_rate)
+        for jti in db.session.execute(select(JWTBlocklist.jti)).scalars():
+            bloom.add(jti)
+        self._bloom = bloom
+
+
+revocation_cache = RevocationCache()
+
+
+def add_to_blocklist(jti, exp):
+    """Adds a jti to the blocklist and commits.
+
+    The change counter is bumped in the same transaction so other workers
+    pick up the revocation on their next poll. ``exp`` is the token's expiry
+    claim, used by prune_expired() to reclaim the row later.
+    """
+    version = ChangeCounterModel.bump(BLOCKLIST_COUNTER)
+    db.session.add(JWTBlocklist(jti=jti, version=version, exp=exp))
+    db.session.commit()
+    revocation_cache.mark_revoked(jti)
+
+
+def prune_expired(batch_size=1000, include_legacy=False, now=None):
+    """Deletes blocklist rows whose token has expired, one bounded batch per transaction.
+
+    Small batches keep each DELETE short so it never holds locks long enough
+    to stall logout or refresh. Rows written before the ``exp`` column existed
+    have no expiry; they are only removed when ``include_legacy`` is set, which
+    is safe once the longest token lifetime has passed since the upgrade.
+
+    Returns the number of rows deleted.
+    """
+    now = int(time.time()) if now is None else now
+    expired = JWTBlocklist.exp < now
+    if include_legacy:
+        expired = expired | JWTBlocklist.exp.is_(None)
+
+    deleted = 0
+    while True:
+        batch = db.session.execute(
+            select(JWTBlocklist.jti).where(expired).limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            break
+        db.session.execute(
+            delete(JWTBlocklist).where(JWTBlocklist.jti.in_(batch)))
+        db.session.commit()
+        deleted += len(batch)
+        if len(batch) < batch_size:
+            break
+    return deleted
@@ -0,0 +1,17 @@
+"""
+Project-wide flask-smorest Blueprint.
+
+Resources import Blueprint from here instead of flask_smorest so that the
+features we add on top of flask-smorest (see the mixins) are available on
+every blueprint.
+"""
+
+from flask_smorest import Blueprint as SmorestBlueprint  # type: ignore
+
+from etag_cache import EtagCacheMixin
+from pagination import KeysetPaginationMixin
+from query_shaping import QueryShapingMixin
+
+
+class Blueprint(EtagCacheMixin, QueryShapingMixin, KeysetPaginationMixin, SmorestBlueprint):
+    """flask-smorest Blueprint extended with ETag caching, query shaping and keyset pagination."""
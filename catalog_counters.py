@@ -0,0 +1,171 @@
+"""
+Denormalized catalog counters, kept up to date by database triggers.
+
+stores.item_count, stores.price_sum and stores.tag_count, and tags.item_count
+let GET /store/<id>/summary and the "is this tag still used" check of
+DELETE /tag/<id> read one row instead of counting a store's items or loading
+a tag's item list. The triggers update them on every write path: the ORM,
+the bulk and upsert statements (an ON CONFLICT DO UPDATE that moves an item
+fires the update trigger), the importer, COPY in ``flask seed`` and the
+set-based store deletion. Code in the write paths could not follow the
+upserts, which do not say which rows they inserted, updated or moved.
+
+SQLite gets row-level triggers. PostgreSQL gets statement-level triggers
+reading the transition tables, which apply one UPDATE per statement, grouped
+by parent row: a COPY of a million items updates each store row once, not a
+million times, and leaves no pile of dead store row versions behind.
+
+The triggers always run. CATALOG_COUNTERS_ENABLED chooses whether reads use
+the counters (the default) or aggregate queries. ``flask counters recount``
+recomputes them from the tables, after writes made with triggers disabled.
+
+The triggers are created by the migration, and by db.create_all() through
+the metadata hook below. Note that SQLite loses the triggers of a table
+rebuilt by a batch migration (alter_column, drop_column): such a migration
+of items, tags or items_tags must create them again.
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event, text
+
+from db import db
+
+# child table, foreign key to the parent, parent table, {counter column: value per child row}
+COUNTERS = (
+    ("items", "store_id", "stores", {"item_count": "1", "price_sum": "{row}.price"}),
+    ("tags", "store_id", "stores", {"tag_count": "1"}),
+    ("items_tags", "tag_id", "tags", {"item_count": "1"}),
+)
+
+
+def _counted_columns(counters):
+    """Child columns whose update changes a counter (the foreign key and summed columns)."""
+    return sorted({value.split(".", 1)[1] for value in counters.values() if "." in value})
+
+
+def sqlite_statements():
+    statements = []
+    for child, key, parent, counters in COUNTERS:
+        def apply(row, sign):
+            assignments = ", ".join(f"{column} = {column} {sign} {value.format(row=row)}"
+                                    for column, value in counters.items())
+            return f"    UPDATE {parent} SET {assignments} WHERE id = {row}.{key};\n"
+
+        columns = [key, *_counted_columns(counters)]
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {child}_count_insert AFTER INSERT ON {child}\n"
+            f"BEGIN\n{apply('NEW', '+')}END",
+            f"CREATE TRIGGER IF NOT EXISTS {child}_count_delete AFTER DELETE ON {child}\n"
+            f"BEGIN\n{apply('OLD', '-')}END",
+            f"CREATE TRIGGER IF NOT EXISTS {child}_count_update\n"
+            f"AFTER UPDATE OF {', '.join(columns)} ON {child} WHEN {changed}\n"
+            f"BEGIN\n{apply('OLD', '-')}{apply('NEW', '+')}END",
+        ]
+    return statements
+
+
+def postgresql_statements():
+    statements = []
+    for child, key, parent, counters in COUNTERS:
+        def changes(rows, sign):
+            values = ", ".join(f"{sign}{value.format(row=rows)} AS {column}"
+                               for column, value in counters.items())
+            return f"SELECT {rows}.{key} AS parent_id, {values} FROM {rows}"
+
+        sums = ", ".join(f"sum({column}) AS {column}" for column in counters)
+        assignments = ", ".join(f"{column} = {parent}.{column} + delta.{column}"
+                                for column in counters)
+        nonzero = " OR ".join(f"delta.{column} <> 0" for column in counters)
+
+        def update(*sources):
+            union = "\n                  UNION ALL ".join(sources)
+            return (f"        UPDATE {parent} SET {assignments}\n"
+                    f"        FROM (SELECT parent_id, {sums}\n"
+                    f"              FROM ({union}) AS changes\n"
+                    f"              GROUP BY parent_id) AS delta\n"
+                    f"        WHERE {parent}.id = delta.parent_id AND ({nonzero});\n")
+
+        function = f"{child}_count"
+        statements += [
+            f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+            f"BEGIN\n"
+            f"    IF TG_OP = 'INSERT' THEN\n"
+            f"{update(changes('new_rows', ''))}"
+            f"    ELSIF TG_OP = 'DELETE' THEN\n"
+            f"{update(changes('old_rows', '-'))}"
+            f"    ELSE\n"
+            f"{update(changes('new_rows', ''), changes('old_rows', '-'))}"
+            f"    END IF;\n"
+            f"    RETURN NULL;\n"
+            f"END $$",
+            *(f"DROP TRIGGER IF EXISTS {child}_count_{operation} ON {child}"
+              for operation in ("insert", "delete", "update")),
+            f"CREATE TRIGGER {child}_count_insert AFTER INSERT ON {child}\n"
+            f"REFERENCING NEW TABLE AS new_rows\n"
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()",
+            f"CREATE TRIGGER {child}_count_delete AFTER DELETE ON {child}\n"
+            f"REFERENCING OLD TABLE AS old_rows\n"
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()",
+            # transition tables rule out a column list, unchanged counts are filtered out above
+            f"CREATE TRIGGER {child}_count_update AFTER UPDATE ON {child}\n"
+            f"REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows\n"
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()",
+        ]
+    return statements
+
+
+def trigger_statements(dialect):
+    """Returns the DDL (re)creating the counter triggers on a dialect, empty for unsupported ones."""
+    if dialect == "sqlite":
+        return sqlite_statements()
+    if dialect == "postgresql":
+        return postgresql_statements()
+    return []
+
+
+def drop_trigger_statements(dialect):
+    """Returns the DDL dropping the counter triggers (the trigger functions stay on PostgreSQL)."""
+    suffix = {"sqlite": "", "postgresql": " ON {table}"}.get(dialect)
+    if suffix is None:
+        return []
+    return [f"DROP TRIGGER IF EXISTS {table}_count_{operation}{suffix.format(table=table)}"
+            for table, _, _, _ in COUNTERS for operation in ("insert", "delete", "update")]
+
+
+@contextmanager
+def bulk_load():
+    """Suspends the row-level triggers of SQLite around a bulk load, then recounts.
+
+    Everything happens in the session's transaction, so a failed load rolls the
+    trigger DDL back with it. PostgreSQL's statement-level triggers are cheap
+    enough for bulk loads and stay on.
+    """
+    if db.engine.dialect.name != "sqlite":
+        yield
+        return
+    for statement in drop_trigger_statements("sqlite"):
+        db.session.execute(text(statement))
+    yield
+    for statement in trigger_statements("sqlite"):
+        db.session.execute(text(statement))
+    recount()
+
+
+def recount():
+    """Recomputes every counter from the tables. Commit afterwards."""
+    for child, key, parent, counters in COUNTERS:
+        assignments = ", ".join(
+            f"{column} = (SELECT COALESCE(SUM({value.format(row=child)}), 0) FROM {child} "
+            f"WHERE {child}.{key} = {parent}.id)"
+            for column, value in counters.items())
+        db.session.execute(text(f"UPDATE {parent} SET {assignments}"))
+
+
+@event.listens_for(db.metadata, "after_create")
+def _create_triggers(metadata, connection, **kwargs):
+    # db.create_all() (benchmarks, scratch databases) gets the triggers the migration creates
+    if all(table in metadata.tables for table in ("stores", "tags", "items", "items_tags")):
+        for statement in trigger_statements(connection.dialect.name):
+            connection.exec_driver_sql(statement)
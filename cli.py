@@ -0,0 +1,160 @@
+"""
+Flask CLI commands for maintenance tasks, registered on the app in create_app().
+Run them with the flask command, e.g. `flask blocklist prune`.
+"""
+
+import os
+
+import click
+from flask.cli import AppGroup
+
+from blocklist import prune_expired
+from catalog_counters import recount
+from db import db
+from export import EXPORT_FORMATS, iter_export
+from importer import IMPORT_FORMATS, ItemImporter, iter_records
+from seeding import Seeder
+from tag_index import prune as prune_tag_index
+
+blocklist_cli = AppGroup("blocklist", help="Maintain the JWT blocklist table.")
+
+
+@blocklist_cli.command("prune")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Rows deleted per transaction.")
+@click.option("--include-legacy", is_flag=True,
+              help="Also delete rows stored before token expiry was recorded.")
+def prune_blocklist(batch_size, include_legacy):
+    """Deletes blocklist entries whose token has already expired."""
+    deleted = prune_expired(batch_size=batch_size,
+                            include_legacy=include_legacy)
+    click.echo(f"Pruned {deleted} expired blocklist entries.")
+
+
+counters_cli = AppGroup("counters", help="Maintain the denormalized catalog counters.")
+
+
+@counters_cli.command("recount")
+def recount_counters():
+    """Recomputes the store and tag counters from the catalog tables."""
+    recount()
+    db.session.commit()
+    click.echo("Catalog counters recomputed.")
+
+
+tag_index_cli = AppGroup("tag-index", help="Maintain the change log of the tag index.")
+
+
+@tag_index_cli.command("prune")
+@click.option("--keep", default=100000, show_default=True, type=click.IntRange(min=0),
+              help="Most recent changes kept; a worker further behind rebuilds its index.")
+def prune_tag_index_log(keep):
+    """Deletes the old rows of the tag index change log."""
+    deleted = prune_tag_index(keep)
+    click.echo(f"Pruned {deleted} tag index changes.")
+
+
+@click.command("export")
+@click.option("--format", "export_format", type=click.Choice(list(EXPORT_FORMATS)),
+              default="ndjson", show_default=True)
+@click.option("--chunk-size", default=1000, show_default=True,
+              help="Rows fetched from the database cursor at a time.")
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-",
+              help="File to write to, standard output by default.")
+def export_items(export_format, chunk_size, output):
+    """Streams the item catalog, with store and tag names, as NDJSON or CSV."""
+    for chunk in iter_export(export_format, chunk_size):
+        output.write(chunk)
+
+
+def _read_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as checkpoint:
+        return int(checkpoint.read().strip() or 0)
+
+
+def _write_checkpoint(path, committed):
+    # write then rename, so a crash never leaves a truncated checkpoint behind
+    with open(path + ".tmp", "w", encoding="utf-8") as checkpoint:
+        checkpoint.write(str(committed))
+    os.replace(path + ".tmp", path)
+
+
+@click.command("import")
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "import_format", type=click.Choice(IMPORT_FORMATS),
+              help="Input format, guessed from the file extension by default.")
+@click.option("--commit-size", default=5000, show_default=True,
+              help="Records inserted per transaction.")
+@click.option("--skip", default=0, show_default=True,
+              help="Resume after this many records (the committed count of a failed run).")
+@click.option("--checkpoint", type=click.Path(dir_okay=False),
+              help="File recording the committed count; an existing one resumes from it.")
+def import_items(source, import_format, commit_size, skip, checkpoint):
+    """Loads items, creating their stores and tags by name, from NDJSON or CSV.
+
+    Records whose item name already exists are skipped, so a failed import
+    can also simply be run again from the start.
+    """
+    if import_format is None:
+        import_format = "csv" if source.name.lower().endswith(".csv") else "ndjson"
+    skip = max(skip, _read_checkpoint(checkpoint))
+    if skip:
+        click.echo(f"Resuming after {skip} records.", err=True)
+
+    def report(summary):
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, summary.committed)
+        click.echo(
+            f"{summary.committed} records: {summary.inserted} inserted, "
+            f"{summary.duplicates} duplicates, {summary.invalid} invalid "
+            f"({summary.rate:.0f} records/s)",
+            err=True,
+        )
+
+    importer = ItemImporter(commit_size=commit_size, on_progress=report)
+    try:
+        summary = importer.run(iter_records(source, import_format), skip=skip)
+    except Exception:
+        committed = importer.summary.committed
+        click.echo(f"Import failed after {committed} committed records, "
+                   f"resume with --skip {committed}.", err=True)
+        raise
+
+    for error in summary.errors:
+        click.echo(f"record {error['record']}: {error['errors']}", err=True)
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    click.echo(f"Imported {summary.inserted} items from {summary.records} records "
+               f"({summary.rate:.0f} records/s).")
+
+
+@click.command("seed")
+@click.option("--stores", default=1000, show_default=True, type=click.IntRange(min=1))
+@click.option("--items", default=100000, show_default=True, type=click.IntRange(min=0))
+@click.option("--tags", default=5000, show_default=True, type=click.IntRange(min=0))
+@click.option("--tags-per-item", default=3.0, show_default=True,
+              help="Mean number of tags per item.")
+@click.option("--store-skew", default=1.0, show_default=True,
+              help="Zipf exponent of the items per store, 0 for uniform.")
+@click.option("--tag-skew", default=1.1, show_default=True,
+              help="Zipf exponent of the tag popularity, 0 for uniform.")
+@click.option("--users", default=1000, show_default=True, type=click.IntRange(min=0))
+@click.option("--blocklisted", default=10000, show_default=True, type=click.IntRange(min=0),
+              help="Revoked token ids in the JWT blocklist.")
+@click.option("--expired-ratio", default=0.5, show_default=True,
+              type=click.FloatRange(0, 1), help="Share of blocklisted tokens already expired.")
+@click.option("--seed", default=42, show_default=True,
+              help="Random seed, the same seed always generates the same data.")
+@click.confirmation_option(
+    prompt="This replaces every store, item, tag, user and blocklist row. Continue?")
+def seed_data(seed, **sizes):
+    """Fills the database with a deterministic synthetic dataset for scale testing."""
+
+    def report(table, written, seconds):
+        click.echo(f"{table}: {written} rows ({written / seconds if seconds else 0:.0f} rows/s)",
+                   err=True)
+
+    counts = Seeder(seed=seed, on_progress=report).seed(**sizes)
+    click.echo(", ".join(f"{count} {table}" for table, count in counts.items()))
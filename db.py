@@ -1,3 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
 
-db = SQLAlchemy()  # init SQLAlchemy instance
+from async_db import Session
+
+# init SQLAlchemy instance, its session runs on the async engine under the ASGI server (see async_db.py)
+db = SQLAlchemy(session_options={"class_": Session})
+
+
+def dialect_insert(target):
+    """Returns an INSERT construct for the current database that supports ON CONFLICT.
+
+    PostgreSQL and SQLite both implement INSERT ... ON CONFLICT, but SQLAlchemy
+    exposes it through dialect specific insert() functions.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(target)
+    if dialect == "sqlite":
+        return sqlite.insert(target)
+    raise NotImplementedError(f"ON CONFLICT is not supported on {dialect}.")
@@ -6,6 +6,26 @@
 # migration scripts before starting the application.
 flask db upgrade
 
+# Reclaim blocklist rows of tokens that have expired since the last start.
+# Expired tokens are rejected before the blocklist is checked, so these rows are dead weight.
+flask blocklist prune
+
+# Trim the change log of the tag index (see tag_index.py), which the triggers grow on
+# every item and tag link write. Only a worker further behind than the kept changes,
+# in another container, pays for it: it rebuilds its index.
+flask tag-index prune
+
+# Let every Gunicorn worker write its metrics to shared mmap files, which /metrics
+# sums over all workers (see metrics.py). Start from an empty directory each time.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# APP_SERVER=uvicorn serves the API from asyncio workers on an async engine (see asgi.py)
+if [ "${APP_SERVER:-gunicorn}" = "uvicorn" ]; then
+    exec uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 80 --workers "${WEB_CONCURRENCY:-1}"
+fi
+
 # Start the Gunicorn web server to serve the Flask application.
 # 'exec' replaces the current shell process with the Gunicorn process,
 # which is good practice for a container's main process.
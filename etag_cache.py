@@ -0,0 +1,142 @@
+"""
+Conditional GET fast path on top of flask-smorest's ETag support.
+
+flask-smorest computes a strong ETag by hashing the dumped response, answers
+``If-None-Match`` with 304 and enforces ``If-Match`` on PUT/DELETE. That
+still costs the DB read and the dump on every request. Here each worker also
+remembers the ETag it last served for a URL, tagged with the value of the
+"catalog" change counter at that time. Every write path in resources/ bumps
+that counter (touch_catalog), so while it is unchanged a matching
+``If-None-Match`` is answered with 304 before the view runs at all.
+
+The counter is read at most every ETAG_VERSION_POLL_SECONDS, so after a write
+made in another worker a client may get a stale 304 for up to that long; set
+it to 0 to read the counter (one primary-key lookup) on every conditional GET.
+"""
+
+import time
+from functools import wraps
+
+from flask import request
+from flask_smorest.etag import _get_etag_ctx  # type: ignore
+from flask_smorest.exceptions import (NotModified,  # type: ignore
+                                      PreconditionFailed)
+
+from async_db import Lock
+from cache import LRUCache
+from models import ChangeCounterModel
+
+CATALOG_COUNTER = "catalog"
+
+
+class CatalogVersion:
+    """This worker's view of the catalog change counter."""
+
+    def __init__(self):
+        self.poll_seconds = 1.0
+        self._value = None
+        self._last_poll = 0.0
+        self._lock = Lock()  # held across the counter read
+
+    def init_app(self, app):
+        self.poll_seconds = app.config.setdefault("ETAG_VERSION_POLL_SECONDS", 1.0)
+        self._value = None
+
+    def current(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._value is None or now - self._last_poll >= self.poll_seconds:
+                self._value = ChangeCounterModel.current(CATALOG_COUNTER)
+                self._last_poll = now
+            return self._value
+
+    def invalidate(self):
+        """Forces the next call to current() to read the counter again."""
+        with self._lock:
+            self._value = None
+
+
+catalog_version = CatalogVersion()
+# request URL -> (etag, catalog version it was computed at)
+served_etags = LRUCache(10000)
+
+
+def init_app(app):
+    """Reads the ETag cache settings and starts with an empty cache."""
+    global served_etags
+    catalog_version.init_app(app)
+    served_etags = LRUCache(app.config.setdefault("ETAG_CACHE_SIZE", 10000))
+
+
+def touch_catalog():
+    """Marks the catalog as changed. Call it before committing any item/store/tag write.
+
+    The counter is bumped in the caller's transaction; this worker re-reads it
+    on its next conditional GET, other workers within the poll interval.
+    """
+    ChangeCounterModel.bump(CATALOG_COUNTER)
+    catalog_version.invalidate()
+
+
+class EtagCacheMixin:
+    """Extend flask-smorest's ETag feature with the per-worker 304 fast path"""
+
+    def etag(self, obj):
+        """flask-smorest ``etag`` decorator that can answer 304 without running the view
+
+        Place it below authentication decorators so that the fast path never
+        answers unauthenticated requests.
+        """
+        smorest_decorator = super().etag
+
+        def decorator(func):
+            etag_func = smorest_decorator(func)
+
+            @wraps(etag_func)
+            def wrapper(*args, **kwargs):
+                if (not self._is_etag_enabled()
+                        or request.method not in self.METHODS_CHECKING_NOT_MODIFIED):
+                    return etag_func(*args, **kwargs)
+
+                key = request.full_path
+                # read before the view runs, so a write racing with it leaves a stale version behind
+                version = catalog_version.current()
+                if request.if_none_match:
+                    cached = served_etags.get(key)
+                    if cached is not None and cached[1] == version and cached[0] in request.if_none_match:
+                        raise NotModified
+
+                try:
+                    resp = etag_func(*args, **kwargs)
+                except NotModified:
+                    served_etags.set(key, (_get_etag_ctx()["computed"], version))
+                    raise
+                if resp.status_code == 200 and resp.get_etag()[0]:
+                    served_etags.set(key, (resp.get_etag()[0], version))
+                return resp
+
+            return wrapper
+
+        return self._decorate_view_func_or_method_view(decorator, obj)
+
+    def _check_not_modified(self, etag):
+        # remember the computed ETag, the fast path caches it even when a 304 is raised
+        _get_etag_ctx()["computed"] = etag
+        super()._check_not_modified(etag)
+
+    def _check_precondition(self):
+        # "If-None-Match: *" on PUT means "create only", it replaces If-Match there
+        if request.method == "PUT" and request.if_none_match.star_tag:
+            return
+        super()._check_precondition()
+
+    def check_etag_absent(self):
+        """Checks a PUT that creates a resource was sent with "If-None-Match: *"
+
+        Raise 412 otherwise. Must be called from resource code instead of
+        ``check_etag`` when there is no current representation to compare.
+        """
+        if self._is_etag_enabled():
+            _get_etag_ctx()["etag_checked"] = True
+            if not request.if_none_match.star_tag:
+                raise PreconditionFailed
@@ -0,0 +1,85 @@
+"""
+Streaming export of the item catalog as NDJSON or CSV.
+
+Rows are read through a server-side cursor (stream_results + yield_per) in
+fixed-size chunks, and the tag names of each chunk are fetched with one extra
+query. Every chunk is encoded and handed to the caller before the next one
+is read, so memory use is bounded by the chunk size and the first bytes go
+out as soon as the first chunk is read, however big the catalog is.
+"""
+
+import csv
+import io
+from itertools import groupby
+
+from sqlalchemy import select
+
+from db import db
+from json_provider import dumps_compact
+from models import ItemModel, ItemsTags, StoreModel, TagModel
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CSV_COLUMNS = ["id", "name", "description", "price", "store_id", "store_name", "tags"]
+# separator of the tag names inside the CSV 'tags' column
+CSV_TAG_SEPARATOR = "|"
+
+
+def iter_item_chunks(chunk_size=1000):
+    """Yields lists of item rows (dicts) with their store name and tag names, in id order."""
+    rows = db.session.execute(
+        select(
+            ItemModel.id,
+            ItemModel.name,
+            ItemModel.description,
+            ItemModel.price,
+            ItemModel.store_id,
+            StoreModel.name.label("store_name"),
+        )
+        .join(StoreModel, StoreModel.id == ItemModel.store_id)
+        .order_by(ItemModel.id)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    for partition in rows.partitions():
+        items = [dict(row._mapping, tags=[]) for row in partition]
+        by_id = {item["id"]: item for item in items}
+        tag_rows = db.session.execute(
+            select(ItemsTags.item_id, TagModel.name)
+            .join(TagModel, TagModel.id == ItemsTags.tag_id)
+            .where(ItemsTags.item_id.in_(by_id))
+            .order_by(ItemsTags.item_id, TagModel.name)
+        )
+        for item_id, group in groupby(tag_rows, key=lambda row: row.item_id):
+            by_id[item_id]["tags"] = [row.name for row in group]
+        yield items
+
+
+def iter_ndjson(chunks):
+    """Encodes chunks of rows as newline delimited JSON, one string per chunk."""
+    for items in chunks:
+        yield "".join(dumps_compact(item) + "\n" for item in items)
+
+
+def iter_csv(chunks):
+    """Encodes chunks of rows as CSV with a header line, one string per chunk."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for items in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        for item in items:
+            writer.writerow(dict(item, tags=CSV_TAG_SEPARATOR.join(item["tags"])))
+        yield buffer.getvalue()
+
+
+def iter_export(export_format, chunk_size=1000):
+    """Returns the encoded export stream for one of EXPORT_FORMATS."""
+    chunks = iter_item_chunks(chunk_size)
+    if export_format == "csv":
+        return iter_csv(chunks)
+    return iter_ndjson(chunks)
@@ -0,0 +1,7 @@
+# Gunicorn settings, loaded automatically from the working directory.
+from prometheus_client import multiprocess  # type: ignore
+
+
+def child_exit(server, worker):
+    # prometheus_client's multiprocess cleanup for the metric files of a dead worker
+    multiprocess.mark_process_dead(worker.pid)
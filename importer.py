@@ -0,0 +1,245 @@
+"""
+Streaming bulk import of items (with their stores and tags) from NDJSON or CSV.
+
+The input is parsed record by record and written in chunks of
+``commit_size`` records, one transaction per chunk, so memory use is bounded
+by the chunk size whatever the size of the file. The accepted records look
+like the rows produced by export.py:
+
+    {"name": "chair", "price": 12.5, "description": "...",
+     "store_name": "Furniture", "tags": ["wood", "indoor"]}
+
+``store_id`` may be given instead of ``store_name``. In CSV files the tags
+column holds the tag names separated by '|'.
+
+Store and tag names are resolved to ids through in-memory lookup tables
+loaded once at the start; unknown stores and tags are created on the fly
+(a new tag belongs to the store of the item that first uses it).
+
+Every insert uses ON CONFLICT DO NOTHING on the unique names, so replaying a
+file, or the tail of a file after a failure, never duplicates anything. The
+number of records committed so far is reported after every chunk, and
+``skip`` resumes after that many records without re-reading the database.
+"""
+
+import csv
+import json
+import time
+from itertools import islice
+
+from marshmallow import ValidationError
+from sqlalchemy import select
+
+from db import db, dialect_insert
+from etag_cache import touch_catalog
+from export import CSV_TAG_SEPARATOR
+from models import ItemModel, ItemsTags, StoreModel, TagModel
+from schemas import ItemImportRecordSchema
+
+IMPORT_FORMATS = ("ndjson", "csv")
+
+# Errors kept in the summary, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def iter_records(stream, import_format):
+    """Parses a text stream lazily into raw record dicts.
+
+    An NDJSON line that is not valid JSON is yielded as a ValidationError, so
+    that it is reported like any other invalid record.
+    """
+    if import_format == "csv":
+        for row in csv.DictReader(stream):
+            # empty CSV cells mean "not given"
+            record = {key: value for key, value in row.items() if value not in ("", None)}
+            if "tags" in record:
+                record["tags"] = record["tags"].split(CSV_TAG_SEPARATOR)
+            yield record
+    else:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield ValidationError({"_schema": [f"Invalid JSON: {e}"]})
+
+
+class ImportSummary:
+    """Counters of an import run, reported after every committed chunk."""
+
+    def __init__(self, skipped_records=0):
+        self.started = time.monotonic()
+        self.records = skipped_records  # records read, including the skipped ones
+        self.committed = skipped_records  # records whose chunk was committed
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return (self.inserted + self.duplicates) / elapsed if elapsed else 0.0
+
+    def add_error(self, record_number, messages):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"record": record_number, "errors": messages})
+
+    def as_dict(self):
+        return {
+            "records": self.records,
+            "committed": self.committed,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "records_per_second": round(self.rate, 1),
+            "errors": self.errors,
+        }
+
+
+class ItemImporter:
+    """Writes parsed records to the items, stores, tags and items_tags tables in chunks."""
+
+    def __init__(self, commit_size=5000, on_progress=None):
+        self.commit_size = commit_size
+        self.on_progress = on_progress
+        self.schema = ItemImportRecordSchema()
+        self._load_lookups()
+
+    def _load_lookups(self):
+        # name -> id lookup tables, loaded once and extended as rows get created
+        self.store_ids = dict(db.session.execute(select(StoreModel.name, StoreModel.id)).all())
+        self.tag_ids = dict(db.session.execute(select(TagModel.name, TagModel.id)).all())
+        self.known_store_ids = set(self.store_ids.values())
+
+    def run(self, records, skip=0):
+        """Imports an iterable of raw records, resuming after ``skip`` records.
+
+        If a chunk fails, the exception propagates and ``self.summary.committed``
+        tells how many records to skip when running again.
+        """
+        summary = self.summary = ImportSummary(skipped_records=skip)
+        records = islice(records, skip, None)
+        while True:
+            chunk = list(islice(records, self.commit_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk, summary)
+            if self.on_progress is not None:
+                self.on_progress(summary)
+        return summary
+
+    def _import_chunk(self, chunk, summary):
+        items = []
+        for raw_record in chunk:
+            summary.records += 1
+            try:
+                if isinstance(raw_record, ValidationError):
+                    raise raw_record
+                record = self.schema.load(raw_record)
+                if "store_id" not in record and "store_name" not in record:
+                    raise ValidationError({"store_name": ["Provide store_name or store_id."]})
+            except ValidationError as e:
+                summary.add_error(summary.records, e.normalized_messages())
+                continue
+            items.append((summary.records, record))
+
+        try:
+            if self.store_ids is None:
+                self._load_lookups()
+            self._resolve_stores(items, summary)
+            self._resolve_tags(items)
+            self._insert_items(items, summary)
+            touch_catalog()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # the lookup tables may reference rows that were rolled back
+            self.store_ids = None
+            raise
+        summary.committed = summary.records
+
+    def _resolve_stores(self, items, summary):
+        missing = {record["store_name"] for _, record in items
+                   if "store_id" not in record and record["store_name"] not in self.store_ids}
+        if missing:
+            db.session.execute(
+                dialect_insert(StoreModel.__table__).on_conflict_do_nothing(
+                    index_elements=["name"]),
+                [{"name": name} for name in sorted(missing)],
+            )
+            created = db.session.execute(
+                select(StoreModel.name, StoreModel.id).where(StoreModel.name.in_(missing))).all()
+            self.store_ids.update(created)
+            self.known_store_ids.update(store_id for _, store_id in created)
+
+        unknown_ids = {record["store_id"] for _, record in items
+                       if "store_id" in record and record["store_id"] not in self.known_store_ids}
+        if unknown_ids:
+            self.known_store_ids.update(db.session.execute(
+                select(StoreModel.id).where(StoreModel.id.in_(unknown_ids))).scalars())
+
+        resolved = []
+        for record_number, record in items:
+            store_id = record["store_id"] if "store_id" in record else self.store_ids[record["store_name"]]
+            if store_id not in self.known_store_ids:
+                summary.add_error(record_number, {"store_id": ["Store not found."]})
+                continue
+            record["store_id"] = store_id
+            resolved.append((record_number, record))
+        items[:] = resolved
+
+    def _resolve_tags(self, items):
+        missing = {}
+        for _, record in items:
+            for tag_name in record["tags"]:
+                if tag_name not in self.tag_ids:
+                    missing.setdefault(tag_name, record["store_id"])
+        if missing:
+            db.session.execute(
+                dialect_insert(TagModel.__table__).on_conflict_do_nothing(
+                    index_elements=["name"]),
+                [{"name": name, "store_id": store_id} for name, store_id in missing.items()],
+            )
+            self.tag_ids.update(db.session.execute(
+                select(TagModel.name, TagModel.id).where(TagModel.name.in_(missing))).all())
+
+    def _insert_items(self, items, summary):
+        if not items:
+            return
+        # the rowcount of an executemany is unreliable (-1 on some drivers),
+        # the rows actually inserted are counted from RETURNING instead
+        result = db.session.execute(
+            dialect_insert(ItemModel.__table__).on_conflict_do_nothing(
+                index_elements=["name"]).returning(ItemModel.__table__.c.id),
+            [
+                {
+                    "name": record["name"],
+                    "price": record["price"],
+                    "description": record.get("description"),
+                    "store_id": record["store_id"],
+                }
+                for _, record in items
+            ],
+        )
+        inserted = len(result.all())
+        summary.inserted += inserted
+        summary.duplicates += len(items) - inserted
+
+        tagged = {record["name"]: record["tags"] for _, record in items if record["tags"]}
+        if tagged:
+            item_ids = db.session.execute(
+                select(ItemModel.name, ItemModel.id).where(ItemModel.name.in_(tagged))).all()
+            links = [
+                {"item_id": item_id, "tag_id": self.tag_ids[tag_name]}
+                for name, item_id in item_ids
+                for tag_name in tagged[name]
+            ]
+            db.session.execute(
+                dialect_insert(ItemsTags.__table__).on_conflict_do_nothing(
+                    index_elements=["item_id", "tag_id"]),
+                links,
+            )
@@ -0,0 +1,81 @@
+"""
+Local background job runner for work too long for a request.
+
+A job is a function run on a small thread pool inside the worker process
+that accepted it, with its own app context and DB session. Its status is
+kept in the jobs table rather than in memory, so GET /job/<id> answers the
+same whichever gunicorn worker the client reaches.
+
+Jobs are not persisted across restarts: one interrupted by a worker restart
+stays "running" for good. Jobs must therefore be safe to submit again, as
+store deletion is.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from db import db
+from models import JobModel
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    """Runs jobs on a per-worker thread pool and records their status in the jobs table."""
+
+    def __init__(self):
+        self.app = None
+        self.workers = 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Reads the pool size from the Flask config. The pool itself starts on first use."""
+        self.app = app
+        self.workers = app.config.setdefault("JOB_RUNNER_WORKERS", 1)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="job")
+            return self._executor
+
+    def submit(self, kind, target_id, func, *args):
+        """Records a queued job and schedules ``func(report, *args)``; returns the job.
+
+        ``report(progress)`` stores the number of rows processed so far. The
+        job row is committed before the function can start, so its id can be
+        handed to the client at once.
+        """
+        job = JobModel(id=uuid.uuid4().hex, kind=kind, target_id=target_id,
+                       status="queued", progress=0, created_at=int(time.time()))
+        db.session.add(job)
+        db.session.commit()
+        self._get_executor().submit(self._run, job.id, func, args)
+        return job
+
+    def _run(self, job_id, func, args):
+        with self.app.app_context():
+            self._update(job_id, status="running")
+            try:
+                func(lambda progress: self._update(job_id, progress=progress), *args)
+            except Exception as e:
+                db.session.rollback()
+                logger.exception("Job %s failed", job_id)
+                self._update(job_id, status="failed", error=str(e),
+                             finished_at=int(time.time()))
+            else:
+                self._update(job_id, status="succeeded",
+                             finished_at=int(time.time()))
+
+    @staticmethod
+    def _update(job_id, **values):
+        db.session.query(JobModel).filter_by(id=job_id).update(values)
+        db.session.commit()
+
+
+job_runner = JobRunner()
@@ -0,0 +1,90 @@
+"""
+Fast JSON encoding of responses, with orjson when it is installed.
+
+Flask encodes JSON through the app's JSON provider (``app.json``): jsonify(),
+and with it flask-smorest's responses, the query shaping and pagination
+mixins and the JWT error handlers in create_app, as well as
+``request.get_json()``. The default provider uses the stdlib json module,
+which on a list of thousands of items costs about as much as the marshmallow
+dump. OrjsonProvider encodes and decodes with orjson instead, and writes
+equivalent JSON: the same separators, sorted keys, RFC 822 dates and the
+same ``default`` hook for the types orjson does not know (Decimal, objects
+with ``__html__``). The text is not always byte for byte the stdlib's:
+non-ASCII characters are written as UTF-8 rather than ``\\u`` escapes, and
+floats may be formatted differently (orjson writes 0.00001 and 1e16 where
+the stdlib writes 1e-05 and 1e+16), the same values either way.
+
+Without orjson, and for the rare values orjson refuses (integers wider than
+64 bits), the stdlib encoder is used, so the decoded output never depends
+on whether the package is installed. Calls that pass stdlib keyword
+arguments, such as flask-smorest's ETag computation with ``sort_keys=True``,
+also keep the stdlib path, so ETags do not change with the provider.
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - the stdlib fallback
+    orjson = None
+
+# orjson leaves datetimes to the default hook, which formats them like Flask does
+_BASE_OPTIONS = 0 if orjson is None else orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def dumps_compact(obj):
+    """Returns the compact JSON text of obj, keys in insertion order (NDJSON lines)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"))
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with the encoding and decoding done by orjson."""
+
+    def _orjson_options(self, indent=False):
+        options = _BASE_OPTIONS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _encode(self, obj, indent=False):
+        """Returns the JSON bytes of obj, or None when orjson cannot encode it."""
+        if orjson is None:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options(indent))
+        except orjson.JSONEncodeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs:
+            encoded = self._encode(obj)
+            if encoded is not None:
+                return encoded.decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                # let the stdlib decide, it accepts NaN and arbitrarily wide integers
+                pass
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        encoded = self._encode(obj, indent)
+        if encoded is None:
+            return super().response(obj)
+        # the body goes out as bytes, without the decode/encode round trip of a str
+        return self._app.response_class(encoded + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,120 @@
+"""
+Prometheus metrics, served in the text format at GET /metrics.
+
+The metric objects are defined here and updated in place by the code they
+describe: the request hooks below, the DB pool, the JWT revocation cache
+(blocklist.py) and the password hashing pool (password_hashing.py).
+
+Under gunicorn every worker is a separate process with its own counters.
+Start the server with PROMETHEUS_MULTIPROC_DIR pointing at an empty
+directory (docker-entrypoint.sh does) and prometheus_client switches to its
+multiprocess mode: each process writes its values to mmap-backed files in
+that directory, and /metrics sums them over all workers, whichever worker
+answers the scrape. gunicorn.conf.py removes the files of dead workers;
+uvicorn (asgi.py) has no such hook, the entrypoint empties the directory on
+start.
+Without the variable (flask run, tests) each process reports its own values.
+"""
+
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,  # type: ignore
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+
+from db import db
+
+# Request metrics, labelled by blueprint ("none" for the app's own routes) and method
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests served.",
+    ["blueprint", "method", "status"])
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time spent serving HTTP requests.",
+    ["blueprint", "method"],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+RESPONSE_BYTES = Histogram(
+    "http_response_size_bytes", "Size of HTTP response bodies, streamed ones excluded.",
+    ["blueprint", "method"],
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000))
+
+# DB connection pool
+POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total", "Connections checked out of the SQLAlchemy pool.")
+POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.",
+    buckets=(.0005, .001, .005, .01, .05, .1, .5, 1, 5, 30))
+
+# JWT revocation cache, see blocklist.py
+BLOCKLIST_LOOKUPS = Counter(
+    "jwt_blocklist_lookups_total", "Revocation checks, by how they were answered.",
+    ["result"])
+
+# Tag-set item queries, see tag_index.py
+TAG_INDEX_LOOKUPS = Counter(
+    "tag_index_lookups_total", "Tag-set item queries, by what answered them (index or sql).",
+    ["source"])
+
+# Password hashing pool, see password_hashing.py
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "CPU time of one password hash or verification.",
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1))
+PASSWORD_HASH_WAIT_SECONDS = Histogram(
+    "password_hash_queue_wait_seconds", "Time a hash waited for a pool process.",
+    buckets=(.001, .005, .01, .05, .1, .25, .5, 1, 5))
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total", "Hashes refused (503) because the pool was saturated.")
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _observe_request(response):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+    blueprint = request.blueprint or "none"
+    REQUESTS.labels(blueprint, request.method, str(response.status_code)).inc()
+    REQUEST_SECONDS.labels(blueprint, request.method).observe(time.perf_counter() - started)
+    if response.content_length is not None:
+        RESPONSE_BYTES.labels(blueprint, request.method).observe(response.content_length)
+    return response
+
+
+def instrument_pool(engine):
+    """Counts the checkouts of an engine's pool and times the waits for a connection."""
+    pool = engine.pool
+    connect = pool.connect
+
+    # the pool has no "before checkout" event, so time the call that waits for one
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    event.listen(pool, "checkout", lambda *args: POOL_CHECKOUTS.inc())
+
+
+def init_app(app):
+    """Hooks the request metrics and the DB pool metrics into the app. Call after db.init_app."""
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_pool(engine)
+
+
+def render():
+    """Returns the /metrics response, summed over every worker in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,38 @@
+"""jwt blocklist change counter
+
+Revision ID: 5c1e7d2f9a41
+Revises: dcfce546b399
+Create Date: 2026-10-17 09:12:44.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7d2f9a41'
+down_revision = 'dcfce546b399'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    change_counters = op.create_table('change_counters',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # seed the counter so the first bump is a plain UPDATE
+    op.bulk_insert(change_counters, [{'name': 'jwt_blocklist', 'value': 0}])
+
+    with op.batch_alter_table('jwt_blocklist', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.BigInteger(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_jwt_blocklist_version'), ['version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('jwt_blocklist', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_jwt_blocklist_version'))
+        batch_op.drop_column('version')
+
+    op.drop_table('change_counters')
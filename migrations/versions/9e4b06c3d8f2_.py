@@ -0,0 +1,28 @@
+"""jwt blocklist token expiry
+
+Revision ID: 9e4b06c3d8f2
+Revises: 5c1e7d2f9a41
+Create Date: 2026-10-17 10:03:27.540112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b06c3d8f2'
+down_revision = '5c1e7d2f9a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('jwt_blocklist', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('exp', sa.BigInteger(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_jwt_blocklist_exp'), ['exp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('jwt_blocklist', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_jwt_blocklist_exp'))
+        batch_op.drop_column('exp')
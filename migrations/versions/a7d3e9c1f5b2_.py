@@ -0,0 +1,219 @@
+"""catalog counters maintained by triggers
+
+Revision ID: a7d3e9c1f5b2
+Revises: f1c4a8e2b6d9
+Create Date: 2026-10-17 17:48:03.514962
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e9c1f5b2'
+down_revision = 'f1c4a8e2b6d9'
+branch_labels = None
+depends_on = None
+
+# Counter triggers as catalog_counters.py created them at this revision. SQLite
+# runs one UPDATE per row, PostgreSQL one grouped UPDATE per statement.
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS items_count_insert AFTER INSERT ON items
+BEGIN
+    UPDATE stores SET item_count = item_count + 1, price_sum = price_sum + NEW.price WHERE id = NEW.store_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_count_delete AFTER DELETE ON items
+BEGIN
+    UPDATE stores SET item_count = item_count - 1, price_sum = price_sum - OLD.price WHERE id = OLD.store_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_count_update
+AFTER UPDATE OF store_id, price ON items WHEN OLD.store_id IS NOT NEW.store_id OR OLD.price IS NOT NEW.price
+BEGIN
+    UPDATE stores SET item_count = item_count - 1, price_sum = price_sum - OLD.price WHERE id = OLD.store_id;
+    UPDATE stores SET item_count = item_count + 1, price_sum = price_sum + NEW.price WHERE id = NEW.store_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tags_count_insert AFTER INSERT ON tags
+BEGIN
+    UPDATE stores SET tag_count = tag_count + 1 WHERE id = NEW.store_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tags_count_delete AFTER DELETE ON tags
+BEGIN
+    UPDATE stores SET tag_count = tag_count - 1 WHERE id = OLD.store_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tags_count_update
+AFTER UPDATE OF store_id ON tags WHEN OLD.store_id IS NOT NEW.store_id
+BEGIN
+    UPDATE stores SET tag_count = tag_count - 1 WHERE id = OLD.store_id;
+    UPDATE stores SET tag_count = tag_count + 1 WHERE id = NEW.store_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_tags_count_insert AFTER INSERT ON items_tags
+BEGIN
+    UPDATE tags SET item_count = item_count + 1 WHERE id = NEW.tag_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_tags_count_delete AFTER DELETE ON items_tags
+BEGIN
+    UPDATE tags SET item_count = item_count - 1 WHERE id = OLD.tag_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_tags_count_update
+AFTER UPDATE OF tag_id ON items_tags WHEN OLD.tag_id IS NOT NEW.tag_id
+BEGIN
+    UPDATE tags SET item_count = item_count - 1 WHERE id = OLD.tag_id;
+    UPDATE tags SET item_count = item_count + 1 WHERE id = NEW.tag_id;
+END""",
+]
+
+POSTGRESQL_TRIGGERS = [
+    """CREATE OR REPLACE FUNCTION items_count() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE stores SET item_count = stores.item_count + delta.item_count, price_sum = stores.price_sum + delta.price_sum
+        FROM (SELECT parent_id, sum(item_count) AS item_count, sum(price_sum) AS price_sum
+              FROM (SELECT new_rows.store_id AS parent_id, 1 AS item_count, new_rows.price AS price_sum FROM new_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE stores.id = delta.parent_id AND (delta.item_count <> 0 OR delta.price_sum <> 0);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE stores SET item_count = stores.item_count + delta.item_count, price_sum = stores.price_sum + delta.price_sum
+        FROM (SELECT parent_id, sum(item_count) AS item_count, sum(price_sum) AS price_sum
+              FROM (SELECT old_rows.store_id AS parent_id, -1 AS item_count, -old_rows.price AS price_sum FROM old_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE stores.id = delta.parent_id AND (delta.item_count <> 0 OR delta.price_sum <> 0);
+    ELSE
+        UPDATE stores SET item_count = stores.item_count + delta.item_count, price_sum = stores.price_sum + delta.price_sum
+        FROM (SELECT parent_id, sum(item_count) AS item_count, sum(price_sum) AS price_sum
+              FROM (SELECT new_rows.store_id AS parent_id, 1 AS item_count, new_rows.price AS price_sum FROM new_rows
+                  UNION ALL SELECT old_rows.store_id AS parent_id, -1 AS item_count, -old_rows.price AS price_sum FROM old_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE stores.id = delta.parent_id AND (delta.item_count <> 0 OR delta.price_sum <> 0);
+    END IF;
+    RETURN NULL;
+END $$""",
+    "DROP TRIGGER IF EXISTS items_count_insert ON items",
+    "DROP TRIGGER IF EXISTS items_count_delete ON items",
+    "DROP TRIGGER IF EXISTS items_count_update ON items",
+    """CREATE TRIGGER items_count_insert AFTER INSERT ON items
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION items_count()""",
+    """CREATE TRIGGER items_count_delete AFTER DELETE ON items
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION items_count()""",
+    """CREATE TRIGGER items_count_update AFTER UPDATE ON items
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION items_count()""",
+    """CREATE OR REPLACE FUNCTION tags_count() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE stores SET tag_count = stores.tag_count + delta.tag_count
+        FROM (SELECT parent_id, sum(tag_count) AS tag_count
+              FROM (SELECT new_rows.store_id AS parent_id, 1 AS tag_count FROM new_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE stores.id = delta.parent_id AND (delta.tag_count <> 0);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE stores SET tag_count = stores.tag_count + delta.tag_count
+        FROM (SELECT parent_id, sum(tag_count) AS tag_count
+              FROM (SELECT old_rows.store_id AS parent_id, -1 AS tag_count FROM old_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE stores.id = delta.parent_id AND (delta.tag_count <> 0);
+    ELSE
+        UPDATE stores SET tag_count = stores.tag_count + delta.tag_count
+        FROM (SELECT parent_id, sum(tag_count) AS tag_count
+              FROM (SELECT new_rows.store_id AS parent_id, 1 AS tag_count FROM new_rows
+                  UNION ALL SELECT old_rows.store_id AS parent_id, -1 AS tag_count FROM old_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE stores.id = delta.parent_id AND (delta.tag_count <> 0);
+    END IF;
+    RETURN NULL;
+END $$""",
+    "DROP TRIGGER IF EXISTS tags_count_insert ON tags",
+    "DROP TRIGGER IF EXISTS tags_count_delete ON tags",
+    "DROP TRIGGER IF EXISTS tags_count_update ON tags",
+    """CREATE TRIGGER tags_count_insert AFTER INSERT ON tags
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tags_count()""",
+    """CREATE TRIGGER tags_count_delete AFTER DELETE ON tags
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tags_count()""",
+    """CREATE TRIGGER tags_count_update AFTER UPDATE ON tags
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tags_count()""",
+    """CREATE OR REPLACE FUNCTION items_tags_count() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE tags SET item_count = tags.item_count + delta.item_count
+        FROM (SELECT parent_id, sum(item_count) AS item_count
+              FROM (SELECT new_rows.tag_id AS parent_id, 1 AS item_count FROM new_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE tags.id = delta.parent_id AND (delta.item_count <> 0);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE tags SET item_count = tags.item_count + delta.item_count
+        FROM (SELECT parent_id, sum(item_count) AS item_count
+              FROM (SELECT old_rows.tag_id AS parent_id, -1 AS item_count FROM old_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE tags.id = delta.parent_id AND (delta.item_count <> 0);
+    ELSE
+        UPDATE tags SET item_count = tags.item_count + delta.item_count
+        FROM (SELECT parent_id, sum(item_count) AS item_count
+              FROM (SELECT new_rows.tag_id AS parent_id, 1 AS item_count FROM new_rows
+                  UNION ALL SELECT old_rows.tag_id AS parent_id, -1 AS item_count FROM old_rows) AS changes
+              GROUP BY parent_id) AS delta
+        WHERE tags.id = delta.parent_id AND (delta.item_count <> 0);
+    END IF;
+    RETURN NULL;
+END $$""",
+    "DROP TRIGGER IF EXISTS items_tags_count_insert ON items_tags",
+    "DROP TRIGGER IF EXISTS items_tags_count_delete ON items_tags",
+    "DROP TRIGGER IF EXISTS items_tags_count_update ON items_tags",
+    """CREATE TRIGGER items_tags_count_insert AFTER INSERT ON items_tags
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION items_tags_count()""",
+    """CREATE TRIGGER items_tags_count_delete AFTER DELETE ON items_tags
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION items_tags_count()""",
+    """CREATE TRIGGER items_tags_count_update AFTER UPDATE ON items_tags
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION items_tags_count()""",
+]
+
+COUNTED_TABLES = ('items', 'tags', 'items_tags')
+
+
+def upgrade():
+    op.add_column('stores', sa.Column('item_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('stores', sa.Column('tag_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('stores', sa.Column('price_sum', sa.Float(), server_default='0', nullable=False))
+    op.add_column('tags', sa.Column('item_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_items_store_id_price', 'items', ['store_id', 'price'], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': SQLITE_TRIGGERS, 'postgresql': POSTGRESQL_TRIGGERS}.get(dialect, []):
+        op.execute(statement)
+    # count the rows already there, the triggers keep the counters from now on
+    op.execute(
+        'UPDATE stores SET '
+        'item_count = (SELECT COUNT(*) FROM items WHERE items.store_id = stores.id), '
+        'price_sum = (SELECT COALESCE(SUM(items.price), 0) FROM items WHERE items.store_id = stores.id), '
+        'tag_count = (SELECT COUNT(*) FROM tags WHERE tags.store_id = stores.id)'
+    )
+    op.execute(
+        'UPDATE tags SET '
+        'item_count = (SELECT COUNT(*) FROM items_tags WHERE items_tags.tag_id = tags.id)'
+    )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in COUNTED_TABLES:
+        for operation in ('insert', 'delete', 'update'):
+            if dialect == 'postgresql':
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_count_{operation} ON {table}')
+            else:
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_count_{operation}')
+        if dialect == 'postgresql':
+            op.execute(f'DROP FUNCTION IF EXISTS {table}_count()')
+
+    op.drop_index('ix_items_store_id_price', table_name='items')
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.drop_column('item_count')
+    with op.batch_alter_table('stores', schema=None) as batch_op:
+        batch_op.drop_column('price_sum')
+        batch_op.drop_column('tag_count')
+        batch_op.drop_column('item_count')
@@ -0,0 +1,31 @@
+"""seed catalog change counter
+
+Revision ID: b27f5a9c14e3
+Revises: 9e4b06c3d8f2
+Create Date: 2026-10-17 11:26:05.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27f5a9c14e3'
+down_revision = '9e4b06c3d8f2'
+branch_labels = None
+depends_on = None
+
+
+change_counters = sa.table('change_counters',
+    sa.column('name', sa.String(length=50)),
+    sa.column('value', sa.BigInteger())
+)
+
+
+def upgrade():
+    # bumped by every item/store/tag write, invalidates the cached ETags
+    op.bulk_insert(change_counters, [{'name': 'catalog', 'value': 0}])
+
+
+def downgrade():
+    op.execute(change_counters.delete().where(change_counters.c.name == 'catalog'))
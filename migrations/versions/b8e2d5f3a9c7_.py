@@ -0,0 +1,26 @@
+"""indexes of the item list filters and sorts
+
+Revision ID: b8e2d5f3a9c7
+Revises: c4f8a2d6e1b3
+Create Date: 2026-10-17 20:31:12.640057
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2d5f3a9c7'
+down_revision = 'c4f8a2d6e1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_items_price_id', 'items', ['price', 'id'], unique=False)
+    op.create_index('ix_items_store_id_name', 'items', ['store_id', 'name'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_items_store_id_name', table_name='items')
+    op.drop_index('ix_items_price_id', table_name='items')
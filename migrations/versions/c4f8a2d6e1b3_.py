@@ -0,0 +1,59 @@
+"""full-text search index of the items
+
+Revision ID: c4f8a2d6e1b3
+Revises: a7d3e9c1f5b2
+Create Date: 2026-10-17 19:05:41.227318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f8a2d6e1b3'
+down_revision = 'a7d3e9c1f5b2'
+branch_labels = None
+depends_on = None
+
+# Search index as item_search.py created it at this revision. SQLite gets an
+# FTS5 external content table kept in sync by triggers, PostgreSQL a GIN index
+# on the weighted tsvector of the name and description.
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(name, description, content='items', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items
+BEGIN
+    INSERT INTO items_fts(rowid, name, description) VALUES (NEW.id, NEW.name, NEW.description);
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items
+BEGIN
+    INSERT INTO items_fts(items_fts, rowid, name, description) VALUES ('delete', OLD.id, OLD.name, OLD.description);
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE OF name, description ON items
+BEGIN
+    INSERT INTO items_fts(items_fts, rowid, name, description) VALUES ('delete', OLD.id, OLD.name, OLD.description);
+    INSERT INTO items_fts(rowid, name, description) VALUES (NEW.id, NEW.name, NEW.description);
+END""",
+    # indexes the items already there
+    """INSERT INTO items_fts(items_fts) VALUES ('rebuild')""",
+]
+
+POSTGRESQL_INDEX = [
+    """CREATE INDEX IF NOT EXISTS ix_items_search ON items USING gin ((setweight(to_tsvector('english', coalesce(name, '')), 'A') || setweight(to_tsvector('english', coalesce(description, '')), 'B')))""",
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    statements = {"sqlite": SQLITE_INDEX, "postgresql": POSTGRESQL_INDEX}.get(dialect, [])
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for operation in ("insert", "delete", "update"):
+            op.execute(f'DROP TRIGGER IF EXISTS items_fts_{operation}')
+        op.execute('DROP TABLE IF EXISTS items_fts')
+    elif dialect == "postgresql":
+        op.execute('DROP INDEX IF EXISTS ix_items_search')
@@ -0,0 +1,29 @@
+"""unique item tag links
+
+Revision ID: d8a3c6e0b5f7
+Revises: b27f5a9c14e3
+Create Date: 2026-10-17 12:40:51.277630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a3c6e0b5f7'
+down_revision = 'b27f5a9c14e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keep the oldest of any duplicated links, the unique index cannot be built otherwise
+    op.execute(
+        'DELETE FROM items_tags WHERE id NOT IN '
+        '(SELECT MIN(id) FROM items_tags GROUP BY item_id, tag_id)'
+    )
+    op.create_index('ix_items_tags_item_id_tag_id', 'items_tags', ['item_id', 'tag_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_items_tags_item_id_tag_id', table_name='items_tags')
@@ -0,0 +1,184 @@
+"""change log of the per-worker tag index
+
+Revision ID: e2a6c9f4b8d1
+Revises: b8e2d5f3a9c7
+Create Date: 2026-10-17 21:48:09.515730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a6c9f4b8d1'
+down_revision = 'b8e2d5f3a9c7'
+branch_labels = None
+depends_on = None
+
+# Log triggers as tag_index.py created them at this revision. SQLite logs one
+# row per changed link or item, PostgreSQL one statement-level batch.
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS items_tags_tag_index_insert AFTER INSERT ON items_tags
+BEGIN
+    UPDATE change_counters SET value = value + 1 WHERE name = 'tag_index';
+    INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+    SELECT value, NEW.item_id, NEW.tag_id, NULL, 0 FROM change_counters WHERE name = 'tag_index';
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_tags_tag_index_delete AFTER DELETE ON items_tags
+BEGIN
+    UPDATE change_counters SET value = value + 1 WHERE name = 'tag_index';
+    INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+    SELECT value, OLD.item_id, OLD.tag_id, NULL, 1 FROM change_counters WHERE name = 'tag_index';
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_tags_tag_index_update
+AFTER UPDATE OF item_id, tag_id ON items_tags WHEN OLD.item_id IS NOT NEW.item_id OR OLD.tag_id IS NOT NEW.tag_id
+BEGIN
+    UPDATE change_counters SET value = value + 1 WHERE name = 'tag_index';
+    INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+    SELECT value, OLD.item_id, OLD.tag_id, NULL, 1 FROM change_counters WHERE name = 'tag_index';
+    UPDATE change_counters SET value = value + 1 WHERE name = 'tag_index';
+    INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+    SELECT value, NEW.item_id, NEW.tag_id, NULL, 0 FROM change_counters WHERE name = 'tag_index';
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_tag_index_insert AFTER INSERT ON items
+BEGIN
+    UPDATE change_counters SET value = value + 1 WHERE name = 'tag_index';
+    INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+    SELECT value, NEW.id, NULL, NEW.store_id, 0 FROM change_counters WHERE name = 'tag_index';
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_tag_index_delete AFTER DELETE ON items
+BEGIN
+    UPDATE change_counters SET value = value + 1 WHERE name = 'tag_index';
+    INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+    SELECT value, OLD.id, NULL, NULL, 1 FROM change_counters WHERE name = 'tag_index';
+END""",
+    """CREATE TRIGGER IF NOT EXISTS items_tag_index_update
+AFTER UPDATE OF store_id ON items WHEN OLD.store_id IS NOT NEW.store_id
+BEGIN
+    UPDATE change_counters SET value = value + 1 WHERE name = 'tag_index';
+    INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+    SELECT value, NEW.id, NULL, NEW.store_id, 0 FROM change_counters WHERE name = 'tag_index';
+END""",
+]
+
+POSTGRESQL_TRIGGERS = [
+    """CREATE OR REPLACE FUNCTION tag_index_log() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'items_tags' THEN
+      IF TG_OP = 'INSERT' THEN
+        WITH changes AS (SELECT item_id, tag_id, NULL::integer AS store_id, false AS removed FROM new_rows),
+        bumped AS (UPDATE change_counters SET value = value + 1
+                   WHERE name = 'tag_index' AND EXISTS (SELECT 1 FROM changes)
+                   RETURNING value)
+        INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+        SELECT bumped.value, changes.item_id, changes.tag_id, changes.store_id, changes.removed
+        FROM changes CROSS JOIN bumped ORDER BY changes.removed DESC;
+      ELSIF TG_OP = 'DELETE' THEN
+        WITH changes AS (SELECT item_id, tag_id, NULL::integer AS store_id, true AS removed FROM old_rows),
+        bumped AS (UPDATE change_counters SET value = value + 1
+                   WHERE name = 'tag_index' AND EXISTS (SELECT 1 FROM changes)
+                   RETURNING value)
+        INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+        SELECT bumped.value, changes.item_id, changes.tag_id, changes.store_id, changes.removed
+        FROM changes CROSS JOIN bumped ORDER BY changes.removed DESC;
+      ELSE
+        WITH changes AS (SELECT item_id, tag_id, NULL::integer AS store_id, true AS removed FROM old_rows UNION ALL SELECT item_id, tag_id, NULL::integer AS store_id, false AS removed FROM new_rows),
+        bumped AS (UPDATE change_counters SET value = value + 1
+                   WHERE name = 'tag_index' AND EXISTS (SELECT 1 FROM changes)
+                   RETURNING value)
+        INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+        SELECT bumped.value, changes.item_id, changes.tag_id, changes.store_id, changes.removed
+        FROM changes CROSS JOIN bumped ORDER BY changes.removed DESC;
+      END IF;
+    ELSIF TG_OP = 'INSERT' THEN
+        WITH changes AS (SELECT new_rows.id AS item_id, NULL::integer AS tag_id, new_rows.store_id AS store_id, false AS removed FROM new_rows),
+        bumped AS (UPDATE change_counters SET value = value + 1
+                   WHERE name = 'tag_index' AND EXISTS (SELECT 1 FROM changes)
+                   RETURNING value)
+        INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+        SELECT bumped.value, changes.item_id, changes.tag_id, changes.store_id, changes.removed
+        FROM changes CROSS JOIN bumped ORDER BY changes.removed DESC;
+    ELSIF TG_OP = 'DELETE' THEN
+        WITH changes AS (SELECT old_rows.id AS item_id, NULL::integer AS tag_id, NULL::integer AS store_id, true AS removed FROM old_rows),
+        bumped AS (UPDATE change_counters SET value = value + 1
+                   WHERE name = 'tag_index' AND EXISTS (SELECT 1 FROM changes)
+                   RETURNING value)
+        INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+        SELECT bumped.value, changes.item_id, changes.tag_id, changes.store_id, changes.removed
+        FROM changes CROSS JOIN bumped ORDER BY changes.removed DESC;
+    ELSE
+        WITH changes AS (SELECT new_rows.id AS item_id, NULL::integer AS tag_id, new_rows.store_id AS store_id, false AS removed FROM new_rows JOIN old_rows ON old_rows.id = new_rows.id WHERE old_rows.store_id IS DISTINCT FROM new_rows.store_id),
+        bumped AS (UPDATE change_counters SET value = value + 1
+                   WHERE name = 'tag_index' AND EXISTS (SELECT 1 FROM changes)
+                   RETURNING value)
+        INSERT INTO tag_index_changes (version, item_id, tag_id, store_id, removed)
+        SELECT bumped.value, changes.item_id, changes.tag_id, changes.store_id, changes.removed
+        FROM changes CROSS JOIN bumped ORDER BY changes.removed DESC;
+    END IF;
+    RETURN NULL;
+END $$""",
+    """CREATE TRIGGER items_tags_tag_index_insert AFTER INSERT ON items_tags
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()""",
+    """CREATE TRIGGER items_tags_tag_index_delete AFTER DELETE ON items_tags
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()""",
+    """CREATE TRIGGER items_tags_tag_index_update AFTER UPDATE ON items_tags
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()""",
+    """CREATE TRIGGER items_tag_index_insert AFTER INSERT ON items
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()""",
+    """CREATE TRIGGER items_tag_index_delete AFTER DELETE ON items
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()""",
+    """CREATE TRIGGER items_tag_index_update AFTER UPDATE ON items
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()""",
+]
+
+TRIGGERS = [f"{table}_tag_index_{operation}" for table in ("items_tags", "items")
+            for operation in ("insert", "delete", "update")]
+
+
+def upgrade():
+    op.create_table('tag_index_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=True),
+    sa.Column('tag_id', sa.Integer(), nullable=True),
+    sa.Column('store_id', sa.Integer(), nullable=True),
+    sa.Column('removed', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('tag_index_changes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_tag_index_changes_version'), ['version'], unique=False)
+
+    change_counters = sa.table('change_counters',
+                               sa.column('name', sa.String),
+                               sa.column('value', sa.BigInteger))
+    op.bulk_insert(change_counters, [{'name': 'tag_index', 'value': 0}])
+
+    dialect = op.get_bind().dialect.name
+    statements = {"sqlite": SQLITE_TRIGGERS, "postgresql": POSTGRESQL_TRIGGERS}.get(dialect, [])
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for trigger in TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    elif dialect == "postgresql":
+        for trigger in TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger} ON {trigger.rsplit("_tag_index_", 1)[0]}')
+        op.execute('DROP FUNCTION IF EXISTS tag_index_log()')
+
+    change_counters = sa.table('change_counters', sa.column('name', sa.String))
+    op.execute(change_counters.delete().where(change_counters.c.name == 'tag_index'))
+
+    with op.batch_alter_table('tag_index_changes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tag_index_changes_version'))
+
+    op.drop_table('tag_index_changes')
@@ -0,0 +1,38 @@
+"""foreign key indexes, not null item tag links
+
+Revision ID: f1c4a8e2b6d9
+Revises: e5b9f1c2a7d4
+Create Date: 2026-10-17 16:22:37.905114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c4a8e2b6d9'
+down_revision = 'e5b9f1c2a7d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_items_store_id_id', 'items', ['store_id', 'id'], unique=False)
+    op.create_index('ix_tags_store_id_id', 'tags', ['store_id', 'id'], unique=False)
+    op.create_index('ix_items_tags_tag_id_item_id', 'items_tags', ['tag_id', 'item_id'], unique=False)
+
+    # a link missing either end links nothing, and NULLs slip past the unique index
+    op.execute('DELETE FROM items_tags WHERE item_id IS NULL OR tag_id IS NULL')
+    with op.batch_alter_table('items_tags', schema=None) as batch_op:
+        batch_op.alter_column('item_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('tag_id', existing_type=sa.Integer(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('items_tags', schema=None) as batch_op:
+        batch_op.alter_column('tag_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('item_id', existing_type=sa.Integer(), nullable=True)
+
+    op.drop_index('ix_items_tags_tag_id_item_id', table_name='items_tags')
+    op.drop_index('ix_tags_store_id_id', table_name='tags')
+    op.drop_index('ix_items_store_id_id', table_name='items')
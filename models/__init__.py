@@ -2,11 +2,14 @@
 # For example, instead of 'from models.store import StoreModel',
 # you can use 'from models import StoreModel'.
 
+from models.change_counter import ChangeCounterModel
 from models.item import \
     ItemModel  # Imports the ItemModel class from the item.py file
 from models.item_tags import ItemsTags
+from models.job import JobModel
 from models.jwt_blocklist import JWTBlocklist
 from models.store import \
     StoreModel  # Imports the StoreModel class from the store.py file
 from models.tag import TagModel
+from models.tag_index_change import TagIndexChangeModel
 from models.user import UserModel
@@ -0,0 +1,47 @@
+# Data Model for named, monotonically increasing change counters.
+# Writers bump a counter in the same transaction as their change, and every
+# gunicorn worker can poll it (a single primary-key read) to find out whether
+# its in-process caches are still current.
+from sqlalchemy import select, update
+
+from db import db, dialect_insert
+
+
+class ChangeCounterModel(db.Model):  # type: ignore
+    __tablename__ = "change_counters"
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @classmethod
+    def bump(cls, name):
+        """Increments the counter inside the current transaction and returns the new value.
+
+        The UPDATE takes a row lock that is held until commit, so concurrent
+        writers get distinct values in commit order. The caller is responsible
+        for committing the session.
+        """
+        statement = (
+            update(cls)
+            .where(cls.name == name)
+            .values(value=cls.value + 1)
+            .returning(cls.value)
+        )
+        value = db.session.execute(statement).scalar()
+
+        if value is None:
+            # the row is seeded by the migration, but databases built with
+            # db.create_all() start without it; a concurrent writer may create
+            # it first, so insert it as 0 if missing and bump it again
+            db.session.execute(
+                dialect_insert(cls).values(name=name, value=0)
+                .on_conflict_do_nothing(index_elements=[cls.name]))
+            value = db.session.execute(statement).scalar()
+        return value
+
+    @classmethod
+    def current(cls, name):
+        """Returns the committed value of the counter (0 if it was never bumped)."""
+        value = db.session.execute(
+            select(cls.value).where(cls.name == name)).scalar()
+        return value or 0
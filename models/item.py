@@ -11,6 +11,20 @@ class ItemModel(db.Model):  # type: ignore
     price = db.Column(db.Float(precision=2), nullable=False)
     store_id = db.Column(db.Integer, db.ForeignKey( 
         "stores.id"), nullable=False)
+    # Relevance of the item in a full-text search, only loaded by item_search.search_query()
+    search_rank = db.query_expression()
+
+    # A store's items (store.items, counting and deleting them) in id order,
+    # so pages of one store's items are read straight from the index. The
+    # second one gives a store's cheapest and dearest item in one index probe.
+    # With the last two, GET /item filters on price ranges and sorts by price
+    # (then id), and filters a store's items by name prefix, from an index.
+    __table_args__ = (
+        db.Index("ix_items_store_id_id", "store_id", "id"),
+        db.Index("ix_items_store_id_price", "store_id", "price"),
+        db.Index("ix_items_price_id", "price", "id"),
+        db.Index("ix_items_store_id_name", "store_id", "name"),
+    )
 
     # This sets up a relationship where each item is linked to a single store.
     # You can access the store an item belongs to by using 'item.store'.
@@ -7,5 +7,15 @@ class ItemsTags(db.Model):  # type: ignore
     __tablename__ = "items_tags"
 
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey("items.id"))
-    tag_id = db.Column(db.Integer, db.ForeignKey("tags.id"))
+    item_id = db.Column(db.Integer, db.ForeignKey("items.id"), nullable=False)
+    tag_id = db.Column(db.Integer, db.ForeignKey("tags.id"), nullable=False)
+
+    # An item can carry a tag only once. The unique index also lets bulk linking
+    # skip existing links in the database with INSERT ... ON CONFLICT DO NOTHING,
+    # and serves the item -> tags lookups (item.tags, deleting an item's links).
+    # The second one serves the tag -> items direction (tag.items, deleting a tag's
+    # links); both hold the two ids, so the joins never read the table itself.
+    __table_args__ = (
+        db.Index("ix_items_tags_item_id_tag_id", "item_id", "tag_id", unique=True),
+        db.Index("ix_items_tags_tag_id_item_id", "tag_id", "item_id"),
+    )
@@ -0,0 +1,18 @@
+# Data Model for background jobs (see jobs.py).
+# The row is the job's status as seen by every gunicorn worker, whichever one runs it.
+from db import db
+
+
+class JobModel(db.Model):  # type: ignore
+    __tablename__ = "jobs"
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, hard to guess
+    kind = db.Column(db.String(50), nullable=False)  # e.g. "delete_store"
+    target_id = db.Column(db.Integer)  # id of the row the job works on
+    # queued -> running -> succeeded | failed
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    progress = db.Column(db.Integer, nullable=False, default=0)  # rows processed so far
+    error = db.Column(db.Text)
+    # Unix timestamps, like JWTBlocklist.exp
+    created_at = db.Column(db.BigInteger, nullable=False)
+    finished_at = db.Column(db.BigInteger)
@@ -8,3 +8,9 @@ class JWTBlocklist(db.Model):  # type: ignore
     # 'jti' (JWT ID) claim of the token to be blocklisted.
     # This is typically a unique string.
     jti = db.Column(db.String(100), primary_key=True)
+    # value of the "jwt_blocklist" change counter when this row was inserted.
+    # Workers poll the counter and fetch only the rows newer than what they have seen.
+    version = db.Column(db.BigInteger, index=True)
+    # 'exp' claim of the token (unix timestamp). Once it has passed, the token is
+    # rejected as expired before the blocklist is consulted, so the row can be pruned.
+    exp = db.Column(db.BigInteger, index=True)
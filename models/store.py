@@ -7,16 +7,21 @@ class StoreModel(db.Model):  # type: ignore
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
+    # Maintained by database triggers on items and tags (see catalog_counters.py)
+    item_count = db.Column(db.Integer, nullable=False, server_default="0")
+    tag_count = db.Column(db.Integer, nullable=False, server_default="0")
+    price_sum = db.Column(db.Float, nullable=False, server_default="0")
 
     # This sets up a relationship where each store can have many items.
     # You can access all items in a store using 'store.items'.
     # The 'back_populates="store"' part tells SQLAlchemy this relationship is connected to
     # the 'store' property in the ItemModel — this links both directions (two-way connection).
-    # The 'lazy="dynamic"' part means the related items are not loaded immediately with the store.
-    # Instead, you get a query object that lets you filter or load items only when needed.
-    # Example: store.items.all() will fetch all items in the store.
+    # The related items are loaded the first time 'store.items' is accessed, or up front
+    # when a query asks for it with selectinload(StoreModel.items) (see query_shaping.py),
+    # which loads the items of a whole page of stores in a single query.
+    # To filter or page a store's items, query ItemModel with store_id instead.
     items = db.relationship(
-        "ItemModel", back_populates="store", lazy="dynamic", cascade="all, delete")
-    
-    tags = db.relationship("TagModel", back_populates="store", lazy="dynamic")
+        "ItemModel", back_populates="store", cascade="all, delete")
+
+    tags = db.relationship("TagModel", back_populates="store")
  
\ No newline at end of file
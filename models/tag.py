@@ -9,6 +9,12 @@ class TagModel(db.Model):  # type: ignore
     name = db.Column(db.String(80), unique=True, nullable=False)
     store_id = db.Column(db.Integer, db.ForeignKey(
         "stores.id"), nullable=False)
+    # Maintained by a database trigger on items_tags (see catalog_counters.py)
+    item_count = db.Column(db.Integer, nullable=False, server_default="0")
+    # GET /store/<id>/tags pages through a store's tags in id order
+    __table_args__ = (
+        db.Index("ix_tags_store_id_id", "store_id", "id"),
+    )
     store = db.relationship("StoreModel", back_populates="tags")
     items = db.relationship(
         "ItemModel", back_populates="tags", secondary="items_tags")
@@ -0,0 +1,21 @@
+# Data Model for the log of item/tag link changes replayed by the per-worker
+# tag index (see tag_index.py). Rows are written by database triggers on items
+# and items_tags, stamped with the value of the "tag_index" change counter.
+
+from db import db
+
+
+class TagIndexChangeModel(db.Model):  # type: ignore
+    __tablename__ = "tag_index_changes"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # value of the "tag_index" change counter, workers read the rows newer than theirs
+    version = db.Column(db.BigInteger, nullable=False, index=True)
+    # the item linked or unlinked, moved or deleted; None asks for a rebuild
+    item_id = db.Column(db.Integer)
+    # set for a link change, None for a change of the item itself
+    tag_id = db.Column(db.Integer)
+    # the item's new store, None for link changes and deleted items
+    store_id = db.Column(db.Integer)
+    # the link or the item was deleted
+    removed = db.Column(db.Boolean, nullable=False, default=False)
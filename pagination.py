@@ -0,0 +1,303 @@
+"""
+Keyset (cursor) pagination for flask-smorest list endpoints.
+
+flask-smorest only ships page-number pagination, which turns into
+OFFSET n queries that get slower the deeper a client pages. Keyset pagination
+instead remembers the sort key of the last row it returned and asks for
+"rows after this key", which an index answers in constant time:
+
+    SELECT ... WHERE id > :last_id ORDER BY id LIMIT :limit + 1
+
+The position is handed to clients as an opaque cursor. The view returns an
+unexecuted query and the ``keyset_paginate`` decorator pages it, so latency
+and memory depend on the page size rather than the table size.
+"""
+
+import base64
+import binascii
+import http
+import json
+from copy import deepcopy
+from functools import wraps
+from urllib.parse import urlencode
+
+import marshmallow as ma
+from flask import current_app, request
+from flask_smorest import abort  # type: ignore
+from flask_smorest.utils import unpack_tuple_response  # type: ignore
+from sqlalchemy import and_, inspect, or_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+
+def encode_cursor(values):
+    """Encodes the sort key values of the last returned row as an opaque token."""
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """Decodes a cursor produced by encode_cursor, raising ValidationError if it is garbage."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error) as e:
+        raise ma.ValidationError("Invalid cursor.", "cursor") from e
+    if not isinstance(values, list):
+        raise ma.ValidationError("Invalid cursor.", "cursor")
+    return values
+
+
+class KeysetParameters:
+    """Holds keyset pagination arguments, and the results the pager fills in
+
+    :param int limit: Maximum number of rows to return
+    :param list cursor: Sort key values of the last row of the previous page
+    :param bool count: Whether the total number of rows should be computed
+    """
+
+    def __init__(self, limit, cursor=None, count=False):
+        self.limit = limit
+        self.cursor = cursor
+        self.count = count
+        self.next_cursor = None
+        self.item_count = None
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}"
+            f"(limit={self.limit!r},cursor={self.cursor!r},count={self.count!r})"
+        )
+
+
+def _keyset_parameters_schema_factory(def_limit, def_max_limit):
+    """Generate a KeysetParametersSchema"""
+
+    class KeysetParametersSchema(ma.Schema):
+        """Deserializes keyset pagination params into KeysetParameters"""
+
+        class Meta:
+            unknown = ma.EXCLUDE
+
+        limit = ma.fields.Integer(
+            load_default=def_limit,
+            validate=ma.validate.Range(min=1, max=def_max_limit),
+        )
+        cursor = ma.fields.String(
+            metadata={"description": "Opaque cursor from the previous page."})
+        count = ma.fields.Boolean(
+            load_default=False,
+            metadata={"description": "Also compute the total number of rows."},
+        )
+
+        @ma.post_load
+        def make_parameters(self, data, **kwargs):
+            if "cursor" in data:
+                data["cursor"] = decode_cursor(data["cursor"])
+            return KeysetParameters(**data)
+
+    return KeysetParametersSchema
+
+
+class KeysetMetadataSchema(ma.Schema):
+    """Keyset pagination metadata schema, documents the X-Pagination header."""
+
+    limit = ma.fields.Int(metadata={"description": "Requested page size."})
+    next_cursor = ma.fields.Str(
+        metadata={"description": "Cursor of the next page, absent on the last page."})
+    total = ma.fields.Int(
+        metadata={"description": "Total number of rows, only when count=true."})
+
+
+def _split_key(key):
+    """Returns (column, descending) for a column or a column.desc() expression."""
+    if isinstance(key, UnaryExpression) and key.modifier in (
+            operators.desc_op, operators.asc_op):
+        return key.element, key.modifier is operators.desc_op
+    return key, False
+
+
+def _after(keys, values):
+    """Builds the WHERE clause selecting rows strictly after ``values`` in ``keys`` order.
+
+    (a, b) > (x, y) expands to a > x OR (a = x AND b > y), with < for
+    descending keys, so mixed sort directions keep working.
+    """
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+# Python type of a key column -> the JSON values a cursor may hold for it
+_CURSOR_TYPES = {int: (int,), float: (int, float), str: (str,)}
+# keys of unknown type, expressions such as a search rank
+_ANY_CURSOR_TYPE = (int, float, str)
+# integers the database drivers bind
+_BIGINT_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def _check_cursor(keys, values):
+    """Raises ValidationError unless the cursor holds one value of the right type per key."""
+    if len(values) != len(keys):
+        raise ma.ValidationError("Invalid cursor.", "cursor")
+    for (column, _), value in zip(keys, values):
+        try:
+            allowed = _CURSOR_TYPES.get(column.type.python_type, _ANY_CURSOR_TYPE)
+        except NotImplementedError:
+            allowed = _ANY_CURSOR_TYPE
+        # None included: the keys are NOT NULL, and a comparison with NULL
+        # would match no row rather than page on
+        valid = isinstance(value, allowed) and not isinstance(value, bool)
+        if valid and isinstance(value, int):
+            valid = value in _BIGINT_RANGE
+        if not valid:
+            raise ma.ValidationError("Invalid cursor.", "cursor")
+
+
+class KeysetPage:
+    """Pages through a SQLAlchemy query ordered by a unique key
+
+    :param Query query: Unexecuted query returned by the view
+    :param keys: Columns (or column.desc()) that order the rows. The last key
+        must make the ordering unique; the primary key of the queried model is
+        used when no keys are given.
+    :param KeysetParameters page_params: Pagination parameters
+    """
+
+    def __init__(self, query, page_params, keys=None):
+        if keys is None:
+            entity = query.column_descriptions[0]["entity"]
+            keys = inspect(entity).primary_key
+        self.query = query
+        self.keys = [_split_key(key) for key in keys]
+        self.page_params = page_params
+
+    @property
+    def items(self):
+        params = self.page_params
+        query = self.query
+        if params.count and params.item_count is None:
+            params.item_count = query.order_by(None).count()
+        if params.cursor is not None:
+            _check_cursor(self.keys, params.cursor)
+            query = query.filter(_after(self.keys, params.cursor))
+
+        order = [column.desc() if descending else column
+                 for column, descending in self.keys]
+        # fetch one extra row to learn whether there is a next page
+        rows = query.order_by(*order).limit(params.limit + 1).all()
+        if len(rows) > params.limit:
+            rows = rows[:params.limit]
+            last = rows[-1]
+            params.next_cursor = encode_cursor(
+                [getattr(last, column.key) for column, _ in self.keys])
+        return rows
+
+
+class KeysetPaginationMixin:
+    """Extend Blueprint with keyset pagination, reusing flask-smorest's machinery"""
+
+    # Global default keyset pagination parameters
+    DEFAULT_KEYSET_PARAMETERS = {"limit": 20, "max_limit": 100}
+
+    def keyset_paginate(self, keys=None, *, limit=None, max_limit=None, pass_parameters=False):
+        """Decorator paginating the query returned by the view function
+
+        :param keys: Sort keys, see :class:`KeysetPage`. May also be a
+            callable taking the view arguments, for sort orders chosen per request.
+        :param int limit: Default page size
+        :param int max_limit: Maximum page size a client may ask for
+        :param bool pass_parameters: Pass the :class:`KeysetParameters` to the
+            view as ``keyset_parameters``, for views that find the page
+            themselves. A view setting ``item_count`` spares the pager the count.
+
+        Must be placed below the ``response`` decorator. The response carries
+        an ``X-Pagination`` header and, when there is a next page, a
+        ``Link: <...>; rel="next"`` header.
+        """
+        if limit is None:
+            limit = self.DEFAULT_KEYSET_PARAMETERS["limit"]
+        if max_limit is None:
+            max_limit = self.DEFAULT_KEYSET_PARAMETERS["max_limit"]
+        page_params_schema = _keyset_parameters_schema_factory(limit, max_limit)
+
+        parameters = {
+            "in": "query",
+            "schema": page_params_schema,
+        }
+
+        error_status_code = self.PAGINATION_ARGUMENTS_PARSER.DEFAULT_VALIDATION_STATUS
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                page_params = self.PAGINATION_ARGUMENTS_PARSER.parse(
+                    page_params_schema, request, location="query"
+                )
+
+                page_keys = keys(*args, **kwargs) if callable(keys) else keys
+                if pass_parameters:
+                    kwargs["keyset_parameters"] = page_params
+
+                result, status, headers = unpack_tuple_response(
+                    current_app.ensure_sync(func)(*args, **kwargs)
+                )
+
+                try:
+                    result = KeysetPage(result, page_params, page_keys).items
+                except ma.ValidationError as e:
+                    # same error body as a cursor rejected while parsing the query string
+                    abort(error_status_code,
+                          errors={"query": e.normalized_messages()})
+
+                headers = self._set_keyset_metadata(page_params, headers)
+                return result, status, headers
+
+            # Add pagination params to doc info in wrapper object,
+            # flask-smorest documents them like its own pagination
+            wrapper._apidoc = deepcopy(getattr(wrapper, "_apidoc", {}))
+            wrapper._apidoc["pagination"] = {
+                "parameters": parameters,
+                "response": {
+                    error_status_code: http.HTTPStatus(error_status_code).name,
+                },
+            }
+
+            return wrapper
+
+        return decorator
+
+    def _set_keyset_metadata(self, page_params, headers):
+        """Add keyset pagination metadata and the next link to headers"""
+        if headers is None:
+            headers = {}
+        metadata = {"limit": page_params.limit}
+        if page_params.next_cursor is not None:
+            metadata["next_cursor"] = page_params.next_cursor
+            args = request.args.copy()
+            args["cursor"] = page_params.next_cursor
+            next_url = f"{request.base_url}?{urlencode(list(args.items(multi=True)))}"
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        if page_params.item_count is not None:
+            metadata["total"] = page_params.item_count
+        headers[self.PAGINATION_HEADER_NAME] = json.dumps(
+            KeysetMetadataSchema().dump(metadata))
+        return headers
+
+    def _document_pagination_metadata(self, spec, resp_doc):
+        """Document the keyset pagination headers"""
+        resp_doc.setdefault("headers", {}).update(
+            {
+                self.PAGINATION_HEADER_NAME: {
+                    "description": "Keyset pagination metadata",
+                    "schema": KeysetMetadataSchema,
+                },
+                "Link": {
+                    "description": "URL of the next page (rel=\"next\")",
+                    "schema": {"type": "string"},
+                },
+            }
+        )
@@ -0,0 +1,191 @@
+"""
+Bounded process pool for pbkdf2 password hashing.
+
+Hashing and verifying a password costs tens to hundreds of milliseconds of
+pure CPU. Run inline, a login spike pins every gunicorn worker and cheap GET
+traffic queues behind it. Here /register and /login hand the work to a small
+process pool instead, so at most PASSWORD_HASH_WORKERS hashes run at a time
+per gunicorn worker, whatever the spike. At most PASSWORD_HASH_QUEUE_DEPTH more
+may wait for a pool process; beyond that ``HashingBusy`` is raised at once and
+the views answer 503, rather than piling up requests that would time out anyway.
+
+The cost is PASSWORD_HASH_ROUNDS pbkdf2 rounds. A stored hash made with
+another round count still verifies, and ``verify`` returns its replacement at
+the current policy so the caller can store it (rehash-on-login).
+
+Set PASSWORD_HASH_WORKERS to 0 to hash in the request thread, without a pool.
+Under the ASGI server that thread is the event loop's, which every request
+would wait for: keep the pool there.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from passlib.context import CryptContext  # type: ignore
+
+from async_db import wait
+from metrics import (PASSWORD_HASH_REJECTED, PASSWORD_HASH_SECONDS,
+                     PASSWORD_HASH_WAIT_SECONDS)
+
+DEFAULT_ROUNDS = 29000  # passlib's own default for pbkdf2_sha256
+
+# CryptContext per round count, built once per process (pool processes included)
+_contexts = {}
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool and its queue are full, or a hash timed out."""
+
+
+def _context(rounds):
+    if rounds not in _contexts:
+        # pinning min and max to the default flags any other round count for update
+        _contexts[rounds] = CryptContext(
+            schemes=["pbkdf2_sha256"],
+            pbkdf2_sha256__default_rounds=rounds,
+            pbkdf2_sha256__min_rounds=rounds,
+            pbkdf2_sha256__max_rounds=rounds,
+        )
+    return _contexts[rounds]
+
+
+def _hash(password, rounds):
+    started = time.monotonic()
+    return _context(rounds).hash(password), started, time.monotonic() - started
+
+
+def _verify_and_update(password, stored_hash, rounds):
+    started = time.monotonic()
+    result = _context(rounds).verify_and_update(password, stored_hash)
+    return result, started, time.monotonic() - started
+
+
+class PasswordHasher:
+    """Runs password hashing in a bounded pool of processes and records its timings."""
+
+    def __init__(self):
+        self.workers = 0
+        self.queue_depth = 0
+        self.rounds = DEFAULT_ROUNDS
+        self.timeout = 10.0
+        self._pool = None
+        self._pool_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def init_app(self, app):
+        """Reads the pool settings from the Flask config. The pool itself starts on first use."""
+        self.workers = app.config.setdefault("PASSWORD_HASH_WORKERS", 2)
+        self.queue_depth = app.config.setdefault(
+            "PASSWORD_HASH_QUEUE_DEPTH", 4 * self.workers)
+        self.rounds = app.config.setdefault("PASSWORD_HASH_ROUNDS", DEFAULT_ROUNDS)
+        self.timeout = app.config.setdefault("PASSWORD_HASH_TIMEOUT_SECONDS", 10.0)
+        self.shutdown()
+        # pool slots plus queue slots, taken for the whole life of a job
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = {
+            "hashed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "rehashed": 0,
+            "hash_seconds_total": 0.0,
+            "hash_seconds_max": 0.0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+        }
+
+    def _get_pool(self):
+        # gunicorn forks its workers after create_app(), each needs its own pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _run(self, func, *args):
+        if not self.workers:
+            submitted = time.monotonic()
+            result, started, duration = func(*args, self.rounds)
+            self._record(started - submitted, duration)
+            return result
+
+        if not self._slots.acquire(blocking=False):
+            self._stats["rejected"] += 1
+            PASSWORD_HASH_REJECTED.inc()
+            raise HashingBusy
+        submitted = time.monotonic()
+        try:
+            future = self._get_pool().submit(func, *args, self.rounds)
+        except BaseException:
+            self._slots.release()
+            raise
+        # a timed out job keeps its slot until the pool process is done with it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result, started, duration = wait(future, timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._stats["timed_out"] += 1
+            raise HashingBusy
+        # time.monotonic() is system wide, so pool process timestamps compare with ours
+        self._record(max(started - submitted, 0.0), duration)
+        return result
+
+    def _record(self, wait, duration):
+        stats = self._stats
+        stats["hashed"] += 1
+        stats["hash_seconds_total"] += duration
+        stats["hash_seconds_max"] = max(stats["hash_seconds_max"], duration)
+        stats["queue_wait_seconds_total"] += wait
+        stats["queue_wait_seconds_max"] = max(stats["queue_wait_seconds_max"], wait)
+        PASSWORD_HASH_SECONDS.observe(duration)
+        PASSWORD_HASH_WAIT_SECONDS.observe(wait)
+
+    def hash(self, password):
+        """Returns the hash of a password under the current round policy."""
+        return self._run(_hash, password)
+
+    def verify(self, password, stored_hash):
+        """Checks a password against its stored hash.
+
+        Returns (matches, new_hash). new_hash is not None when the password
+        matches but the stored hash was made under another round policy;
+        the caller should store it in place of the old one.
+        """
+        matches, new_hash = self._run(_verify_and_update, password, stored_hash)
+        if new_hash is not None:
+            self._stats["rehashed"] += 1
+        return matches, new_hash
+
+    def stats(self):
+        """Returns the settings and timing counters of this worker's hashing pool."""
+        stats = dict(self._stats)
+        hashed = stats["hashed"] or 1
+        stats.update(
+            workers=self.workers,
+            queue_depth=self.queue_depth,
+            rounds=self.rounds,
+            hash_seconds_avg=stats["hash_seconds_total"] / hashed,
+            queue_wait_seconds_avg=stats["queue_wait_seconds_total"] / hashed,
+        )
+        return stats
+
+
+password_hasher = PasswordHasher()
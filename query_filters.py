@@ -0,0 +1,249 @@
+"""
+Filter and sort query parameters of list endpoints, compiled to SQL.
+
+    GET /item?price[gte]=10&price[lt]=50&store_id=3&sort=-price,id
+    GET /item?tag_id[in]=4,9&name[prefix]=chair
+
+The fields a client may filter on, with their operators, and the fields it
+may sort by are declared in a whitelist next to the response schema (see
+ITEM_FILTERS and ITEM_SORTS in schemas.py). filter_schema() turns it into a
+query string schema with one parameter per field and operator: ``field`` for
+equality, ``field[op]`` for the others. The loaded ListQuery gives the WHERE
+clauses and the sort keys of the keyset pager; values are bound parameters,
+they never reach the SQL text. Anything outside the whitelist is a 422.
+
+A prefix is compiled as a range (name >= 'cha' AND name < 'chb'), which the
+btree index of the column answers on every database, and a LIKE that
+rechecks it. A LIKE alone is only indexed by SQLite under
+case_sensitive_like, and by PostgreSQL with text_pattern_ops or the C
+collation.
+
+The whitelisted fields each have an index, but a combination of them can
+still leave the database nothing better than reading the whole table
+(filtering on one field and sorting on another, say). ScanGuard explains the
+query of each new shape (filtered fields, operators and sort keys) once per
+worker, and refuses with a 400 the shapes whose plan reads the table without
+an index, while it holds more than FILTER_MAX_SCAN_ROWS rows. PostgreSQL
+explains them with sequential scans disabled: on a small table its planner
+prefers one even where an index serves the shape, and the verdict is kept
+for the life of the worker, so a Seq Scan must mean that no index could
+serve it. The row count is kept for FILTER_ROW_COUNT_TTL_SECONDS.
+"""
+
+import operator
+import re
+import time
+
+import marshmallow as ma
+from flask_smorest import abort  # type: ignore
+from sqlalchemy import and_
+from webargs.fields import DelimitedList
+
+from db import db
+
+# operator of the query string -> function building the SQL condition on a column
+OPERATORS = {
+    "eq": operator.eq,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "in": lambda column, values: column.in_(values),
+    "prefix": lambda column, value: _prefix(column, value),
+}
+
+# Matches "price[gte]" style query parameter names
+FILTER_PARAM = re.compile(r"^(\w+)\[(\w+)\]$")
+
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)(?! USING (?:COVERING )?INDEX)")
+_POSTGRESQL_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+_PLAN_SORT = re.compile(r"TEMP B-TREE FOR .*ORDER BY|^(?:->\s*)?(?:Incremental )?Sort\b")
+
+
+def _prefix(column, value):
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    condition = column.like(f"{escaped}%", escape="\\")
+    last = ord(value[-1])
+    if last == 0x10FFFF:
+        return condition
+    return and_(column >= value, column < value[:-1] + chr(last + 1), condition)
+
+
+class ListQuery:
+    """Filters and sort order of a list request, as loaded by a filter_schema()
+
+    :param list conditions: (field, operator, value) triples
+    :param list sort: (field, descending) pairs, ending with a unique field
+    """
+
+    def __init__(self, conditions, sort):
+        self.conditions = conditions
+        self.sort = sort
+
+    @property
+    def shape(self):
+        """What the query plan depends on: the filtered fields and operators, and the sort."""
+        return (tuple(sorted((field, op) for field, op, _ in self.conditions)), tuple(self.sort))
+
+    def where(self, columns):
+        """Returns the WHERE clauses, given the column of each field.
+
+        A column may also be a function taking a condition builder (column ->
+        clause) and returning the clause, for fields read from another table.
+        """
+        clauses = []
+        for field, op, value in self.conditions:
+            def condition(column, op=op, value=value):
+                return OPERATORS[op](column, value)
+            column = columns[field]
+            clauses.append(column(condition) if callable(column) else condition(column))
+        return clauses
+
+    def keys(self, columns):
+        """Returns the sort keys, for the keyset pager or order_by()."""
+        return [columns[field].desc() if descending else columns[field]
+                for field, descending in self.sort]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(conditions={self.conditions!r},sort={self.sort!r})"
+
+
+class _ListQuerySchema(ma.Schema):
+    """Base of the generated schemas, see filter_schema()"""
+
+    class Meta:
+        unknown = ma.EXCLUDE
+
+    sortable = ()
+    unique = ()
+    default_sort = ""
+
+    @ma.pre_load
+    def reject_unknown_filters(self, data, **kwargs):
+        # other query parameters (limit, cursor, fields[...]) are parsed elsewhere,
+        # but a field[op] nobody declared is a mistake the client should hear about
+        unknown = [key for key in data
+                   if FILTER_PARAM.match(key) and key not in self.fields
+                   and not key.startswith("fields[")]
+        if unknown:
+            raise ma.ValidationError({key: ["Unknown filter."] for key in unknown})
+        return data
+
+    @ma.post_load
+    def make_query(self, data, **kwargs):
+        sort = []
+        for key in data.pop("sort").split(","):
+            field = key.strip().lstrip("-")
+            if field not in self.sortable or field in (name for name, _ in sort):
+                raise ma.ValidationError(
+                    f"Sort by a comma separated list of {', '.join(self.sortable)} "
+                    f"(prefixed by - for descending), each at most once.", "sort")
+            sort.append((field, key.strip().startswith("-")))
+        # the keyset pager needs a unique order
+        if not any(field in self.unique for field, _ in sort):
+            sort.append((self.unique[0], False))
+
+        conditions = []
+        for name, value in data.items():
+            match = FILTER_PARAM.match(name)
+            field, op = match.groups() if match else (name, "eq")
+            conditions.append((field, op, value))
+        return ListQuery(conditions, sort)
+
+
+def filter_schema(name, filters, sorts, unique=("id",), default_sort="id"):
+    """Generates the query string schema of a filter whitelist
+
+    :param dict filters: field -> (marshmallow field class, operators)
+    :param sorts: Fields that may be sorted by
+    :param unique: Unique sortable fields, the first one ends any sort without one
+    """
+    declared = {
+        "sort": ma.fields.Str(load_default=default_sort, metadata={
+            "description": f"Comma separated fields among {', '.join(sorts)}, "
+                           f"prefixed by - for descending order."}),
+    }
+    for field, (field_class, operators) in filters.items():
+        for op in operators:
+            param = field if op == "eq" else f"{field}[{op}]"
+            if op == "in":
+                declared[param] = DelimitedList(field_class(), validate=ma.validate.Length(min=1, max=100))
+            elif op == "prefix":
+                declared[param] = field_class(validate=ma.validate.Length(min=1))
+            else:
+                declared[param] = field_class()
+    attributes = {"sortable": tuple(sorts), "unique": tuple(unique), "default_sort": default_sort}
+    return type(name, (_ListQuerySchema,), {**declared, **attributes})
+
+
+def explain(query):
+    """Returns the lines of the database's plan of an ORM query."""
+    connection = db.session.connection()
+    compiled = query.statement.compile(connection, compile_kwargs={"render_postcompile": True})
+    if connection.dialect.name == "sqlite":
+        parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+        return [row[-1] for row in connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {compiled}", parameters)]
+    # the plan an index allows, whatever the size of the table today
+    connection.exec_driver_sql("SET enable_seqscan = off")
+    try:
+        return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)]
+    finally:
+        connection.exec_driver_sql("RESET enable_seqscan")
+
+
+def full_scans(dialect, plan, filtered):
+    """Returns the tables a plan reads in full.
+
+    A scan in the order of the results, without conditions, stops after the
+    page and is not counted.
+    """
+    pattern = _SQLITE_FULL_SCAN if dialect == "sqlite" else _POSTGRESQL_FULL_SCAN
+    lines = [line.strip(" -|`") for line in plan]
+    sorted_in_plan = any(_PLAN_SORT.search(line) for line in lines)
+    tables = [match.group(1) for match in map(pattern.search, lines) if match]
+    return tables if filtered or sorted_in_plan else []
+
+
+class ScanGuard:
+    """Refuses list queries whose plan reads a large table in full, see the module docstring."""
+
+    def __init__(self):
+        self.max_rows = 10000
+        self.count_ttl = 60.0
+        self._scans = {}
+        self._row_counts = {}  # table -> (rows, time.monotonic() of the count)
+
+    def init_app(self, app):
+        self.max_rows = app.config.setdefault("FILTER_MAX_SCAN_ROWS", 10000)
+        self.count_ttl = app.config.setdefault("FILTER_ROW_COUNT_TTL_SECONDS", 60.0)
+        self._scans = {}
+        self._row_counts = {}
+
+    def check(self, query, list_query, table, count_rows):
+        """Aborts with a 400 when the ordered ``query`` reads ``table`` in full
+        and ``count_rows()`` is above the limit.
+
+        Plans are cached by the shape of ``list_query``, so a shape is
+        explained once, whatever its values. The row count of the table is
+        cached for ``count_ttl`` seconds.
+        """
+        key = (table, list_query.shape)
+        if key not in self._scans:
+            plan = explain(query.limit(1))
+            self._scans[key] = table in full_scans(
+                db.engine.dialect.name, plan, bool(list_query.conditions))
+        if self._scans[key] and self._count(table, count_rows) > self.max_rows:
+            abort(400, message=f"These filters and sort would read every row of {table}. "
+                               f"Filter on a field the results are sorted by, or narrow them "
+                               f"down by an equality filter.")
+
+    def _count(self, table, count_rows):
+        now = time.monotonic()
+        cached = self._row_counts.get(table)
+        if cached is None or now - cached[1] >= self.count_ttl:
+            cached = self._row_counts[table] = (count_rows(), now)
+        return cached[0]
+
+
+scan_guard = ScanGuard()
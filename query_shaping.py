@@ -0,0 +1,280 @@
+"""
+Shapes ORM queries after the response schema that will serialize their results.
+
+Without help, dumping ItemSchema(many=True) loads each item's store and tags
+lazily, one or two extra queries per row (the N+1 problem). Here the nested
+fields of the response schema are mapped to their relationships and loaded
+up front: joinedload for many-to-one (a single JOIN that never multiplies
+rows), selectinload for collections (one extra "WHERE id IN (...)" query per
+relationship). A list endpoint then runs a fixed number of queries whatever
+the page size.
+
+Clients may narrow the nested data with ``?include=store,tags`` (an empty
+value drops every nested object), and pick fields with sparse fieldsets:
+``?fields=id,name,store`` for the top level, ``?fields[store]=name`` for a
+nested object. What is not selected is neither dumped nor loaded: the SELECT
+only lists the selected columns (load_only) and unselected relationships are
+never queried.
+"""
+
+import re
+from copy import deepcopy
+from functools import wraps
+
+import marshmallow as ma
+from flask import g, jsonify, request
+from flask_smorest import abort  # type: ignore
+from flask_smorest.utils import (get_appcontext,  # type: ignore
+                                 resolve_schema_instance,
+                                 unpack_tuple_response)
+from sqlalchemy import inspect
+from sqlalchemy.orm import MANYTOONE, joinedload, load_only, selectinload
+from werkzeug.wrappers import Response
+
+# Methods whose response shape may be chosen by query parameters
+SHAPED_METHODS = ("GET", "HEAD")
+
+# Matches "fields[store]" and "fields[store.tags]" query parameter names
+FIELDS_PARAM = re.compile(r"^fields\[([\w.]+)\]$")
+
+# OpenAPI description of the shaping query parameters
+SHAPING_PARAMETERS = [
+    {
+        "name": "include",
+        "in": "query",
+        "description": "Comma separated nested objects to return (dotted for deeper levels).",
+        "schema": {"type": "string"},
+    },
+    {
+        "name": "fields",
+        "in": "query",
+        "description": "Comma separated fields to return. Use fields[<nested>] for nested objects.",
+        "schema": {"type": "string"},
+    },
+]
+
+# Pruned schema instances, built once per (schema class, selection, many)
+_pruned_schemas = {}
+
+
+def _nested_schema(field):
+    """Returns the nested schema of a Nested or List(Nested) field, else None."""
+    if isinstance(field, ma.fields.List):
+        field = field.inner
+    if isinstance(field, ma.fields.Nested):
+        return field.schema
+    return None
+
+
+def schema_selection(schema):
+    """Builds the full selection tree of a schema's dumped fields.
+
+    The tree maps each field name to None for plain fields, or to the
+    selection tree of the nested schema for nested fields.
+    """
+    selection = {}
+    for name, field in schema.dump_fields.items():
+        nested = _nested_schema(field)
+        selection[name] = schema_selection(nested) if nested is not None else None
+    return selection
+
+
+def apply_include(selection, include):
+    """Keeps only the nested fields named in an ``include`` parameter value.
+
+    ``include`` is a comma separated list of nested field names, dotted for
+    deeper levels (``tags.items``). Plain fields are always kept.
+    Raises ValidationError for names that are not nested fields.
+    """
+    wanted = {}
+    for path in filter(None, (part.strip() for part in include.split(","))):
+        head, _, rest = path.partition(".")
+        wanted.setdefault(head, []).append(rest)
+
+    pruned = {}
+    for name, sub in selection.items():
+        if sub is None:
+            pruned[name] = None
+        elif name in wanted:
+            deeper = ",".join(filter(None, wanted.pop(name)))
+            pruned[name] = apply_include(sub, deeper) if deeper else sub
+    if wanted:
+        raise ma.ValidationError(
+            [f"Unknown nested field: {name}." for name in sorted(wanted)])
+    return pruned
+
+
+def apply_fields(selection, fields):
+    """Restricts levels of a selection tree to sparse fieldsets.
+
+    ``fields`` maps a dotted path of nested fields ("" for the top level) to
+    the comma separated field names to keep there. Deeper paths are applied
+    first so that ``fields[store]`` still finds ``store`` when the top level
+    is also restricted. Raises ValidationError for unknown names or paths.
+    """
+    selection = deepcopy(selection)
+    errors = []
+    for path in sorted(fields, key=lambda p: -p.count(".") if p else 1):
+        level = selection
+        for name in filter(None, path.split(".")):
+            level = level.get(name)
+            if level is None:
+                errors.append(f"Unknown nested field: {path}.")
+                break
+        if level is None:
+            continue
+        wanted = [name.strip() for name in fields[path].split(",") if name.strip()]
+        errors.extend(f"Unknown field: {'.'.join(filter(None, (path, name)))}."
+                      for name in wanted if name not in level)
+        for name in list(level):
+            if name not in wanted:
+                del level[name]
+    if errors:
+        raise ma.ValidationError(errors)
+    return selection
+
+
+def request_selection(full):
+    """Returns the selection tree asked for by the current request's query string."""
+    selection = full
+    try:
+        if "include" in request.args:
+            selection = apply_include(selection, request.args["include"])
+    except ma.ValidationError as e:
+        abort(422, errors={"query": {"include": e.messages}})
+
+    fields = {}
+    for key, value in request.args.items():
+        if key == "fields":
+            fields[""] = value
+        elif (match := FIELDS_PARAM.match(key)) is not None:
+            fields[match.group(1)] = value
+    if fields:
+        try:
+            selection = apply_fields(selection, fields)
+        except ma.ValidationError as e:
+            abort(422, errors={"query": {"fields": e.messages}})
+    return selection
+
+
+def only_paths(selection, prefix=""):
+    """Flattens a selection tree into marshmallow's dotted ``only`` notation."""
+    paths = []
+    for name, sub in selection.items():
+        if sub is None:
+            paths.append(prefix + name)
+        else:
+            nested = only_paths(sub, f"{prefix}{name}.")
+            # an empty nested selection still dumps the (empty) nested object
+            paths.extend(nested or [prefix + name])
+    return paths
+
+
+def selected_columns(model, selection):
+    """Returns the column attributes of ``model`` named in one level of a selection."""
+    columns = inspect(model).column_attrs
+    return [getattr(model, name) for name, sub in selection.items()
+            if sub is None and name in columns]
+
+
+def loader_options(model, selection, loader=None):
+    """Returns the loading options for exactly the columns and relationships in the selection.
+
+    The primary key is always loaded by SQLAlchemy, even when it is not selected.
+    """
+    options = []
+    if loader is None:
+        options.append(load_only(*selected_columns(model, selection)))
+    relationships = inspect(model).relationships
+    for name, sub in selection.items():
+        if sub is None or name not in relationships:
+            continue
+        relationship = relationships[name]
+        attribute = getattr(model, name)
+        if loader is None:
+            strategy = joinedload if relationship.direction is MANYTOONE else selectinload
+            option = strategy(attribute)
+        elif relationship.direction is MANYTOONE:
+            option = loader.joinedload(attribute)
+        else:
+            option = loader.selectinload(attribute)
+        target = relationship.mapper.class_
+        options.append(option.load_only(*selected_columns(target, sub)))
+        options.extend(loader_options(target, sub, option))
+    return options
+
+
+def _pruned_schema(schema, selection):
+    only = tuple(only_paths(selection))
+    key = (type(schema), only, schema.many)
+    if key not in _pruned_schemas:
+        _pruned_schemas[key] = type(schema)(only=only, many=schema.many)
+    return _pruned_schemas[key]
+
+
+def shape_query(query):
+    """Applies the eager loading matching the current response selection to a query.
+
+    The selection is set by the ``response`` decorator of QueryShapingMixin,
+    so the query always loads what the response schema is going to dump.
+    """
+    selection = g.get("response_selection")
+    if selection is None:
+        return query
+    model = query.column_descriptions[0]["entity"]
+    return query.options(*loader_options(model, selection))
+
+
+class QueryShapingMixin:
+    """Extend Blueprint so responses (and the view's queries) follow ``?include=`` and ``?fields=``"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prepare_doc_cbks.append(self._prepare_shaping_doc)
+
+    @staticmethod
+    def _prepare_shaping_doc(doc, doc_info, **kwargs):
+        if doc_info.get("shaping", False):
+            doc.setdefault("parameters", []).extend(SHAPING_PARAMETERS)
+        return doc
+
+    def response(self, status_code, schema=None, **kwargs):
+        """flask-smorest ``response`` decorator that records the selection of its schema
+
+        The view reads the selection through :func:`shape_query`. When the
+        client narrowed it, the result is dumped with a pruned copy of the
+        schema instead of the full one.
+        """
+        smorest_decorator = super().response(status_code, schema, **kwargs)
+        schema = resolve_schema_instance(schema)
+        full = schema_selection(schema) if schema is not None else None
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if schema is None or request.method not in SHAPED_METHODS:
+                    return func(*args, **kwargs)
+
+                selection = request_selection(full)
+                g.response_selection = selection
+
+                result = func(*args, **kwargs)
+                if selection == full:
+                    return result
+
+                result_raw, r_status_code, r_headers = unpack_tuple_response(result)
+                if isinstance(result_raw, Response):
+                    return result
+                pruned = _pruned_schema(schema, selection)
+                result_dump = pruned.dump(result_raw)
+                # flask-smorest computes ETags from this value
+                get_appcontext()["result_dump"] = result_dump
+                return jsonify(result_dump), r_status_code or status_code, r_headers
+
+            # Note the view accepts the shaping parameters in doc info
+            if full is not None and func.__name__.upper() in SHAPED_METHODS:
+                wrapper._apidoc = deepcopy(getattr(wrapper, "_apidoc", {}))
+                wrapper._apidoc["shaping"] = True
+            return smorest_decorator(wrapper)
+
+        return decorator
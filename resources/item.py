@@ -1,27 +1,70 @@
+import csv
+import io
+
+from flask import Response, current_app, request, stream_with_context
 from flask.views import MethodView
 from flask_jwt_extended import get_jwt, jwt_required
-from flask_smorest import Blueprint, abort  # type: ignore
-from sqlalchemy.exc import SQLAlchemyError
+from flask_smorest import abort  # type: ignore
+from flask_smorest.exceptions import PreconditionFailed  # type: ignore
+from marshmallow import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import undefer
 
-from db import db
-from models import ItemModel
-from schemas import ItemSchema, ItemUpdateSchema
+from blueprint import Blueprint
+from db import db, dialect_insert
+from etag_cache import touch_catalog
+from export import EXPORT_FORMATS, iter_export
+from importer import ItemImporter, iter_records
+from item_search import search_keys, search_query
+from models import ItemModel, ItemsTags, StoreModel
+from query_filters import scan_guard
+from query_shaping import shape_query
+from schemas import (ItemBulkResultSchema, ItemBulkSchema, ItemBulkUpsertResultSchema,
+                     ItemBulkUpsertSchema, ItemExportQuerySchema,
+                     ItemImportQuerySchema, ItemImportResultSchema, ItemListQuerySchema,
+                     ItemSchema, ItemSearchQuerySchema, ItemUpdateSchema)
 
 blp = Blueprint("Items", __name__, description="Operations on ITEMS.")
 
 
+def _has_tag(condition):
+    # tag_id filters select the items linked to the tag(s), through ix_items_tags_tag_id_item_id
+    return ItemModel.id.in_(select(ItemsTags.item_id).where(condition(ItemsTags.tag_id)))
+
+
+# Columns of the filterable and sortable fields of ITEM_FILTERS and ITEM_SORTS
+ITEM_COLUMNS = {
+    "id": ItemModel.id,
+    "name": ItemModel.name,
+    "price": ItemModel.price,
+    "store_id": ItemModel.store_id,
+    "tag_id": _has_tag,
+}
+
+
+def count_items():
+    """Number of items, from the store counters unless they are disabled."""
+    if current_app.config["CATALOG_COUNTERS_ENABLED"]:
+        return db.session.scalar(select(func.coalesce(func.sum(StoreModel.item_count), 0)))
+    return db.session.scalar(select(func.count()).select_from(ItemModel))
+
+
 # registers this Item class as the handler for /item/<item_id>
-@blp.route("/item/<string:item_id>")
+@blp.route("/item/<int:item_id>")
 class Item(MethodView):  # contains all HTTP methods (mapped to the methods) for /item/<item_id>
     @jwt_required()  # jwt token required to access this route and method
+    # ETag support: 304 Not Modified when the client's If-None-Match still matches
+    @blp.etag
     @blp.response(200, ItemSchema)  # updates the docs, returns status code
     # Serialize the response using ItemSchema and return HTTP 200 OK to the API client
     def get(self, item_id):
-        # get the item by its id, or return 404
-        item = ItemModel.query.get_or_404(item_id)
+        # get the item by its id (with the store and tags the response needs), or return 404
+        item = shape_query(ItemModel.query).get_or_404(item_id)
         return item
 
     @jwt_required()
+    @blp.etag  # requires an If-Match header matching the item's current ETag
     def delete(self, item_id):
 
         # using the JWT claims
@@ -33,13 +76,19 @@ class Item(MethodView):  # contains all HTTP methods (mapped to the methods) for
             abort(401, exc="Admin privilege required.")
 
         item = ItemModel.query.get_or_404(item_id)
+        # 412 Precondition Failed if the item changed since the client fetched it
+        blp.check_etag(item, ItemSchema)
         db.session.delete(item)
+        touch_catalog()
         db.session.commit()
         return {"message": "Item deleted successfully!"}
 
+    # updating requires If-Match with the current ETag, creating requires If-None-Match: *
+    @blp.etag
     @blp.arguments(ItemUpdateSchema)
     # response decorator should be nested deeper!
     @blp.response(200, ItemSchema)
+    @blp.alt_response(409, description="Another item already has that name.")
     # injected args will come first, then the url args
     def put(self, item_data, item_id):
         """
@@ -48,21 +97,90 @@ class Item(MethodView):  # contains all HTTP methods (mapped to the methods) for
         it once. The item will either be updated to the new state, or created
         if it wasn't there, but repeated calls won't create multiple items or
         cause other side effects.
+
+        With If-None-Match: * the item is created in a single
+        INSERT ... ON CONFLICT DO NOTHING, so concurrent creations of the same
+        id get a 412 rather than a failed insert. With If-Match the row is
+        locked while its ETag is compared, then updated.
         """
-        item = ItemModel.query.get(item_id)
+        try:
+            if request.if_none_match.star_tag:
+                item = create_item(item_id, item_data)
+            else:
+                item = update_item(item_id, item_data)
+            touch_catalog()
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if "name" in item_data and name_taken(item_data["name"], item_id):
+                abort(409, message="An item with that name already exists.")
+            # e.g. the store was deleted concurrently
+            abort(409, message="The item conflicts with a concurrent change, try again.")
+        return item
 
-        # check if item exist in DB
-        if item:
-            # access the columns and update the injected data
-            item.price = item_data["price"]
-            item.name = item_data["name"]
-        else:
-            # upack the dict into kwargs
-            item = ItemModel(id=item_id, **item_data)
 
-        db.session.add(item)
-        db.session.commit()
-        return item
+def name_conflicts(rows):
+    """Row errors of the upsert rows whose name belongs to another item, in the
+    table or earlier in the batch, found with one query."""
+    owners = dict(db.session.execute(
+        select(ItemModel.name, ItemModel.id).where(
+            ItemModel.name.in_({row["name"] for row in rows}))).all())
+    errors = []
+    for index, row in enumerate(rows):
+        if owners.setdefault(row["name"], row["id"]) != row["id"]:
+            errors.append({"index": index, "errors": {"name": ["An item with that name already exists."]}})
+    return errors
+
+
+def name_taken(name, item_id):
+    """Whether another item than item_id has the name, to explain a failed write."""
+    return db.session.scalar(
+        select(ItemModel.id).where(ItemModel.name == name, ItemModel.id != item_id)) is not None
+
+
+def check_store(item_data):
+    """422 if the item data moves the item to a store that does not exist, as POST /item/bulk."""
+    if "store_id" not in item_data:
+        return
+    store_id = db.session.scalar(
+        select(StoreModel.id).where(StoreModel.id == item_data["store_id"]))
+    if store_id is None:
+        abort(422, errors={"json": {"store_id": ["Store not found."]}})
+
+
+def create_item(item_id, item_data):
+    """Inserts an item with the given id in one statement, 412 if the id is taken."""
+    blp.check_etag_absent()
+    missing = [name for name in ("name", "price", "store_id") if name not in item_data]
+    if missing:
+        abort(422, errors={"json": {name: ["Missing data for required field."]
+                                    for name in missing}})
+    check_store(item_data)
+    item = db.session.scalars(
+        dialect_insert(ItemModel)
+        .values(id=item_id, **item_data)
+        .on_conflict_do_nothing(index_elements=["id"])
+        .returning(ItemModel)
+    ).one_or_none()
+    if item is None:
+        # created concurrently since the client looked
+        raise PreconditionFailed
+    return item
+
+
+def update_item(item_id, item_data):
+    """Updates the fields given of an existing item, after checking its ETag."""
+    # the row lock keeps a concurrent PUT from changing it between the check and the update
+    item = ItemModel.query.with_for_update().filter_by(id=item_id).one_or_none()
+    if item is None:
+        # If-Match cannot match an item that does not exist
+        raise PreconditionFailed
+    # the client must have seen the current version of the item
+    blp.check_etag(item, ItemSchema)
+    check_store(item_data)
+    for key, value in item_data.items():
+        setattr(item, key, value)
+    return item
 
 
 # Registers this ItemList class as the handler for /item routes
@@ -71,11 +189,24 @@ class Item(MethodView):  # contains all HTTP methods (mapped to the methods) for
 @blp.route("/item")
 class ItemList(MethodView):
     @jwt_required(fresh=True)  # this endpoint requires a fresh token
+    @blp.etag
     # many=True indicates that the response will be a list of items!
+    # ?price[gte]=&store_id=&tag_id[in]=&name[prefix]=&sort=-price,id (see query_filters.py)
+    @blp.arguments(ItemListQuerySchema, location="query")
     @blp.response(200, ItemSchema(many=True))
+    # pages the query in the sort order, use the cursor from X-Pagination / Link to get the next page
+    @blp.keyset_paginate(keys=lambda view, list_query: list_query.keys(ITEM_COLUMNS))
     # Handles GET requests to /item
-    def get(self):
-        return ItemModel.query.all()  # returns all the records in the item table
+    def get(self, list_query):
+        query = ItemModel.query.filter(*list_query.where(ITEM_COLUMNS))
+        # refuses the filter and sort combinations that would read the whole item table
+        scan_guard.check(query.order_by(*list_query.keys(ITEM_COLUMNS)), list_query,
+                         ItemModel.__tablename__, count_items)
+        # the paginator fetches only one page of the item table, shape_query adds
+        # the eager loads for the nested store and tags, and the sort columns are
+        # loaded even when ?fields= leaves them out, for the next page's cursor
+        return shape_query(query).options(
+            *(undefer(ITEM_COLUMNS[field]) for field, _ in list_query.sort))
 
     @jwt_required()
     # Validates incoming JSON against ItemSchema
@@ -91,6 +222,8 @@ class ItemList(MethodView):
         try:
             # Adds the new item object to the database session.
             db.session.add(item)
+            # Invalidates cached ETags, in the same transaction as the insert.
+            touch_catalog()
             # Saves the changes in the session to the database.
             db.session.commit()
         # Catches any SQLAlchemy-related errors during database operation.
@@ -98,3 +231,201 @@ class ItemList(MethodView):
             # Returns a 500 Internal Server Error if an issue occurs.
             abort(500, message="An error occurred while inserting the item.")
         return item  # Returns the newly created item.
+
+
+def validate_bulk_items(raw_items):
+    """Validates bulk item payloads, returning ([(index, item_data)], [row errors]).
+
+    Each row goes through ItemSchema on its own. Store existence and name
+    uniqueness (against the table and within the batch) are then checked with
+    one set-based query each instead of one query per row.
+    """
+    schema = ItemSchema()
+    valid, errors = [], []
+    for index, raw_item in enumerate(raw_items):
+        try:
+            valid.append((index, schema.load(raw_item)))
+        except ValidationError as e:
+            errors.append({"index": index, "errors": e.messages})
+
+    store_ids = {item_data["store_id"] for _, item_data in valid}
+    existing_stores = set(db.session.execute(
+        select(StoreModel.id).where(StoreModel.id.in_(store_ids))).scalars())
+    names = {item_data["name"] for _, item_data in valid}
+    taken_names = set(db.session.execute(
+        select(ItemModel.name).where(ItemModel.name.in_(names))).scalars())
+
+    accepted = []
+    for index, item_data in valid:
+        row_errors = {}
+        if item_data["store_id"] not in existing_stores:
+            row_errors["store_id"] = ["Store not found."]
+        if item_data["name"] in taken_names:
+            row_errors["name"] = ["An item with that name already exists."]
+        if row_errors:
+            errors.append({"index": index, "errors": row_errors})
+        else:
+            # later rows with the same name conflict with this one
+            taken_names.add(item_data["name"])
+            accepted.append((index, item_data))
+
+    errors.sort(key=lambda error: error["index"])
+    return accepted, errors
+
+
+@blp.route("/item/bulk")
+class ItemBulk(MethodView):
+    @jwt_required()
+    @blp.arguments(ItemBulkSchema)
+    @blp.response(201, ItemBulkResultSchema)
+    @blp.alt_response(422, description="Returned when 'atomic' is set and at least one row is invalid. Nothing is inserted.")
+    @blp.alt_response(409, description="A concurrent write created a conflicting item. Nothing is inserted, the batch can be retried.")
+    def post(self, bulk_data):
+        """Creates many items in a single transaction.
+
+        Every row is validated like a POST /item body. Valid rows are inserted
+        with multi-row INSERT statements; invalid rows are reported by their
+        position in 'items' and skipped, unless 'atomic' is set, in which case
+        any invalid row rejects the whole batch.
+        """
+        accepted, errors = validate_bulk_items(bulk_data["items"])
+        if errors and bulk_data["atomic"]:
+            abort(422, message="Some items are invalid, nothing was inserted.",
+                  errors={"items": errors})
+
+        created = []
+        if accepted:
+            try:
+                # executemany: batched multi-row INSERT ... VALUES (...), (...) statements
+                # on PostgreSQL, a single prepared statement looped in C on SQLite
+                db.session.execute(
+                    insert(ItemModel), [item_data for _, item_data in accepted])
+                # names are unique, so one query maps every inserted row to its id
+                ids_by_name = dict(db.session.execute(
+                    select(ItemModel.name, ItemModel.id).where(
+                        ItemModel.name.in_([item_data["name"] for _, item_data in accepted]))
+                ).all())
+                touch_catalog()
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                abort(409, message="A conflicting item was created concurrently, nothing was inserted.")
+            except SQLAlchemyError:
+                db.session.rollback()
+                abort(500, message="An error occurred while inserting the items.")
+            created = [{"index": index, "id": ids_by_name[item_data["name"]]}
+                       for index, item_data in accepted]
+
+        return {"created": created, "errors": errors}
+
+    @jwt_required()
+    @blp.arguments(ItemBulkUpsertSchema)
+    @blp.response(200, ItemBulkUpsertResultSchema)
+    @blp.alt_response(422, description="At least one row references a store that does not exist. Nothing is written.")
+    @blp.alt_response(409, description="An item would take the name of another item. Nothing is written.")
+    def put(self, bulk_data):
+        """Creates or replaces many items, by id, in a single statement.
+
+        Every row is written with INSERT ... ON CONFLICT (id) DO UPDATE, so
+        concurrent writers never fail on each other's inserts. Unlike
+        PUT /item/<id>, no ETag precondition is checked: the last write wins.
+        The stores are checked first with one query, as in POST /item/bulk.
+        """
+        rows = bulk_data["items"]
+        existing_stores = set(db.session.execute(
+            select(StoreModel.id).where(StoreModel.id.in_({row["store_id"] for row in rows}))
+        ).scalars())
+        errors = [{"index": index, "errors": {"store_id": ["Store not found."]}}
+                  for index, row in enumerate(rows) if row["store_id"] not in existing_stores]
+        if errors:
+            abort(422, message="Some items reference a store that does not exist, nothing was written.",
+                  errors={"items": errors})
+
+        statement = dialect_insert(ItemModel.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=["id"],
+            set_={name: statement.excluded[name] for name in ("name", "price", "store_id")},
+        ).returning(ItemModel.id)
+        try:
+            ids = db.session.execute(statement, rows).scalars().all()
+            touch_catalog()
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            errors = name_conflicts(rows)
+            if errors:
+                abort(409, message="Some items would take the name of another item, nothing was written.",
+                      errors={"items": errors})
+            abort(409, message="The items conflict with a concurrent change, nothing was written.")
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while writing the items.")
+        return {"upserted": len(ids), "ids": sorted(ids)}
+
+
+@blp.route("/item/search")
+class ItemSearch(MethodView):
+    @jwt_required()
+    @blp.arguments(ItemSearchQuerySchema, location="query")
+    @blp.response(200, ItemSchema(many=True))
+    # pages by (rank, id), the cursor carries the rank of the last item
+    @blp.keyset_paginate(keys=lambda view, query_args: search_keys(query_args["q"]))
+    def get(self, query_args):
+        """Searches the item names and descriptions, best matches first.
+
+        Every word of 'q' must appear in the item, in any inflection ("chairs"
+        finds "chair"). The lookup goes through the full-text index of the
+        database (see item_search.py), not a scan of the items.
+        """
+        return shape_query(search_query(query_args["q"]))
+
+
+@blp.route("/item/export")
+class ItemExport(MethodView):
+    @jwt_required()
+    @blp.arguments(ItemExportQuerySchema, location="query")
+    @blp.alt_response(200, description="The whole item catalog, as NDJSON or CSV.", success=True)
+    def get(self, query_args):
+        """Streams every item with its store name and tag names.
+
+        The body is generated chunk by chunk from a server-side cursor, so the
+        download starts immediately and memory use does not grow with the catalog.
+        """
+        export_format = query_args["format"]
+        return Response(
+            stream_with_context(iter_export(export_format)),
+            mimetype=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f"attachment; filename=items.{export_format}"},
+        )
+
+
+@blp.route("/item/import")
+class ItemImport(MethodView):
+    @jwt_required()
+    @blp.arguments(ItemImportQuerySchema, location="query")
+    @blp.response(200, ItemImportResultSchema)
+    @blp.alt_response(400, description="The body is not valid UTF-8 or not valid CSV. The message gives the committed count to pass as 'skip' when uploading again.")
+    @blp.alt_response(500, description="A chunk failed. The message gives the committed count to pass as 'skip' when uploading again.")
+    def post(self, query_args):
+        """Imports items from an NDJSON or CSV request body.
+
+        The body (the same format as GET /item/export) is parsed while it is
+        uploaded and committed every 'commit_size' records, creating missing
+        stores and tags by name. Items whose name already exists are counted
+        as duplicates, so a failed upload can be sent again as is, or from
+        'skip' records on.
+        """
+        stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+        importer = ItemImporter(commit_size=query_args["commit_size"])
+        try:
+            summary = importer.run(iter_records(stream, query_args["format"]),
+                                   skip=query_args["skip"])
+        except (UnicodeDecodeError, csv.Error) as e:
+            committed = importer.summary.committed
+            abort(400, message=f"The body could not be parsed ({e}) after {committed} committed "
+                               f"records, upload it again fixed with skip={committed}.")
+        except SQLAlchemyError:
+            committed = importer.summary.committed
+            abort(500, message=f"The import failed after {committed} committed records, "
+                               f"upload again with skip={committed}.")
+        return summary.as_dict()
@@ -0,0 +1,15 @@
+from flask.views import MethodView
+
+from blueprint import Blueprint
+from models import JobModel
+from schemas import JobSchema
+
+blp = Blueprint("Jobs", __name__, description="Status of background jobs.")
+
+
+@blp.route("/job/<string:job_id>")
+class Job(MethodView):
+    @blp.response(200, JobSchema)
+    def get(self, job_id):
+        """Returns the status and progress of a background job, e.g. a store deletion."""
+        return JobModel.query.get_or_404(job_id)
@@ -0,0 +1,18 @@
+from flask.views import MethodView
+
+import metrics
+from blueprint import Blueprint
+
+blp = Blueprint("Monitoring", __name__, description="Service metrics.")
+
+
+@blp.route("/metrics")
+class Metrics(MethodView):
+    @blp.alt_response(200, description="Metrics in the Prometheus text format.", success=True)
+    def get(self):
+        """Returns request, DB pool, revocation cache and password hashing metrics.
+
+        Under gunicorn with PROMETHEUS_MULTIPROC_DIR set, the values are summed
+        over all worker processes.
+        """
+        return metrics.render()
@@ -1,10 +1,21 @@
+from flask import current_app, url_for
 from flask.views import MethodView
-from flask_smorest import Blueprint, abort  # type: ignore
+from flask_smorest import abort  # type: ignore
+from flask_smorest.exceptions import PreconditionFailed  # type: ignore
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
+from blueprint import Blueprint
 from db import db
-from models import StoreModel
-from schemas import StoreSchema
+from etag_cache import touch_catalog
+from jobs import job_runner
+from metrics import TAG_INDEX_LOOKUPS
+from models import ItemModel, StoreModel, TagModel
+from query_shaping import shape_query
+from schemas import (ItemSchema, JobSchema, PlainStoreSchema, StoreItemsQuerySchema,
+                     StoreSchema, StoreSummarySchema)
+from store_deletion import count_store_items, delete_store
+from tag_index import tag_index, tagged_items
 
 # blueprint object for routes related to STORES
 blp = Blueprint("Stores", __name__, description="Operations on STORES.")
@@ -12,23 +23,141 @@ blp = Blueprint("Stores", __name__, description="Operations on STORES.")
 
 @blp.route("/store/<string:store_id>")
 class Store(MethodView):  # this class contains all the HTTP methods for /store/<store_id>
+    @blp.etag
     @blp.response(200, StoreSchema)
     def get(self, store_id):  # handles GET at /store/<store_id>
-        store = StoreModel.query.get_or_404(store_id)
+        store = shape_query(StoreModel.query).get_or_404(store_id)
         return store
 
+    @blp.etag  # requires an If-Match header matching the store's current ETag
+    @blp.alt_response(202, schema=JobSchema, description="The store is large, it is deleted by a background job. Poll the Location URL for its status.")
+    @blp.alt_response(412, description="If-Match does not hold the current ETag. For a large store the message names the ETag required.")
     def delete(self, store_id):  # handles DELETE at /store/<store_id>
+        """
+        If-Match takes the ETag of GET /store/<store_id>?fields=id,name, or
+        for a store below the background job threshold that of the full GET.
+        """
+        store = StoreModel.query.get_or_404(store_id)
+        # counted before the ETag check, so a large store's items are never read in the request
+        if current_app.config["CATALOG_COUNTERS_ENABLED"]:
+            item_count = store.item_count
+        else:
+            item_count = count_store_items(store.id)
+        large = item_count >= current_app.config["STORE_DELETE_ASYNC_THRESHOLD"]
+        check_store_etag(store, full=not large)
+
+        # set-based DELETEs of links, items, tags, then the store (see store_deletion.py)
+        if not large:
+            delete_store(store.id)
+            return {"message": "Store deleted successfully!"}
+
+        job = job_runner.submit("delete_store", store.id, delete_store_job, store.id)
+        location = url_for("Jobs.Job", job_id=job.id)
+        return JobSchema().dump(job), 202, {"Location": location}
+
+
+def check_store_etag(store, full):
+    """412 unless If-Match holds the ETag of the store's id and name, or with ``full``
+    that of its whole StoreSchema dump (two more queries, for its items and tags).
+
+    Without ``full`` the 412 message names the ETag to send, since a client
+    holding the ETag of the full GET cannot tell a stale ETag from the wrong one.
+    """
+    try:
+        blp.check_etag(store, PlainStoreSchema)
+    except PreconditionFailed:
+        if not full:
+            path = url_for("Stores.Store", store_id=store.id)
+            abort(412, message=f"The store is large, If-Match must hold the ETag of "
+                               f"GET {path}?fields=id,name.")
+        blp.check_etag(store, StoreSchema)
+
+
+@blp.route("/store/<string:store_id>/summary")
+class StoreSummary(MethodView):
+    @blp.etag
+    @blp.response(200, StoreSummarySchema)
+    def get(self, store_id):
+        """Item and tag counts and price statistics of a store, without its item list."""
+        store = StoreModel.query.get_or_404(store_id)
+        return store_summary(store)
+
+
+@blp.route("/store/<string:store_id>/items")
+class StoreItems(MethodView):
+    @blp.etag
+    @blp.arguments(StoreItemsQuerySchema, location="query")
+    @blp.response(200, ItemSchema(many=True))
+    @blp.keyset_paginate(pass_parameters=True)
+    def get(self, query_args, store_id, keyset_parameters):
+        """Items of a store, or those of its items carrying all (or any) of a set of tags."""
         store = StoreModel.query.get_or_404(store_id)
-        db.session.delete(store)  # passing the instance to delete from the DB
-        db.session.commit()
-        return {"message": "Store deleted successfully!"}
+        items = shape_query(ItemModel.query).filter(ItemModel.store_id == store.id)
+        tag_ids = query_args.get("tags")
+        if not tag_ids:
+            return items
+        match_all = query_args["match"] == "all"
+
+        # the page is in id order, the cursor holds the last id
+        cursor = keyset_parameters.cursor
+        after = 0 if cursor is None else cursor[0] if (
+            len(cursor) == 1 and type(cursor[0]) is int) else None
+        found = None
+        if after is not None:
+            # one id more than the page, so the pager sees whether there is a next page
+            found = tag_index.lookup(tag_ids, match_all, store.id, after,
+                                     keyset_parameters.limit + 1, keyset_parameters.count)
+        if found is None:
+            TAG_INDEX_LOOKUPS.labels("sql").inc()
+            return items.filter(ItemModel.id.in_(tagged_items(tag_ids, match_all)))
+
+        TAG_INDEX_LOOKUPS.labels("index").inc()
+        ids, keyset_parameters.item_count = found
+        return items.filter(ItemModel.id.in_(ids))
+
+
+def store_summary(store):
+    """Computes the StoreSummarySchema data of a store in the database."""
+    of_store = ItemModel.store_id == store.id
+    # separate subqueries, so each is a single probe of the (store_id, price) index
+    min_price, max_price = db.session.execute(select(
+        select(func.min(ItemModel.price)).where(of_store).scalar_subquery(),
+        select(func.max(ItemModel.price)).where(of_store).scalar_subquery(),
+    )).one()
+
+    if current_app.config["CATALOG_COUNTERS_ENABLED"]:
+        item_count, tag_count = store.item_count, store.tag_count
+        avg_price = store.price_sum / item_count if item_count else None
+    else:
+        item_count, avg_price = db.session.execute(
+            select(func.count(), func.avg(ItemModel.price)).where(of_store)).one()
+        tag_count = db.session.scalar(
+            select(func.count()).select_from(TagModel).where(TagModel.store_id == store.id))
+
+    return {
+        "id": store.id,
+        "name": store.name,
+        "item_count": item_count,
+        "tag_count": tag_count,
+        "min_price": min_price,
+        "max_price": max_price,
+        "avg_price": avg_price,
+    }
+
+
+def delete_store_job(report, store_id):
+    delete_store(store_id, batch_size=current_app.config["STORE_DELETE_BATCH_SIZE"],
+                 on_progress=report)
 
 
 @blp.route("/store")
 class StoreList(MethodView):  # contains all the HTTP methods for /store
+    @blp.etag
     @blp.response(200, StoreSchema(many=True))
+    @blp.keyset_paginate()
     def get(self):  # handles GET at /store
-        return StoreModel.query.all()  # returns all the records of the store table
+        # the paginator fetches one page of the store table, with its items and tags eager loaded
+        return shape_query(StoreModel.query)
 
     # deserialized data will be injected by the StoreSchema!
     @blp.arguments(StoreSchema)
@@ -39,6 +168,7 @@ class StoreList(MethodView):  # contains all the HTTP methods for /store
 
         try:
             db.session.add(store)
+            touch_catalog()
             db.session.commit()
         except IntegrityError:
             abort(400, exc="A store with that name already exists.")
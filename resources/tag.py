@@ -1,26 +1,33 @@
+from flask import current_app
 from flask.views import MethodView
-from flask_smorest import Blueprint, abort  # type: ignore
+from flask_smorest import abort  # type: ignore
+from sqlalchemy import delete, select, tuple_
 from sqlalchemy.exc import SQLAlchemyError
 
-from db import db
-from models import ItemModel, StoreModel, TagModel
-from schemas import TagAndItemSchema, TagSchema
+from blueprint import Blueprint
+from db import db, dialect_insert
+from etag_cache import touch_catalog
+from models import ItemModel, ItemsTags, StoreModel, TagModel
+from query_shaping import shape_query
+from schemas import (TagAndItemSchema, TagLinksResultSchema, TagLinksSchema,
+                     TagSchema)
 
 blp = Blueprint("Tags", "tags", description="Operations on Tags")
 
 
 @blp.route("/store/<string:store_id>/tags")
 class TagsInStore(MethodView):
+    @blp.etag
     @blp.response(200, TagSchema(many=True))
+    @blp.keyset_paginate()
     def get(self, store_id):
         """
         List of tags that are created under a store.
         """
 
         store = StoreModel.query.get_or_404(store_id)
-        # Accesses the 'tags' related to the fetched 'store' and retrieves all of them.
-        # This works because of the 'tags' relationship defined in the StoreModel. (lazy=dynamic is also set)
-        return store.tags.all()
+        # Queries the tags created under the fetched 'store', the paginator fetches one page of it.
+        return shape_query(TagModel.query.filter_by(store_id=store.id))
 
     @blp.arguments(TagSchema)
     @blp.response(200, TagSchema)
@@ -32,6 +39,7 @@ class TagsInStore(MethodView):
 
         try:
             db.session.add(tag)
+            touch_catalog()
             db.session.commit()
         except SQLAlchemyError as e:
             abort(500, exc=str(e))
@@ -46,12 +54,14 @@ class LinkTagsToItem(MethodView):
         """Links/adds a tag to an item"""
         item = ItemModel.query.get_or_404(item_id)
         tag = TagModel.query.get_or_404(tag_id)
-        # Appends the fetched tag to the item's list of tags.
+        # Appends the fetched tag to the item's list of tags (once, links are unique).
         # This works due to the many-to-many relationship defined in the models.
-        item.tags.append(tag)
+        if tag not in item.tags:
+            item.tags.append(tag)
 
         try:
             db.session.add(item)
+            touch_catalog()
             db.session.commit()
         except SQLAlchemyError:
             abort(500, exc="An error occured while inserting the tag.")
@@ -68,6 +78,7 @@ class LinkTagsToItem(MethodView):
 
         try:
             db.session.add(item)
+            touch_catalog()
             db.session.commit()
         except SQLAlchemyError:
             abort(500, exc="An error occured while removing the tag from the item.")
@@ -81,13 +92,16 @@ class LinkTagsToItem(MethodView):
 
 @blp.route("/tag/<string:tag_id>")
 class Tag(MethodView):
+    @blp.etag
     @blp.response(200, TagSchema)
     def get(self, tag_id):
         """Lists details of a particular tag"""
-        tag = TagModel.query.get_or_404(tag_id)
+        tag = shape_query(TagModel.query).get_or_404(tag_id)
 
         return tag
 
+    # Requires an If-Match header matching the tag's current ETag.
+    @blp.etag
     # Decorator for the DELETE method: Specifies a 202 Accepted response if deletion is successful.
     # It also includes a description and an example for the API documentation.
     @blp.response(
@@ -105,10 +119,106 @@ class Tag(MethodView):
     def delete(self, tag_id):
         """Deletes a particular tag from the DB"""
         tag = TagModel.query.get_or_404(tag_id)
+        # checked before the ETag, whose TagSchema dump would load every item of the tag
+        if tag_in_use(tag):
+            abort(400, exc="Could not delete tag. Make sure the tag is not associated with any items before trying again.")
+        blp.check_etag(tag, TagSchema)
+
+        db.session.delete(tag)
+        touch_catalog()
+        db.session.commit()
+        return {"message": "Tag deleted."}
+
+
+def tag_in_use(tag):
+    """Tells whether any item carries the tag, without loading its items."""
+    if current_app.config["CATALOG_COUNTERS_ENABLED"]:
+        return tag.item_count > 0
+    return db.session.scalar(
+        select(ItemsTags.id).where(ItemsTags.tag_id == tag.id).limit(1)) is not None
+
+
+# Pairs per DELETE statement, keeps the bound parameter count well below SQLite's limit
+UNLINK_CHUNK_SIZE = 500
+
+
+def requested_pairs(links_data):
+    """Flattens both request forms into a sorted list of unique (item_id, tag_id) pairs."""
+    pairs = {(pair["item_id"], pair["tag_id"]) for pair in links_data.get("pairs", [])}
+    if "tag_id" in links_data:
+        pairs.update((item_id, links_data["tag_id"]) for item_id in links_data["item_ids"])
+    return sorted(pairs)
+
 
-        if not tag.items:
-            db.session.delete(tag)
+@blp.route("/tag/links")
+class TagLinks(MethodView):
+    @blp.arguments(TagLinksSchema)
+    @blp.response(200, TagLinksResultSchema)
+    def post(self, links_data):
+        """Links many tags to many items in one statement.
+
+        Item and tag existence is checked with one query each. Pairs that
+        reference a missing item or tag are skipped and reported, and links
+        that already exist are skipped by the database (ON CONFLICT DO NOTHING).
+        """
+        pairs = requested_pairs(links_data)
+        item_ids = {item_id for item_id, _ in pairs}
+        tag_ids = {tag_id for _, tag_id in pairs}
+        found_items = set(db.session.execute(
+            select(ItemModel.id).where(ItemModel.id.in_(item_ids))).scalars())
+        found_tags = set(db.session.execute(
+            select(TagModel.id).where(TagModel.id.in_(tag_ids))).scalars())
+
+        rows = [{"item_id": item_id, "tag_id": tag_id} for item_id, tag_id in pairs
+                if item_id in found_items and tag_id in found_tags]
+        count = 0
+        if rows:
+            try:
+                result = db.session.execute(
+                    dialect_insert(ItemsTags.__table__).on_conflict_do_nothing(
+                        index_elements=["item_id", "tag_id"]),
+                    rows,
+                )
+                count = result.rowcount
+                touch_catalog()
+                db.session.commit()
+            except SQLAlchemyError:
+                db.session.rollback()
+                abort(500, exc="An error occured while linking the tags.")
+
+        return {
+            "message": "Tags linked to items.",
+            "count": count,
+            "missing_item_ids": sorted(item_ids - found_items),
+            "missing_tag_ids": sorted(tag_ids - found_tags),
+        }
+
+    @blp.arguments(TagLinksSchema)
+    @blp.response(200, TagLinksResultSchema)
+    def delete(self, links_data):
+        """Unlinks many tags from many items with set-based DELETEs."""
+        count = 0
+        try:
+            if "tag_id" in links_data:
+                # one tag off many items: a plain IN list on item_id
+                count += db.session.execute(
+                    delete(ItemsTags).where(
+                        ItemsTags.tag_id == links_data["tag_id"],
+                        ItemsTags.item_id.in_(links_data["item_ids"]),
+                    )
+                ).rowcount
+            pairs = sorted({(pair["item_id"], pair["tag_id"])
+                            for pair in links_data.get("pairs", [])})
+            for start in range(0, len(pairs), UNLINK_CHUNK_SIZE):
+                chunk = pairs[start:start + UNLINK_CHUNK_SIZE]
+                count += db.session.execute(
+                    delete(ItemsTags).where(
+                        tuple_(ItemsTags.item_id, ItemsTags.tag_id).in_(chunk))
+                ).rowcount
+            touch_catalog()
             db.session.commit()
-            return {"message": "Tag deleted."}
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, exc="An error occured while unlinking the tags.")
 
-        abort(400, exc="Could not delete tag. Make sure the tag is not associated with any items before trying again.")
+        return {"message": "Tags unlinked from items.", "count": count}
@@ -1,20 +1,31 @@
 from flask.views import MethodView
 from flask_jwt_extended import (create_access_token, create_refresh_token,
                                 get_jwt, get_jwt_identity, jwt_required)
-from flask_smorest import Blueprint, abort  # type: ignore
-from passlib.hash import pbkdf2_sha256  # type: ignore
+from flask_smorest import abort  # type: ignore
 from sqlalchemy.exc import SQLAlchemyError
 
+from blocklist import add_to_blocklist, revocation_cache
+from blueprint import Blueprint
 from db import db
-from models import JWTBlocklist, UserModel
+from models import UserModel
+from password_hashing import HashingBusy, password_hasher
 from schemas import UserSchema
 
 blp = Blueprint("Users", "users", "Operations on API users.")
 
+# Seconds a client should wait before retrying when the hashing pool is full
+HASHING_RETRY_AFTER = 1
+
+
+def abort_hashing_busy():
+    abort(503, message="Too many logins in progress, try again shortly.",
+          headers={"Retry-After": str(HASHING_RETRY_AFTER)})
+
 
 @blp.route("/register")
 class UserRegister(MethodView):
     @blp.arguments(UserSchema)
+    @blp.alt_response(503, description="The password hashing pool is saturated, retry after the Retry-After delay.")
     def post(self, user_data):
 
         # check if user exists in DB
@@ -23,11 +34,15 @@ class UserRegister(MethodView):
             # with the current state of the resource (e.g., username already exists).
             abort(409, exc="A user with that name already exists.")
 
-        # if not, then hash pw and insert into DB
+        # if not, then hash pw (in the hashing pool) and insert into DB
+        try:
+            password_hash = password_hasher.hash(user_data["password"])
+        except HashingBusy:
+            abort_hashing_busy()
 
         user = UserModel(
             username=user_data["username"],
-            password=pbkdf2_sha256.hash(user_data["password"]),
+            password=password_hash,
         )
 
         db.session.add(user)
@@ -70,6 +85,7 @@ class UserLogin(MethodView):
     and a refresh token.
     """
     @blp.arguments(UserSchema)  # Expects user data matching the UserSchema (typically username and password)
+    @blp.alt_response(503, description="The password hashing pool is saturated, retry after the Retry-After delay.")
     def post(self, user_data):
         """Authenticates a user and returns JWT tokens.
 
@@ -85,6 +101,7 @@ class UserLogin(MethodView):
         Raises:
             401 Unauthorized: If the provided credentials are invalid (user not found
                               or password does not match).
+            503 Service Unavailable: If the password hashing pool is saturated.
         """
         # Find the user in the database by their username.
         user = UserModel.query.filter(
@@ -92,7 +109,20 @@ class UserLogin(MethodView):
         ).first()
 
         # Verify if the user exists and if the provided password matches the stored hash.
-        if user and pbkdf2_sha256.verify(user_data["password"], user.password):
+        # The check runs in the hashing pool; it also tells whether the hash predates
+        # the current rounds policy, in which case the fresh hash replaces it.
+        matches = False
+        if user:
+            try:
+                matches, new_hash = password_hasher.verify(
+                    user_data["password"], user.password)
+            except HashingBusy:
+                abort_hashing_busy()
+            if matches and new_hash is not None:
+                user.password = new_hash
+                db.session.commit()
+
+        if matches:
             # If authentication is successful, create a new JWT access token.
             # The 'identity' for the token is set to the user's ID (converted to a string).
             # 'fresh=True' indicates this token was generated from a direct login.
@@ -115,11 +145,10 @@ class UserLogin(MethodView):
 class UserLogout(MethodView):
     @jwt_required()
     def post(self):
-        jti = get_jwt()["jti"]  # get the JWT ID claim from the token
-        blocked_jwt = JWTBlocklist(jti=jti)
+        jwt = get_jwt()
         try:
-            db.session.add(blocked_jwt)
-            db.session.commit()
+            # the JWT ID claim identifies the token, 'exp' tells when its row can be pruned
+            add_to_blocklist(jwt["jti"], jwt["exp"])
             return {"message": "Logout successful"}
         except SQLAlchemyError as e:
             abort(400, exc=str(e))
@@ -161,18 +190,38 @@ class TokenRefresh(MethodView):
 
         # Get the JTI (JWT ID) of the refresh token that was just used.
         # This JTI will be added to the blocklist to invalidate the refresh token.
-        used_refresh_token_jti = get_jwt()["jti"]
-
-        # Create a JWTBlocklist entry for the used refresh token.
-        blocklisted_refresh_token = JWTBlocklist(jti=used_refresh_token_jti)
+        used_refresh_token = get_jwt()
 
         try:
-            # Add the blocklist entry to the database session and commit.
-            db.session.add(blocklisted_refresh_token)
-            db.session.commit()
+            # Add a blocklist entry for the used refresh token and commit.
+            # Its expiry is stored so the entry can be pruned once it is useless.
+            add_to_blocklist(
+                used_refresh_token["jti"], used_refresh_token["exp"])
         except SQLAlchemyError as e:
             abort(
                 400, exc=f"Database error while blocklisting token: {str(e)}")
 
         # Return the new access token.
         return {"access_token": new_access_token}, 200
+
+
+@blp.route("/blocklist/stats")
+class BlocklistStats(MethodView):
+    @jwt_required()
+    def get(self):
+        """Reports the hit/miss counters of this worker's revocation cache."""
+        if not get_jwt().get("is_admin"):
+            abort(401, exc="Admin privilege required.")
+
+        return revocation_cache.stats()
+
+
+@blp.route("/password-hashing/stats")
+class PasswordHashingStats(MethodView):
+    @jwt_required()
+    def get(self):
+        """Reports the settings, hash latency and queue wait of this worker's hashing pool."""
+        if not get_jwt().get("is_admin"):
+            abort(401, exc="Admin privilege required.")
+
+        return password_hasher.stats()
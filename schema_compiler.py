@@ -0,0 +1,152 @@
+"""
+Compiled dump functions for the marshmallow schemas.
+
+Schema.dump() walks dump_fields for every object it serializes: per field a
+get_value() through the schema's accessor, a missing check, the field's
+_serialize() and a data_key lookup, and for a nested field another dump()
+through the same machinery. Dumping an item with its store and tags takes a
+few dozen Python calls. CompiledSchema.dump() runs a function generated for
+the schema instance instead (once, on its first dump): the attribute reads
+are inlined into one dict literal, values that already have the field's type
+are passed through as they are, and nested schemas are dumped by their own
+generated function.
+
+The output stays exactly marshmallow's:
+
+- a value of another type (None, a Decimal for a Float, a str subclass) goes
+  through the field's own _serialize()
+- an object the generated code cannot read the way marshmallow does (a
+  mapping, which marshmallow reads by key, or an object missing an attribute,
+  which marshmallow leaves out or replaces by the field's dump_default) is
+  dumped by marshmallow
+- a schema using anything else (dump hooks, other field types, dotted
+  attributes, as_string, a custom get_attribute) is not compiled at all
+
+Nested schemas are compiled too, whatever their class, when they qualify.
+``python benchmarks/schema_dump.py`` checks the parity on seeded data and
+times both paths. COMPILED_SCHEMAS_ENABLED=false turns the compiled path off.
+"""
+
+import keyword
+import threading
+
+import marshmallow as ma
+from marshmallow import fields
+
+# Fields whose dumped value is the attribute itself when it has this exact type
+_PASSTHROUGH_TYPES = {fields.Integer: int, fields.Float: float, fields.String: str}
+
+
+class SchemaCompiler:
+    """Generates and caches the dump function of each schema instance."""
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault("COMPILED_SCHEMAS_ENABLED", True)
+
+    def dumper(self, schema):
+        """Returns the compiled ``dump(obj, many)`` of a schema instance, None when it has none."""
+        try:
+            return schema.__dict__["_compiled_dump"]
+        except KeyError:
+            pass
+        with self._lock:
+            if "_compiled_dump" not in schema.__dict__:
+                one = compile_schema(schema)
+                schema._compiled_dump = None if one is None else _with_many(one)
+        return schema._compiled_dump
+
+
+def _with_many(one):
+    def dump(obj, many=True):
+        if many and obj is not None:
+            return [one(item) for item in obj]
+        return one(obj)
+    return dump
+
+
+def _compilable(schema):
+    """Tells whether the schema dumps through marshmallow's plain per-field loop."""
+    cls = type(schema)
+    return (not any(schema._hooks[tag] for tag in (ma.decorators.PRE_DUMP, ma.decorators.POST_DUMP))
+            and cls._serialize is ma.Schema._serialize
+            and cls.get_attribute is ma.Schema.get_attribute
+            and cls.dump in (ma.Schema.dump, CompiledSchema.dump)
+            and schema.dict_class is dict)
+
+
+def _nested_dumper(schema, active, many=False):
+    """Returns a function dumping a nested object (a collection with ``many``)."""
+    # a schema nesting itself ("self", or through another schema) keeps marshmallow's dump there
+    one = None if type(schema) in active else compile_schema(schema, active)
+    if one is None:
+        return lambda obj: schema.dump(obj, many=many)
+    return _with_many(one) if many else one
+
+
+def compile_schema(schema, active=frozenset()):
+    """Generates the function dumping one object with ``schema``, None when it does not qualify."""
+    if not _compilable(schema):
+        return None
+    active = active | {type(schema)}
+
+    namespace = {"generic": lambda obj: ma.Schema.dump(schema, obj, many=False)}
+    reads, items = [], []
+    for index, (name, field) in enumerate(schema.dump_fields.items()):
+        attribute = name if field.attribute is None else field.attribute
+        if (not attribute.isidentifier() or keyword.iskeyword(attribute)
+                or not field._CHECK_ATTRIBUTE):
+            return None
+        key = name if field.data_key is None else field.data_key
+        value = f"v{index}"
+
+        if type(field) in _PASSTHROUGH_TYPES and not getattr(field, "as_string", False):
+            namespace[f"t{index}"] = _PASSTHROUGH_TYPES[type(field)]
+            namespace[f"f{index}"] = field._serialize
+            expression = (f"{value} if {value}.__class__ is t{index} "
+                          f"else f{index}({value}, {name!r}, obj)")
+        elif type(field) is fields.Nested:
+            nested = field.schema
+            namespace[f"n{index}"] = _nested_dumper(nested, active, nested.many or field.many)
+            expression = f"None if {value} is None else n{index}({value})"
+        elif (type(field) is fields.List and type(field.inner) is fields.Nested
+              and not field.inner.many and not field.inner.schema.many):
+            namespace[f"n{index}"] = _nested_dumper(field.inner.schema, active)
+            expression = (f"None if {value} is None else "
+                          f"[None if x is None else n{index}(x) for x in {value}]")
+        else:
+            return None
+        reads.append(f"        {value} = obj.{attribute}")
+        items.append(f"        {key!r}: {expression},")
+
+    source = "\n".join([
+        "def dump_one(obj):",
+        "    if obj is None or hasattr(obj, '__getitem__'):",
+        "        return generic(obj)",
+        "    try:",
+        *(reads or ["        pass"]),
+        "    except AttributeError:",
+        "        return generic(obj)",
+        "    return {",
+        *items,
+        "    }",
+    ])
+    exec(compile(source, f"<compiled {type(schema).__name__}>", "exec"), namespace)
+    return namespace["dump_one"]
+
+
+schema_compiler = SchemaCompiler()
+
+
+class CompiledSchema(ma.Schema):
+    """Schema whose dump() runs a generated function, see the module docstring."""
+
+    def dump(self, obj, *, many=None):
+        if schema_compiler.enabled:
+            dump = schema_compiler.dumper(self)
+            if dump is not None:
+                return dump(obj, self.many if many is None else bool(many))
+        return super().dump(obj, many=many)
@@ -1,8 +1,15 @@
-from marshmallow import Schema, fields
+from marshmallow import (EXCLUDE, Schema, ValidationError, fields, validate,
+                         validates_schema)
 
+from webargs.fields import DelimitedList
 
+from query_filters import filter_schema
+from schema_compiler import CompiledSchema
+
+
+# The response schemas of the catalog dump through generated functions (see schema_compiler.py).
 # Defines the basic schema for an item, used for creating or displaying an item without store relationship details.
-class PlainItemSchema(Schema):
+class PlainItemSchema(CompiledSchema):
     # Item ID: Read-only, only included when serializing (Python object -> JSON).
     id = fields.Int(dump_only=True)
     # Item name: Required field for both input (JSON -> Python object) and output.
@@ -12,14 +19,14 @@ class PlainItemSchema(Schema):
 
 
 # Defines the basic schema for a store, used for displaying a store without its list of items.
-class PlainStoreSchema(Schema):
+class PlainStoreSchema(CompiledSchema):
     # Store ID: Read-only, only included when serializing.
     id = fields.Int(dump_only=True)
     # Store name: Required field for input and output.
     name = fields.Str(required=True)
 
 
-class PlainTagSchema(Schema):
+class PlainTagSchema(CompiledSchema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True)
 
@@ -32,6 +39,20 @@ class ItemSchema(PlainItemSchema):
     store = fields.Nested(PlainStoreSchema(), dump_only=True)
     tags = fields.List(fields.Nested(PlainTagSchema()), dump_only=True)
 
+
+# Filters and sort keys of GET /item (see query_filters.py): the operators each
+# field may be filtered with, and the fields the list may be sorted by. Every
+# one is served by an index of items or items_tags, tag_id means "has this tag".
+ITEM_FILTERS = {
+    "price": (fields.Float, ("eq", "gt", "gte", "lt", "lte")),
+    "store_id": (fields.Int, ("eq", "in")),
+    "tag_id": (fields.Int, ("eq", "in")),
+    "name": (fields.Str, ("eq", "prefix")),
+}
+ITEM_SORTS = ("id", "name", "price", "store_id")
+ItemListQuerySchema = filter_schema("ItemListQuerySchema", ITEM_FILTERS, ITEM_SORTS,
+                                    unique=("id", "name"))
+
 # Defines the schema for updating an existing item. Allows partial updates (name or price or both).
 
 
@@ -50,17 +71,181 @@ class StoreSchema(PlainStoreSchema):
     tags = fields.List(fields.Nested(PlainTagSchema()), dump_only=True)
 
 
+# Counts and price aggregates of a store's catalog, the prices are None without items.
+class StoreSummarySchema(Schema):
+    id = fields.Int(dump_only=True)
+    name = fields.Str(dump_only=True)
+    item_count = fields.Int(dump_only=True)
+    tag_count = fields.Int(dump_only=True)
+    min_price = fields.Float(dump_only=True)
+    max_price = fields.Float(dump_only=True)
+    avg_price = fields.Float(dump_only=True)
+
+
+# Query string of a store's item list, optionally narrowed to a set of tags (see tag_index.py).
+class StoreItemsQuerySchema(Schema):
+    tags = DelimitedList(fields.Int(), validate=validate.Length(min=1, max=50),
+                         metadata={"description": "Comma separated tag ids."})
+    # "all": items carrying every tag, "any": items carrying at least one.
+    match = fields.Str(load_default="all", validate=validate.OneOf(["all", "any"]))
+
+
 class TagSchema(PlainTagSchema):
     store_id = fields.Int(load_only=True)
     items = fields.List(fields.Nested(PlainItemSchema()), dump_only=True)
     store = fields.Nested(PlainStoreSchema(), dump_only=True)
 
 
-class TagAndItemSchema(Schema):
+class TagAndItemSchema(CompiledSchema):
     message = fields.Str()
     item = fields.Nested(ItemSchema)
     tag = fields.Nested(TagSchema)
 
+
+# Bulk item creation: each entry of 'items' is validated against ItemSchema one by one,
+# so that one bad row is reported on its own instead of rejecting the whole request.
+class ItemBulkSchema(Schema):
+    items = fields.List(fields.Dict(), required=True,
+                        validate=validate.Length(min=1, max=10000))
+    # When true, any row error rejects the whole batch and nothing is inserted.
+    atomic = fields.Bool(load_default=False)
+
+
+# Position of a row in the request and what went wrong with it.
+class BulkRowErrorSchema(Schema):
+    index = fields.Int()
+    errors = fields.Dict()
+
+
+class BulkCreatedSchema(Schema):
+    index = fields.Int()
+    id = fields.Int()
+
+
+class ItemBulkResultSchema(Schema):
+    created = fields.List(fields.Nested(BulkCreatedSchema()))
+    errors = fields.List(fields.Nested(BulkRowErrorSchema()))
+
+# One record of a bulk import file. Stores and tags are given by name (or the
+# store by id); the id and store_name columns of an export are accepted and ignored.
+class ItemImportRecordSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    name = fields.Str(required=True, validate=validate.Length(min=1, max=80))
+    price = fields.Float(required=True)
+    description = fields.Str(allow_none=True)
+    store_id = fields.Int()
+    store_name = fields.Str(validate=validate.Length(min=1, max=80))
+    tags = fields.List(fields.Str(validate=validate.Length(min=1, max=80)),
+                       load_default=list)
+
+
+# Query string of the streaming item import.
+class ItemImportQuerySchema(Schema):
+    format = fields.Str(load_default="ndjson",
+                        validate=validate.OneOf(["ndjson", "csv"]))
+    # Records committed per transaction.
+    commit_size = fields.Int(load_default=5000,
+                             validate=validate.Range(min=1, max=100000))
+    # Resume after this many records, the 'committed' count of a failed run.
+    skip = fields.Int(load_default=0, validate=validate.Range(min=0))
+
+
+class ImportRecordErrorSchema(Schema):
+    record = fields.Int()
+    errors = fields.Dict()
+
+
+class ItemImportResultSchema(Schema):
+    records = fields.Int()
+    committed = fields.Int()
+    inserted = fields.Int()
+    duplicates = fields.Int()
+    invalid = fields.Int()
+    records_per_second = fields.Float()
+    errors = fields.List(fields.Nested(ImportRecordErrorSchema()))
+
+
+# A full item, id included, for bulk create-or-replace.
+class ItemUpsertSchema(Schema):
+    id = fields.Int(required=True, validate=validate.Range(min=1))
+    name = fields.Str(required=True)
+    price = fields.Float(required=True)
+    store_id = fields.Int(required=True)
+
+
+class ItemBulkUpsertSchema(Schema):
+    items = fields.List(fields.Nested(ItemUpsertSchema()), required=True,
+                        validate=validate.Length(min=1, max=10000))
+
+    @validates_schema
+    def validate_unique_ids(self, data, **kwargs):
+        # one statement cannot update the same row twice
+        ids = [item["id"] for item in data.get("items", [])]
+        if len(ids) != len(set(ids)):
+            raise ValidationError("Each id may appear only once.", "items")
+
+
+class ItemBulkUpsertResultSchema(Schema):
+    upserted = fields.Int()
+    ids = fields.List(fields.Int())
+
+
+# Status of a background job, see jobs.py.
+class JobSchema(Schema):
+    id = fields.Str(dump_only=True)
+    kind = fields.Str(dump_only=True)
+    target_id = fields.Int(dump_only=True)
+    status = fields.Str(dump_only=True)
+    progress = fields.Int(dump_only=True)
+    error = fields.Str(dump_only=True)
+    created_at = fields.Int(dump_only=True)
+    finished_at = fields.Int(dump_only=True)
+
+
+# Query string of the streaming item export.
+class ItemExportQuerySchema(Schema):
+    format = fields.Str(load_default="ndjson",
+                        validate=validate.OneOf(["ndjson", "csv"]))
+
+
+# Query string of the item full-text search.
+class ItemSearchQuerySchema(Schema):
+    q = fields.Str(required=True,
+                   validate=[validate.Length(max=200),
+                             validate.Regexp(r"(?s).*\w", error="Search for at least one word.")],
+                   metadata={"description": "Words that must all appear in the item name or description."})
+
+
+class ItemTagPairSchema(Schema):
+    item_id = fields.Int(required=True)
+    tag_id = fields.Int(required=True)
+
+
+# Bulk tag linking/unlinking: either explicit (item_id, tag_id) pairs,
+# or one tag_id applied to a list of item_ids (both forms may be combined).
+class TagLinksSchema(Schema):
+    pairs = fields.List(fields.Nested(ItemTagPairSchema()),
+                        validate=validate.Length(max=10000))
+    tag_id = fields.Int()
+    item_ids = fields.List(fields.Int(), validate=validate.Length(max=10000))
+
+    @validates_schema
+    def validate_form(self, data, **kwargs):
+        if ("tag_id" in data) != ("item_ids" in data):
+            raise ValidationError("'tag_id' and 'item_ids' must be given together.")
+        if "pairs" not in data and "tag_id" not in data:
+            raise ValidationError("Provide 'pairs', or 'tag_id' with 'item_ids'.")
+
+
+class TagLinksResultSchema(Schema):
+    message = fields.Str()
+    # links created (or removed); existing links are skipped on creation
+    count = fields.Int()
+    missing_item_ids = fields.List(fields.Int())
+    missing_tag_ids = fields.List(fields.Int())
+
 # User marshmallow schema
 
 
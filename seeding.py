@@ -0,0 +1,207 @@
+"""
+Deterministic synthetic data for scale testing (``flask seed``).
+
+The same parameters and seed always produce the same rows with the same ids
+(1..n in every table). Skewed distributions follow a Zipf law: with exponent
+s, the k-th most popular store or tag is chosen with weight 1 / k**s, so s=0
+is uniform and s around 1 gives the long tail seen in real catalogs.
+
+Rows are generated in chunks of CHUNK_SIZE and written through the fastest
+bulk path of the database: COPY FROM STDIN on PostgreSQL, executemany
+INSERTs on SQLite (one prepared statement looped in C). Memory use stays
+bounded by the chunk size whatever the table size.
+
+Seeding replaces the contents of the catalog, user and blocklist tables.
+"""
+
+import csv
+import io
+import random
+import time
+from itertools import accumulate
+
+from sqlalchemy import delete, insert, text, update
+
+import catalog_counters
+import item_search
+import tag_index
+from blocklist import BLOCKLIST_COUNTER
+from db import db
+from etag_cache import touch_catalog
+from models import (ChangeCounterModel, ItemModel, ItemsTags, JWTBlocklist,
+                    StoreModel, TagModel, UserModel)
+from password_hashing import password_hasher
+
+CHUNK_SIZE = 50000
+
+# Every seeded user has this password (hashed once, the hash is shared)
+SEED_PASSWORD = "password"
+
+# Words of the item descriptions, the first ones the most frequent (Zipf law),
+# so full-text searches hit from a few items to a large share of the catalog
+DESCRIPTION_WORDS = (
+    "steel wooden black white small large classic modern portable outdoor "
+    "kitchen garden office travel cotton leather glass ceramic vintage compact "
+    "chair table lamp shelf bottle basket blanket cushion mirror clock "
+    "rug kettle jacket backpack umbrella candle notebook speaker charger helmet "
+    "handmade organic waterproof foldable adjustable rechargeable wireless stackable "
+    "oak walnut bamboo linen wool copper brass marble velvet canvas "
+    "red blue green yellow grey navy olive amber ivory teal"
+).split()
+DESCRIPTION_LENGTH = 6
+
+# Tables emptied before seeding, children first
+SEEDED_TABLES = (ItemsTags, ItemModel, TagModel, StoreModel, JWTBlocklist, UserModel)
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative weights of ranks 1..n under a Zipf law, for random.choices()."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+class Seeder:
+    """Generates and writes the synthetic dataset, reporting progress per table."""
+
+    def __init__(self, seed=42, on_progress=None):
+        self.rng = random.Random(seed)
+        self.on_progress = on_progress
+        self.counts = {}
+
+    def _write(self, model, columns, chunks):
+        """Writes chunks of row tuples to a table, returns the number of rows."""
+        table = model.__table__
+        started = time.monotonic()
+        written = 0
+        postgresql = db.engine.dialect.name == "postgresql"
+        for rows in chunks:
+            if postgresql:
+                self._copy(table.name, columns, rows)
+            else:
+                db.session.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+            written += len(rows)
+            if self.on_progress is not None:
+                self.on_progress(table.name, written, time.monotonic() - started)
+        self.counts[table.name] = written
+        return written
+
+    @staticmethod
+    def _copy(table_name, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        # the session's own connection, so COPY is part of the seeding transaction
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _chunked(rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def seed(self, stores, items, tags, tags_per_item=3.0, store_skew=1.0, tag_skew=1.1,
+             users=1000, blocklisted=10000, expired_ratio=0.5):
+        """Empties the seeded tables and fills them. Call inside an app context.
+
+        :param float tags_per_item: Mean number of tags per item, each item
+            gets between 0 and twice that many distinct tags
+        :param float store_skew: Zipf exponent of the items per store
+        :param float tag_skew: Zipf exponent of the tag popularity in items_tags
+        :param float expired_ratio: Share of blocklisted tokens already expired
+        """
+        # row-level counter, search index and tag index log triggers would
+        # double the load time on SQLite
+        with catalog_counters.bulk_load(), item_search.bulk_load(), tag_index.bulk_load():
+            for model in SEEDED_TABLES:
+                db.session.execute(delete(model.__table__))
+
+            rng = self.rng
+            self._write(StoreModel, ("id", "name"), self._chunked(
+                (i, f"store-{i}") for i in range(1, stores + 1)))
+            self._write(TagModel, ("id", "name", "store_id"), self._chunked(
+                (i, f"tag-{i}", (i - 1) % stores + 1) for i in range(1, tags + 1)))
+
+            store_ids = range(1, stores + 1)
+            store_weights = zipf_cum_weights(stores, store_skew)
+            word_weights = zipf_cum_weights(len(DESCRIPTION_WORDS), 1.0)
+
+            def item_rows():
+                for start in range(1, items + 1, CHUNK_SIZE):
+                    count = min(CHUNK_SIZE, items - start + 1)
+                    owners = rng.choices(store_ids, cum_weights=store_weights, k=count)
+                    words = rng.choices(DESCRIPTION_WORDS, cum_weights=word_weights,
+                                        k=count * DESCRIPTION_LENGTH)
+                    for offset, store_id in enumerate(owners):
+                        i = start + offset
+                        first = offset * DESCRIPTION_LENGTH
+                        description = " ".join(words[first:first + DESCRIPTION_LENGTH])
+                        yield (i, f"item-{i}", description,
+                               round(rng.uniform(1, 1000), 2), store_id)
+
+            self._write(ItemModel, ("id", "name", "description", "price", "store_id"),
+                        self._chunked(item_rows()))
+
+            tag_ids = range(1, tags + 1)
+            tag_weights = zipf_cum_weights(tags, tag_skew)
+            max_tags = min(int(2 * tags_per_item), tags)
+
+            def link_rows():
+                link_id = 0
+                for item_id in range(1, items + 1):
+                    wanted = rng.randint(0, max_tags)
+                    if not wanted:
+                        continue
+                    # popular tags come up more than once, the set keeps links unique
+                    chosen = rng.choices(tag_ids, cum_weights=tag_weights, k=wanted)
+                    for tag_id in sorted(set(chosen)):
+                        link_id += 1
+                        yield (link_id, item_id, tag_id)
+
+            if tags:
+                self._write(ItemsTags, ("id", "item_id", "tag_id"), self._chunked(link_rows()))
+
+        # pbkdf2 is deliberately slow, so every user shares one hash of SEED_PASSWORD
+        password_hash = password_hasher.hash(SEED_PASSWORD)
+        self._write(UserModel, ("id", "username", "password"), self._chunked(
+            (i, f"user-{i}", password_hash) for i in range(1, users + 1)))
+
+        now = int(time.time())
+        # continue the counter's sequence, so workers that already synced pick the rows up
+        first_version = ChangeCounterModel.current(BLOCKLIST_COUNTER) + 1
+
+        def blocklist_rows():
+            for version in range(first_version, first_version + blocklisted):
+                lifetime = rng.randint(60, 30 * 24 * 3600)
+                exp = now - lifetime if rng.random() < expired_ratio else now + lifetime
+                yield (f"{rng.getrandbits(128):032x}", version, exp)
+
+        self._write(JWTBlocklist, ("jti", "version", "exp"), self._chunked(blocklist_rows()))
+
+        self._finish(first_version + blocklisted - 1)
+        db.session.commit()
+        return self.counts
+
+    @staticmethod
+    def _finish(blocklist_version):
+        if db.engine.dialect.name == "postgresql":
+            # explicit ids do not advance the serial sequences, later inserts would collide
+            for table in ("stores", "tags", "items", "items_tags", "users"):
+                db.session.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+        touch_catalog()
+        # revocation caches pull the rows newer than the counter value they have seen
+        ChangeCounterModel.bump(BLOCKLIST_COUNTER)  # creates the row if it is missing
+        db.session.execute(
+            update(ChangeCounterModel)
+            .where(ChangeCounterModel.name == BLOCKLIST_COUNTER)
+            .values(value=blocklist_version))
@@ -0,0 +1,141 @@
+"""
+Opt-in per-request SQL profiler with N+1 detection.
+
+SQLAlchemy engine events time every statement a request executes. At the
+end of the request the totals go out as response headers
+
+    X-DB-Query-Count: 3
+    Server-Timing: db;dur=4.2;desc="3 queries"
+
+and as one JSON log line on the "sql_profiler" logger. Statements whose shape
+(the SQL text with bind parameter lists collapsed) runs at least
+SQL_PROFILER_N_PLUS_ONE_THRESHOLD times in one request are reported as N+1
+suspects: that is the signature of a lazy load inside a loop.
+
+Only a SQL_PROFILER_SAMPLE_RATE fraction of requests is profiled. For the
+others, and for work outside requests (CLI commands, background jobs), the
+event handlers return after a single context variable lookup, so the
+profiler can stay on in production at a low rate.
+"""
+
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("sql_profiler")
+
+# Placeholder lists of IN clauses, whose length varies with the parameters:
+# "(?, ?, ?)" or "(%(id_1_1)s, %(id_1_2)s)" become "(?)"
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s)\s*,)+\s*(?:\?|%\(\w+\)s)\s*\)")
+
+# Profile of the request being served in this thread/task, None when not sampled
+_current = ContextVar("sql_profile", default=None)
+
+
+def statement_shape(statement):
+    """Returns the statement text with variable length placeholder lists collapsed."""
+    return _PLACEHOLDER_LIST.sub("(?)", statement)
+
+
+class RequestProfile:
+    """Statements executed during one request, with their total time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def suspects(self, threshold):
+        """Returns the statement shapes repeated at least ``threshold`` times, most repeated first."""
+        return [{"statement": shape, "count": count}
+                for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        # the execution context is per statement, a failed one leaves nothing behind
+        context._sql_profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = getattr(context, "_sql_profiler_started", None)
+    if profile is not None and started is not None:
+        # an executemany counts as one statement, it is one round trip (or a few batches)
+        profile.record(statement, time.perf_counter() - started)
+
+
+class SQLProfiler:
+    """Attaches per-request SQL statistics to sampled responses."""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.threshold = 5
+        self._listening = False
+
+    def init_app(self, app):
+        """Reads the profiler settings and hooks it into the app's request cycle."""
+        self.enabled = app.config.setdefault("SQL_PROFILER_ENABLED", False)
+        self.sample_rate = app.config.setdefault("SQL_PROFILER_SAMPLE_RATE", 1.0)
+        self.threshold = app.config.setdefault("SQL_PROFILER_N_PLUS_ONE_THRESHOLD", 5)
+        if not self.enabled:
+            return
+
+        if not self._listening:
+            # on the Engine class, so it covers every engine Flask-SQLAlchemy creates
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._stop)
+
+    def _start(self):
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            _current.set(RequestProfile())
+
+    def _finish(self, response):
+        profile = _current.get()
+        if profile is None:
+            return response
+
+        db_ms = profile.seconds * 1000
+        response.headers["X-DB-Query-Count"] = str(profile.count)
+        response.headers.add(
+            "Server-Timing", f'db;dur={db_ms:.1f};desc="{profile.count} queries"')
+
+        suspects = profile.suspects(self.threshold)
+        logger.log(
+            logging.WARNING if suspects else logging.INFO,
+            json.dumps({
+                "method": request.method,
+                "path": request.path,
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                "queries": profile.count,
+                "db_ms": round(db_ms, 2),
+                "n_plus_one": suspects,
+            }),
+        )
+        return response
+
+    @staticmethod
+    def _stop(exc):
+        _current.set(None)
+
+
+sql_profiler = SQLProfiler()
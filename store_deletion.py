@@ -0,0 +1,67 @@
+"""
+Set-based deletion of a store and everything that depends on it.
+
+Deleting a StoreModel through the ORM loads every item into the session and
+deletes them one by one, and leaves the item-tag links and the store's tags
+behind to fail their foreign keys. Here the rows are removed with a few
+DELETE ... WHERE statements on the tables, in dependency order:
+
+    items_tags (links of the store's items, then links to the store's tags)
+    -> items -> tags -> stores
+
+With a ``batch_size`` the items (and their links) go in bounded batches, one
+transaction each, so a huge store never holds locks for long. Deleting is
+idempotent: an interrupted deletion is finished by running it again.
+"""
+
+from sqlalchemy import delete, func, select
+
+from db import db
+from etag_cache import touch_catalog
+from models import ItemModel, ItemsTags, StoreModel, TagModel
+
+
+def count_store_items(store_id):
+    return db.session.execute(
+        select(func.count()).select_from(ItemModel).where(ItemModel.store_id == store_id)
+    ).scalar()
+
+
+def delete_store(store_id, batch_size=None, on_progress=None):
+    """Deletes a store with its items, tags and their links, and commits.
+
+    Without ``batch_size`` everything goes in one transaction. Otherwise the
+    items are deleted ``batch_size`` at a time, each batch committed, and
+    ``on_progress(items_deleted)`` is called after each commit.
+
+    Returns the number of items deleted.
+    """
+    store_items = select(ItemModel.id).where(ItemModel.store_id == store_id)
+    store_tags = select(TagModel.id).where(TagModel.store_id == store_id)
+
+    deleted = 0
+    if batch_size is None:
+        db.session.execute(delete(ItemsTags.__table__).where(ItemsTags.item_id.in_(store_items)))
+        deleted = db.session.execute(
+            delete(ItemModel.__table__).where(ItemModel.store_id == store_id)).rowcount
+    else:
+        while True:
+            batch = db.session.execute(
+                store_items.order_by(ItemModel.id).limit(batch_size)).scalars().all()
+            if not batch:
+                break
+            db.session.execute(delete(ItemsTags.__table__).where(ItemsTags.item_id.in_(batch)))
+            db.session.execute(delete(ItemModel.__table__).where(ItemModel.id.in_(batch)))
+            touch_catalog()
+            db.session.commit()
+            deleted += len(batch)
+            if on_progress is not None:
+                on_progress(deleted)
+
+    # items of other stores may carry this store's tags
+    db.session.execute(delete(ItemsTags.__table__).where(ItemsTags.tag_id.in_(store_tags)))
+    db.session.execute(delete(TagModel.__table__).where(TagModel.store_id == store_id))
+    db.session.execute(delete(StoreModel.__table__).where(StoreModel.id == store_id))
+    touch_catalog()
+    db.session.commit()
+    return deleted
@@ -0,0 +1,402 @@
+"""
+Per-worker inverted index of the item tags, for tag-set item queries.
+
+GET /store/<id>/items?tags=1,2,3&match=all asks for the items of a store
+carrying all (or any) of a set of tags. SQL answers it with a GROUP BY
+item_id HAVING count(*) = 3 over the links of the tags (see tagged_items()),
+which reads every link of every tag before the first page comes out. Each
+worker can keep instead:
+
+- tag id -> sorted array of the ids of its items (a posting list)
+- item id -> store id, as an array indexed by item id
+
+"all" walks the shortest posting list from the cursor on and keeps the items
+the other lists hold too (binary searches), "any" merges the lists lazily.
+Both stop once the page is full, so a page costs a few lookups per returned
+item, whatever the size of the tags. Plain sorted arrays take 4 bytes per
+link; compressed bitmaps (roaring) would be smaller for dense tags but need
+a C extension.
+
+The index is built by a background thread on the first query. Until it is
+ready, and whenever TAG_INDEX_ENABLED is false, queries are answered by SQL.
+It is then kept current incrementally: triggers on items and items_tags log
+every link change, item move and item deletion to tag_index_changes,
+stamped with the "tag_index" change counter (one value per row on SQLite,
+per statement on PostgreSQL, in commit order either way). When this worker
+sees the catalog change counter move (etag_cache.catalog_version, polled
+every ETAG_VERSION_POLL_SECONDS), the index replays the log rows newer than
+its version. So an index answer is never older than the catalog version its
+ETag is cached with. A reset row (no item id), written after bulk loads, or
+a gap left by ``flask tag-index prune`` makes the worker rebuild. The
+container entry point runs that command at every start, so the log stays
+bounded.
+
+The triggers are created by the migration, and by db.create_all() through
+the metadata hook below. SQLite loses the triggers of a table rebuilt by a
+batch migration of items or items_tags, which must create them again.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from operator import itemgetter
+
+from sqlalchemy import delete, event, func, insert, select, text
+
+from async_db import Lock
+from db import db
+from etag_cache import catalog_version
+from models import ChangeCounterModel, ItemModel, ItemsTags, TagIndexChangeModel
+
+logger = logging.getLogger(__name__)
+
+TAG_INDEX_COUNTER = "tag_index"
+
+# Tables whose triggers log changes, and the operations they log
+LOGGED_TABLES = ("items_tags", "items")
+OPERATIONS = ("insert", "delete", "update")
+
+_LOG_COLUMNS = "version, item_id, tag_id, store_id, removed"
+
+
+def _sqlite_log(item_id, tag_id, store_id, removed):
+    return (f"    UPDATE change_counters SET value = value + 1 WHERE name = '{TAG_INDEX_COUNTER}';\n"
+            f"    INSERT INTO tag_index_changes ({_LOG_COLUMNS})\n"
+            f"    SELECT value, {item_id}, {tag_id}, {store_id}, {removed} "
+            f"FROM change_counters WHERE name = '{TAG_INDEX_COUNTER}';\n")
+
+
+def sqlite_statements():
+    def link(row, removed):
+        return _sqlite_log(f"{row}.item_id", f"{row}.tag_id", "NULL", removed)
+
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS items_tags_tag_index_insert AFTER INSERT ON items_tags\n"
+        f"BEGIN\n{link('NEW', 0)}END",
+        f"CREATE TRIGGER IF NOT EXISTS items_tags_tag_index_delete AFTER DELETE ON items_tags\n"
+        f"BEGIN\n{link('OLD', 1)}END",
+        f"CREATE TRIGGER IF NOT EXISTS items_tags_tag_index_update\n"
+        f"AFTER UPDATE OF item_id, tag_id ON items_tags "
+        f"WHEN OLD.item_id IS NOT NEW.item_id OR OLD.tag_id IS NOT NEW.tag_id\n"
+        f"BEGIN\n{link('OLD', 1)}{link('NEW', 0)}END",
+        f"CREATE TRIGGER IF NOT EXISTS items_tag_index_insert AFTER INSERT ON items\n"
+        f"BEGIN\n{_sqlite_log('NEW.id', 'NULL', 'NEW.store_id', 0)}END",
+        f"CREATE TRIGGER IF NOT EXISTS items_tag_index_delete AFTER DELETE ON items\n"
+        f"BEGIN\n{_sqlite_log('OLD.id', 'NULL', 'NULL', 1)}END",
+        f"CREATE TRIGGER IF NOT EXISTS items_tag_index_update\n"
+        f"AFTER UPDATE OF store_id ON items WHEN OLD.store_id IS NOT NEW.store_id\n"
+        f"BEGIN\n{_sqlite_log('NEW.id', 'NULL', 'NEW.store_id', 0)}END",
+    ]
+
+
+def postgresql_statements():
+    def log(changes):
+        # one counter value per statement, and none for a statement changing nothing
+        return (f"        WITH changes AS ({changes}),\n"
+                f"        bumped AS (UPDATE change_counters SET value = value + 1\n"
+                f"                   WHERE name = '{TAG_INDEX_COUNTER}' AND EXISTS (SELECT 1 FROM changes)\n"
+                f"                   RETURNING value)\n"
+                f"        INSERT INTO tag_index_changes ({_LOG_COLUMNS})\n"
+                f"        SELECT bumped.value, changes.item_id, changes.tag_id, changes.store_id, changes.removed\n"
+                f"        FROM changes CROSS JOIN bumped ORDER BY changes.removed DESC;\n")
+
+    def links(rows, removed):
+        return (f"SELECT item_id, tag_id, NULL::integer AS store_id, {removed} AS removed "
+                f"FROM {rows}")
+
+    def items(rows, store_id, removed, where=""):
+        return (f"SELECT {rows}.id AS item_id, NULL::integer AS tag_id, {store_id} AS store_id, "
+                f"{removed} AS removed FROM {rows}{where}")
+
+    moved = (" JOIN old_rows ON old_rows.id = new_rows.id"
+             " WHERE old_rows.store_id IS DISTINCT FROM new_rows.store_id")
+    statements = [
+        f"CREATE OR REPLACE FUNCTION tag_index_log() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+        f"BEGIN\n"
+        f"    IF TG_TABLE_NAME = 'items_tags' THEN\n"
+        f"      IF TG_OP = 'INSERT' THEN\n"
+        f"{log(links('new_rows', 'false'))}"
+        f"      ELSIF TG_OP = 'DELETE' THEN\n"
+        f"{log(links('old_rows', 'true'))}"
+        f"      ELSE\n"
+        f"{log(links('old_rows', 'true') + ' UNION ALL ' + links('new_rows', 'false'))}"
+        f"      END IF;\n"
+        f"    ELSIF TG_OP = 'INSERT' THEN\n"
+        f"{log(items('new_rows', 'new_rows.store_id', 'false'))}"
+        f"    ELSIF TG_OP = 'DELETE' THEN\n"
+        f"{log(items('old_rows', 'NULL::integer', 'true'))}"
+        f"    ELSE\n"
+        f"{log(items('new_rows', 'new_rows.store_id', 'false', moved))}"
+        f"    END IF;\n"
+        f"    RETURN NULL;\n"
+        f"END $$",
+        *drop_trigger_statements("postgresql"),
+    ]
+    for table in LOGGED_TABLES:
+        statements += [
+            f"CREATE TRIGGER {table}_tag_index_insert AFTER INSERT ON {table}\n"
+            f"REFERENCING NEW TABLE AS new_rows\n"
+            f"FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()",
+            f"CREATE TRIGGER {table}_tag_index_delete AFTER DELETE ON {table}\n"
+            f"REFERENCING OLD TABLE AS old_rows\n"
+            f"FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()",
+            f"CREATE TRIGGER {table}_tag_index_update AFTER UPDATE ON {table}\n"
+            f"REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows\n"
+            f"FOR EACH STATEMENT EXECUTE FUNCTION tag_index_log()",
+        ]
+    return statements
+
+
+def trigger_statements(dialect):
+    """Returns the DDL (re)creating the log triggers on a dialect, empty for unsupported ones."""
+    if dialect == "sqlite":
+        return sqlite_statements()
+    if dialect == "postgresql":
+        return postgresql_statements()
+    return []
+
+
+def drop_trigger_statements(dialect):
+    """Returns the DDL dropping the log triggers (the trigger function stays on PostgreSQL)."""
+    suffix = {"sqlite": "", "postgresql": " ON {table}"}.get(dialect)
+    if suffix is None:
+        return []
+    return [f"DROP TRIGGER IF EXISTS {table}_tag_index_{operation}{suffix.format(table=table)}"
+            for table in LOGGED_TABLES for operation in OPERATIONS]
+
+
+def request_rebuild():
+    """Empties the change log and leaves a reset row, every worker rebuilds its index. Commit afterwards."""
+    db.session.execute(delete(TagIndexChangeModel))
+    version = ChangeCounterModel.bump(TAG_INDEX_COUNTER)
+    db.session.execute(insert(TagIndexChangeModel).values(version=version, removed=False))
+
+
+@contextmanager
+def bulk_load():
+    """Suspends the log triggers around a bulk load, then makes every worker rebuild.
+
+    Logging a million links would cost more than the load. Everything happens
+    in the session's transaction.
+    """
+    dialect = db.engine.dialect.name
+    for statement in drop_trigger_statements(dialect):
+        db.session.execute(text(statement))
+    yield
+    for statement in trigger_statements(dialect):
+        db.session.execute(text(statement))
+    request_rebuild()
+
+
+def prune(keep):
+    """Deletes the log rows older than the last ``keep`` counter values and commits.
+
+    A worker further behind rebuilds its index. Returns the number of rows deleted.
+    """
+    current = ChangeCounterModel.current(TAG_INDEX_COUNTER)
+    deleted = db.session.execute(
+        delete(TagIndexChangeModel).where(TagIndexChangeModel.version <= current - keep)).rowcount
+    db.session.commit()
+    return deleted
+
+
+def tagged_items(tag_ids, match_all):
+    """SQL selecting the ids of the items carrying all (or any) of the tags, for id.in_()."""
+    tag_ids = sorted(set(tag_ids))
+    links = select(ItemsTags.item_id).where(ItemsTags.tag_id.in_(tag_ids))
+    if match_all and len(tag_ids) > 1:
+        # links are unique, so an item carrying every tag has one link per tag
+        links = links.group_by(ItemsTags.item_id).having(func.count() == len(tag_ids))
+    return links
+
+
+def _contains(posting, item_id):
+    i = bisect_left(posting, item_id)
+    return i != len(posting) and posting[i] == item_id
+
+
+def _after(posting, item_id):
+    """Iterates over the ids of a posting list greater than ``item_id``."""
+    return (posting[i] for i in range(bisect_right(posting, item_id), len(posting)))
+
+
+class TagIndex:
+    """This worker's posting lists of the item tags, see the module docstring."""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = True
+        self._lock = Lock()  # held across the log reads of _sync()
+        self._generation = 0
+        self.reset()
+
+    def init_app(self, app):
+        """Reads the settings from the Flask config and starts from a cold index."""
+        self.app = app
+        self.enabled = app.config.setdefault("TAG_INDEX_ENABLED", True)
+        self.reset()
+
+    def reset(self):
+        """Drops the index, the next query starts building it again."""
+        with self._lock:
+            self._generation += 1  # a build started before is thrown away
+            self._postings = None  # tag id -> sorted array of item ids, None while cold
+            self._stores = None  # store id of each item id, 0 for no item
+            self._version = None  # tag_index counter value the index is current with
+            self._catalog_version = None  # catalog counter value of the last sync
+            self._building = False
+
+    @property
+    def ready(self):
+        return self._postings is not None
+
+    def lookup(self, tag_ids, match_all, store_id, after=0, limit=None, count=False):
+        """Returns the items of a store carrying all (or any) of the tags.
+
+        :return: (ids, total): at most ``limit`` item ids above ``after`` in
+            ascending order, and the number of matches when ``count``, else
+            None. None when the index is disabled or cold, ask tagged_items() then.
+        """
+        if not self.enabled:
+            return None
+        version = catalog_version.current()
+        with self._lock:
+            if self._postings is None:
+                self._start_build()
+            elif version != self._catalog_version:
+                self._sync()
+                self._catalog_version = version
+            if self._postings is None:
+                return None
+            ids = list(itertools.islice(self._matches(tag_ids, match_all, store_id, after), limit))
+            total = sum(1 for _ in self._matches(tag_ids, match_all, store_id, 0)) if count else None
+        return ids, total
+
+    def _matches(self, tag_ids, match_all, store_id, after):
+        stores = self._stores
+        postings = [self._postings.get(tag_id, array("i")) for tag_id in set(tag_ids)]
+        if match_all:
+            postings.sort(key=len)
+            shortest, others = postings[0], postings[1:]
+            for item_id in _after(shortest, after):
+                if (item_id < len(stores) and stores[item_id] == store_id
+                        and all(_contains(posting, item_id) for posting in others)):
+                    yield item_id
+        else:
+            previous = None
+            for item_id in heapq.merge(*(_after(posting, after) for posting in postings)):
+                if item_id != previous and item_id < len(stores) and stores[item_id] == store_id:
+                    yield item_id
+                previous = item_id
+
+    def _sync(self):
+        version = ChangeCounterModel.current(TAG_INDEX_COUNTER)
+        if version == self._version:
+            return
+        log = TagIndexChangeModel
+        changes = db.session.execute(
+            select(log.version, log.item_id, log.tag_id, log.store_id, log.removed)
+            .where(log.version > self._version).order_by(log.version, log.id)).all()
+        # a pruned log, or a counter behind the index (a database built again)
+        if not changes or changes[0].version != self._version + 1:
+            self._rebuild()
+            return
+        for change in changes:
+            if change.item_id is None:
+                self._rebuild()
+                return
+            if change.tag_id is not None:
+                self._link(change.item_id, change.tag_id, change.removed)
+            else:
+                self._move(change.item_id, None if change.removed else change.store_id)
+        self._version = max(version, changes[-1].version)
+
+    def _link(self, item_id, tag_id, removed):
+        posting = self._postings.get(tag_id)
+        if posting is None:
+            if removed:
+                return
+            posting = self._postings[tag_id] = array("i")
+        i = bisect_left(posting, item_id)
+        present = i != len(posting) and posting[i] == item_id
+        if removed and present:
+            del posting[i]
+        elif not removed and not present:
+            posting.insert(i, item_id)
+
+    def _move(self, item_id, store_id):
+        stores = self._stores
+        if item_id >= len(stores):
+            stores.frombytes(bytes(stores.itemsize * (item_id + 1 - len(stores))))
+        stores[item_id] = store_id or 0
+
+    def _rebuild(self):
+        self._postings = self._stores = None
+        self._start_build()
+
+    def _start_build(self):
+        if self._building:
+            return
+        self._building = True
+        threading.Thread(target=self._build, args=(self._generation,),
+                         name="tag-index-build", daemon=True).start()
+
+    def _build(self, generation):
+        started = time.monotonic()
+        with self.app.app_context():
+            try:
+                # changes committed while the tables are read are replayed by the next sync
+                version = ChangeCounterModel.current(TAG_INDEX_COUNTER)
+                postings = {}
+                links = db.session.execute(
+                    select(ItemsTags.tag_id, ItemsTags.item_id)
+                    .order_by(ItemsTags.tag_id, ItemsTags.item_id)
+                    .execution_options(yield_per=50000))
+                for tag_id, rows in itertools.groupby(links, key=itemgetter(0)):
+                    postings[tag_id] = array("i", map(itemgetter(1), rows))
+
+                last_id = db.session.scalar(select(func.max(ItemModel.id))) or 0
+                stores = array("i", bytes(4 * (last_id + 1)))
+                items = db.session.execute(select(ItemModel.id, ItemModel.store_id)
+                                           .execution_options(yield_per=50000))
+                for item_id, store_id in items:
+                    if item_id >= len(stores):
+                        stores.frombytes(bytes(stores.itemsize * (item_id + 1 - len(stores))))
+                    stores[item_id] = store_id
+                db.session.rollback()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Building the tag index failed, tag-set queries stay on SQL")
+                with self._lock:
+                    if generation == self._generation:
+                        self._building = False
+                return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._postings, self._stores, self._version = postings, stores, version
+            self._catalog_version = None  # the next query catches up with the log
+            self._building = False
+        logger.info("Tag index built: %d tags, %d links, in %.1f s", len(postings),
+                    sum(map(len, postings.values())), time.monotonic() - started)
+
+
+tag_index = TagIndex()
+
+
+@event.listens_for(db.metadata, "after_create")
+def _create_triggers(metadata, connection, **kwargs):
+    # db.create_all() (benchmarks, scratch databases) gets the triggers and
+    # the counter row the migration creates
+    if all(table in metadata.tables for table in ("items", "items_tags", "tag_index_changes")):
+        connection.exec_driver_sql(
+            f"INSERT INTO change_counters (name, value) SELECT '{TAG_INDEX_COUNTER}', 0 "
+            f"WHERE NOT EXISTS (SELECT 1 FROM change_counters WHERE name = '{TAG_INDEX_COUNTER}')")
+        for statement in trigger_statements(connection.dialect.name):
+            connection.exec_driver_sql(statement)
@@ -0,0 +1,60 @@
+"""
+Fixtures of the test suite: an application on a temporary SQLite file, its
+test client and a logged-in user.
+
+Run from the repository root:
+
+    python -m pytest tests
+    TEST_DATABASE_URL=postgresql://... python -m pytest tests   # scratch database, emptied
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from db import db  # noqa: E402
+
+TEST_USER = {"username": "test-user", "password": "test-user-password"}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("JWT_SECRET_KEY", "test-only-secret-key-0123456789abcdef")
+    # hash in the request thread, the tests need no process pool
+    monkeypatch.setenv("PASSWORD_HASH_WORKERS", "0")
+    # re-read the change counters on every request, so the per-worker caches
+    # issue the same queries whatever the timing
+    monkeypatch.setenv("JWT_BLOCKLIST_CACHE_POLL_SECONDS", "0")
+    monkeypatch.setenv("ETAG_VERSION_POLL_SECONDS", "0")
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    database_url = os.getenv("TEST_DATABASE_URL")
+    app = create_app(database_url or "sqlite:///" + str(tmp_path / "test.db"))
+    with app.app_context():
+        if database_url:
+            db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Registers the test user (again, after a seeding emptied the users) and
+    returns its Authorization header."""
+
+    def login():
+        client.post("/register", json=TEST_USER)
+        token = client.post("/login", json=TEST_USER).get_json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    return login
@@ -0,0 +1,54 @@
+"""The ASGI adapter's WSGI environ, and the lock request greenlets share with threads."""
+
+import asyncio
+import threading
+import time
+
+from sqlalchemy.util import greenlet_spawn
+
+from asgi import _environ
+from async_db import Lock, await_
+
+
+def scope(headers):
+    return {"type": "http", "method": "GET", "path": "/store", "query_string": b"",
+            "http_version": "1.1", "headers": headers}
+
+
+def test_repeated_headers_are_joined():
+    environ = _environ(scope([(b"cookie", b"a=1"), (b"cookie", b"b=2"),
+                              (b"accept", b"text/html"), (b"accept", b"application/json")]),
+                       receive=None)
+    assert environ["HTTP_COOKIE"] == "a=1; b=2"
+    assert environ["HTTP_ACCEPT"] == "text/html,application/json"
+
+
+def test_lock_is_shared_by_greenlets_and_threads():
+    lock = Lock()
+    state = {"inside": 0, "most": 0, "done": 0}
+
+    def critical(sleep):
+        with lock:
+            state["inside"] += 1
+            state["most"] = max(state["most"], state["inside"])
+            sleep()
+            state["inside"] -= 1
+            state["done"] += 1
+
+    async def contend():
+        thread = threading.Thread(
+            target=lambda: [critical(lambda: time.sleep(0.001)) for _ in range(20)])
+        thread.start()
+        tasks = [asyncio.ensure_future(
+            greenlet_spawn(critical, lambda: await_(asyncio.sleep(0.001)))) for _ in range(50)]
+        await asyncio.sleep(0.005)
+        # a waiter cancelled after its wake-up passes it on
+        for task in tasks[30:40]:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(thread.join)
+        return sum(isinstance(result, asyncio.CancelledError) for result in results)
+
+    cancelled = asyncio.run(asyncio.wait_for(contend(), 10))
+    assert state["most"] == 1
+    assert state["done"] == 70 - cancelled
@@ -0,0 +1,41 @@
+"""The revocation cache picks up revocations made by other workers."""
+
+from blocklist import BLOCKLIST_COUNTER, revocation_cache
+from db import db
+from models import ChangeCounterModel, JWTBlocklist
+
+
+def revoke_elsewhere(jti):
+    """Revokes a jti the way another worker does, behind this worker's back."""
+    version = ChangeCounterModel.bump(BLOCKLIST_COUNTER)
+    db.session.add(JWTBlocklist(jti=jti, version=version, exp=None))
+    db.session.commit()
+
+
+def test_revocation_reaches_a_cached_negative_entry_after_a_bloom_rebuild(app):
+    app.config["JWT_BLOCKLIST_BLOOM_CAPACITY"] = 2
+    app.config["JWT_BLOCKLIST_CACHE_POLL_SECONDS"] = 0
+    revocation_cache.init_app(app)
+    for jti in ("a", "b", "c"):
+        revoke_elsewhere(jti)
+
+    assert not revocation_cache.is_revoked("token")
+    # cache "token" as not revoked, whatever the filter answers for it
+    revocation_cache._not_revoked.set("token", True)
+    # overfill the filter, so the next sync rebuilds it
+    revocation_cache._bloom.count = revocation_cache._bloom.capacity + 1
+    revoke_elsewhere("token")
+
+    assert revocation_cache.is_revoked("token")
+    assert not revocation_cache._bloom.saturated
+
+
+def test_rebuilt_bloom_filter_has_room_for_the_table(app):
+    app.config["JWT_BLOCKLIST_BLOOM_CAPACITY"] = 2
+    revocation_cache.init_app(app)
+    for jti in ("a", "b", "c", "d", "e"):
+        revoke_elsewhere(jti)
+
+    revocation_cache.is_revoked("token")
+    assert revocation_cache._bloom.capacity >= 10
+    assert not revocation_cache._bloom.saturated
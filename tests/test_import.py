@@ -0,0 +1,42 @@
+"""POST /item/import counts the inserted rows and reports unparsable bodies as 400."""
+
+import re
+
+from models import ItemModel
+
+RECORDS = b'{"name": "a", "price": 1.0, "store_name": "s"}\n' \
+          b'{"name": "b", "price": 2.0, "store_name": "s"}\n'
+
+
+def test_replayed_records_count_as_duplicates(client, login):
+    headers = login()
+    first = client.post("/item/import", data=RECORDS, headers=headers).get_json()
+    assert (first["inserted"], first["duplicates"]) == (2, 0)
+    again = client.post("/item/import", data=RECORDS + b'{"name": "c", "price": 3.0, "store_name": "s"}\n',
+                        headers=headers).get_json()
+    assert (again["inserted"], again["duplicates"]) == (1, 2)
+
+
+def committed_skip(response):
+    assert response.status_code == 400
+    return int(re.search(r"skip=(\d+)", response.get_json()["message"]).group(1))
+
+
+def test_invalid_utf8_is_a_bad_request(client, login):
+    headers = login()
+    # more than the decoder's read size, so that some chunks commit before the bad byte
+    body = b"".join(b'{"name": "item-%d", "price": 1.0, "store_name": "s"}\n' % i for i in range(500))
+    response = client.post("/item/import?commit_size=100", data=body + b'{"name": "\xff"}\n',
+                           headers=headers)
+    skip = committed_skip(response)
+    assert skip > 0
+    assert ItemModel.query.count() == skip
+
+
+def test_malformed_csv_is_a_bad_request(client, login):
+    headers = login()
+    # a field over the csv module's size limit
+    body = b'name,price,store_name\nz,1.0,s\n"' + b"x" * 200000 + b'",1.0,s\n'
+    response = client.post("/item/import?format=csv&commit_size=1", data=body, headers=headers)
+    assert committed_skip(response) == 1
+    assert ItemModel.query.count() == 1
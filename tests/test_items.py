@@ -0,0 +1,65 @@
+"""PUT /item/<id> and PUT /item/bulk: stores that do not exist, ids that are not integers, name conflicts."""
+
+STORE_NOT_FOUND = {"json": {"store_id": ["Store not found."]}}
+
+
+def test_put_create_rejects_unknown_store(client):
+    client.post("/store", json={"name": "store"})
+    response = client.put("/item/5", json={"name": "item", "price": 1.0, "store_id": 99},
+                          headers={"If-None-Match": "*"})
+    assert response.status_code == 422
+    assert response.get_json()["errors"] == STORE_NOT_FOUND
+    assert client.put("/item/5", json={"name": "item", "price": 1.0, "store_id": 1},
+                      headers={"If-None-Match": "*"}).status_code == 200
+
+
+def test_put_update_rejects_unknown_store(client):
+    client.post("/store", json={"name": "store"})
+    etag = client.put("/item/5", json={"name": "item", "price": 1.0, "store_id": 1},
+                      headers={"If-None-Match": "*"}).headers["ETag"]
+    response = client.put("/item/5", json={"store_id": 99}, headers={"If-Match": etag})
+    assert response.status_code == 422
+    assert response.get_json()["errors"] == STORE_NOT_FOUND
+    assert client.put("/item/5", json={"price": 2.0}, headers={"If-Match": etag}).status_code == 200
+
+
+def test_bulk_put_rejects_unknown_stores(client, login):
+    headers = login()
+    client.post("/store", json={"name": "store"}, headers=headers)
+    rows = [{"id": 1, "name": "a", "price": 1.0, "store_id": 1},
+            {"id": 2, "name": "b", "price": 1.0, "store_id": 99},
+            {"id": 3, "name": "c", "price": 1.0, "store_id": 98}]
+    response = client.put("/item/bulk", json={"items": rows}, headers=headers)
+    assert response.status_code == 422
+    assert response.get_json()["errors"] == {"items": [
+        {"index": 1, "errors": {"store_id": ["Store not found."]}},
+        {"index": 2, "errors": {"store_id": ["Store not found."]}},
+    ]}
+    assert client.put("/item/bulk", json={"items": rows[:1]}, headers=headers).status_code == 200
+
+
+def test_non_integer_item_id_is_not_found(client):
+    client.post("/store", json={"name": "store"})
+    response = client.put("/item/abc", json={"name": "item", "price": 1.0, "store_id": 1},
+                          headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+def test_name_conflicts_are_reported_by_index(client, login):
+    headers = login()
+    client.post("/store", json={"name": "store"}, headers=headers)
+    client.put("/item/1", json={"name": "a", "price": 1.0, "store_id": 1},
+               headers={"If-None-Match": "*"})
+    response = client.put("/item/2", json={"name": "a", "price": 1.0, "store_id": 1},
+                          headers={"If-None-Match": "*"})
+    assert response.status_code == 409
+    assert response.get_json()["message"] == "An item with that name already exists."
+
+    rows = [{"id": 1, "name": "a", "price": 2.0, "store_id": 1},
+            {"id": 3, "name": "a", "price": 1.0, "store_id": 1},
+            {"id": 4, "name": "d", "price": 1.0, "store_id": 1}]
+    response = client.put("/item/bulk", json={"items": rows}, headers=headers)
+    assert response.status_code == 409
+    assert response.get_json()["errors"] == {"items": [
+        {"index": 1, "errors": {"name": ["An item with that name already exists."]}},
+    ]}
@@ -0,0 +1,55 @@
+"""
+The list endpoints eager-load their nested relationships: a page costs the
+same number of statements whatever the number of rows (and of nested items
+and tags) on it, instead of one lazy load per row.
+"""
+
+import pytest
+from sqlalchemy import event
+
+from db import db
+from seeding import Seeder
+
+# rows per table of the large catalog, all of them on one page
+ROWS = 25
+
+LIST_ENDPOINTS = [
+    "/item?limit=100",
+    "/store?limit=100",
+    "/store/1/tags?limit=100",
+]
+
+
+def seed(rows):
+    # the tags are spread over the stores in turn: ``rows`` tags per store
+    Seeder().seed(stores=rows, items=rows * 4, tags=rows * rows, users=0, blocklisted=0)
+
+
+def count_statements(client, path, headers):
+    """Returns the response to a GET and the number of statements it executed."""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(path, headers=headers)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return response, len(statements)
+
+
+@pytest.mark.parametrize("path", LIST_ENDPOINTS)
+def test_list_query_count_is_constant(client, login, path):
+    counts = {}
+    for rows in (1, ROWS):
+        seed(rows)
+        headers = login()
+        # the first request fills the per-worker caches (ETag versions, scan verdicts)
+        client.get(path, headers=headers)
+        response, counts[rows] = count_statements(client, path, headers)
+        assert response.status_code == 200
+        assert len(response.get_json()) >= min(rows, 20)
+
+    assert counts[1] == counts[ROWS], counts
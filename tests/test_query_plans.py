@@ -0,0 +1,115 @@
+"""
+The hot lookups of the resources are index lookups.
+
+Each scenario below sends one request through the app and captures the
+SELECT and DELETE statements it runs, with their parameters. Every captured
+statement is then explained (EXPLAIN QUERY PLAN on SQLite, EXPLAIN on
+PostgreSQL) and the test fails when a plan reads a catalog table in full:
+"SCAN <table>" without an index on SQLite, a "Seq Scan" on PostgreSQL. On
+PostgreSQL sequential scans are disabled for the EXPLAIN, since on a small
+seeded table the planner prefers them even when an index exists; a Seq Scan
+then means that no index could serve the lookup.
+"""
+
+import re
+
+import pytest
+from sqlalchemy import event
+
+from db import db
+from pagination import encode_cursor
+from seeding import Seeder
+
+# Tables that grow with the catalog, a full read of any of them fails the check
+CATALOG_TABLES = ("items", "tags", "items_tags", "stores")
+
+# Request of each scenario, as (method, path, expected status). DELETEs of
+# tags and stores send the If-Match of a prior GET. Tag 40 is linked to items,
+# so its deletion is refused by the in-use check.
+SCENARIOS = {
+    "store with its items and tags": ("GET", "/store/2", 200),
+    "store summary": ("GET", "/store/2/summary", 200),
+    "page of a store's tags": ("GET", "/store/2/tags?limit=5", 200),
+    "next page of a store's tags": ("GET", f"/store/2/tags?limit=5&cursor={encode_cursor([5])}", 200),
+    "item with its store and tags": ("GET", "/item/10", 200),
+    "next page of items": ("GET", f"/item?limit=20&cursor={encode_cursor([100])}", 200),
+    "items in a price range, dearest first": ("GET", "/item?price[gte]=100&price[lt]=200&sort=-price", 200),
+    "a store's items by name prefix": ("GET", "/item?store_id=2&name[prefix]=item-1", 200),
+    "items with a tag, cheapest first": ("GET", "/item?tag_id[in]=3,4&sort=price", 200),
+    "item search": ("GET", "/item/search?q=teal%20chair&limit=20", 200),
+    # answered by SQL, the tag index of the worker is still cold
+    "a store's items with all of three tags": ("GET", "/store/2/items?tags=1,2,3&match=all", 200),
+    "a store's items with any of three tags": ("GET", "/store/2/items?tags=1,2,3&match=any", 200),
+    "tag with its items": ("GET", "/tag/3", 200),
+    "link an item and a tag": ("POST", "/item/10/tag/3", 200),
+    "unlink an item and a tag": ("DELETE", "/item/10/tag/3", 200),
+    "delete a tag in use": ("DELETE", "/tag/40", 400),
+    "delete a store": ("DELETE", "/store/3", 200),
+}
+
+# Requests a scenario needs made first
+SETUP = {
+    "unlink an item and a tag": ("POST", "/item/10/tag/3"),
+}
+
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)(?! USING (?:COVERING )?INDEX)")
+_POSTGRESQL_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def full_scans(dialect, plan):
+    """Returns the catalog tables a plan (list of lines) reads in full."""
+    pattern = _SQLITE_FULL_SCAN if dialect == "sqlite" else _POSTGRESQL_FULL_SCAN
+    tables = []
+    for line in plan:
+        match = pattern.search(line.strip(" -|`"))
+        if match and match.group(1) in CATALOG_TABLES:
+            tables.append(match.group(1))
+    return tables
+
+
+def explain(connection, dialect, statement, parameters):
+    if dialect == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in rows]
+    connection.exec_driver_sql("SET enable_seqscan = off")
+    try:
+        return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)]
+    finally:
+        connection.exec_driver_sql("RESET enable_seqscan")
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_lookups_use_an_index(client, login, scenario):
+    Seeder().seed(stores=20, items=2000, tags=200, users=0, blocklisted=0)
+    headers = login()
+    method, path, expected = SCENARIOS[scenario]
+    if scenario in SETUP:
+        setup_method, setup_path = SETUP[scenario]
+        client.open(setup_path, method=setup_method, headers=headers)
+    if method == "DELETE" and path.startswith(("/tag/", "/store/")):
+        headers["If-Match"] = client.get(path, headers=headers).headers["ETag"]
+
+    engine = db.engine
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "DELETE")):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        response = client.open(path, method=method, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert response.status_code == expected
+    assert captured
+
+    # the store deletion is explained after the rows are gone, which the plans do not depend on
+    scans = {}
+    with engine.connect() as connection:
+        for statement, parameters in captured:
+            scanned = full_scans(engine.dialect.name,
+                                 explain(connection, engine.dialect.name, statement, parameters))
+            if scanned:
+                scans[statement] = scanned
+    assert not scans
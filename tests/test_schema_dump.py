@@ -0,0 +1,84 @@
+"""
+The generated dump functions of schema_compiler.py write the same JSON text
+as marshmallow, key order and int/float types included: for every response
+schema on a seeded catalog, for pruned copies like ?fields= and ?include=
+build, and for hand-made edge cases.
+"""
+
+import json
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.orm import selectinload
+
+from models import ItemModel, StoreModel, TagModel
+from schema_compiler import schema_compiler
+from schemas import (ItemSchema, PlainItemSchema, PlainStoreSchema, PlainTagSchema,
+                     StoreSchema, TagAndItemSchema, TagSchema)
+from seeding import Seeder
+
+
+class Name(str):
+    """A str subclass, which marshmallow converts to a plain str."""
+
+
+def dumped(schema, obj, compiled):
+    schema_compiler.enabled = compiled
+    try:
+        # no sort_keys: the key order is part of the parity
+        return json.dumps(schema.dump(obj), default=str)
+    finally:
+        schema_compiler.enabled = True
+
+
+def catalog_cases():
+    Seeder().seed(stores=5, items=200, tags=20, users=0, blocklisted=0)
+    items = ItemModel.query.options(
+        selectinload(ItemModel.store), selectinload(ItemModel.tags)).all()
+    stores = StoreModel.query.options(
+        selectinload(StoreModel.items), selectinload(StoreModel.tags)).all()
+    tags = TagModel.query.options(
+        selectinload(TagModel.items), selectinload(TagModel.store)).all()
+    return {
+        "ItemSchema": (ItemSchema(many=True), items),
+        "ItemSchema ?include=": (ItemSchema(many=True, only=("id", "name", "price")), items),
+        "ItemSchema ?fields[store]=name": (
+            ItemSchema(many=True, only=("id", "name", "price", "store.name", "tags.id",
+                                        "tags.name")), items),
+        "StoreSchema": (StoreSchema(many=True), stores),
+        "TagSchema": (TagSchema(many=True), tags),
+        "PlainItemSchema": (PlainItemSchema(many=True), items),
+    }
+
+
+def edge_cases():
+    store = StoreModel(id=7, name=Name("odd"))
+    tag = TagModel(id=3, name="t", store=store)
+    return {
+        "None values": (ItemSchema(), ItemModel(id=None, name=None, price=None, store=None)),
+        "Decimal price": (ItemSchema(), ItemModel(id=1, name="a", price=Decimal("1.10"),
+                                                  store=store, tags=[tag])),
+        "int price": (PlainItemSchema(), ItemModel(id=1, name="a", price=3)),
+        "str subclass": (StoreSchema(), store),
+        "mapping": (ItemSchema(), {"id": 1, "name": "a", "price": 2.5, "store": store}),
+        "mapping, missing keys": (ItemSchema(), {"name": "a"}),
+        "plain object": (PlainTagSchema(), Name("no attributes")),
+        "None": (PlainStoreSchema(), None),
+        "nested mapping": (TagAndItemSchema(), {
+            "message": "Item linked to tag.",
+            "item": ItemModel(id=1, name="a", price=1.0, store=store, tags=[tag]),
+            "tag": tag,
+        }),
+        "many": (PlainTagSchema(many=True), [tag, None, {"id": 4}]),
+    }
+
+
+def test_catalog_dump_parity(app):
+    different = [name for name, (schema, obj) in catalog_cases().items()
+                 if dumped(schema, obj, compiled=True) != dumped(schema, obj, compiled=False)]
+    assert not different
+
+
+@pytest.mark.parametrize("schema, obj", edge_cases().values(), ids=list(edge_cases()))
+def test_edge_case_dump_parity(app, schema, obj):
+    assert dumped(schema, obj, compiled=True) == dumped(schema, obj, compiled=False)
@@ -0,0 +1,66 @@
+"""
+DELETE /store/<id> checks If-Match without reading the items of a store
+large enough to be deleted by a background job.
+"""
+
+import time
+
+import pytest
+from sqlalchemy import event
+
+from db import db
+from seeding import Seeder
+
+
+@pytest.fixture
+def store(app, client):
+    # store 1 gets more than half of the items, the others a few
+    Seeder().seed(stores=3, items=60, tags=6, users=0, blocklisted=0)
+    app.config["STORE_DELETE_ASYNC_THRESHOLD"] = 20
+    return "/store/1"
+
+
+def delete_statements(client, path, etag):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.delete(path, headers={"If-Match": etag})
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return response, statements
+
+
+def test_large_store_is_checked_against_its_id_and_name(client, store):
+    etag = client.get(f"{store}?fields=id,name").headers["ETag"]
+    response, statements = delete_statements(client, store, etag)
+    assert response.status_code == 202
+    assert not [statement for statement in statements if "FROM items" in statement]
+
+    job = response.headers["Location"]
+    deadline = time.monotonic() + 10
+    while client.get(job).get_json()["status"] not in ("succeeded", "failed"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert client.get(job).get_json()["status"] == "succeeded"
+    assert client.get(store).status_code == 404
+
+
+def test_large_store_names_the_etag_it_requires(client, store):
+    etag = client.get(store).headers["ETag"]
+    response, statements = delete_statements(client, store, etag)
+    assert response.status_code == 412
+    assert response.get_json()["message"] == (
+        "The store is large, If-Match must hold the ETag of GET /store/1?fields=id,name.")
+    assert not [statement for statement in statements if "FROM items" in statement]
+
+
+def test_small_store_takes_either_etag(client, store):
+    assert client.delete("/store/2", headers={"If-Match": '"stale"'}).status_code == 412
+    full = client.get("/store/2").headers["ETag"]
+    assert client.delete("/store/2", headers={"If-Match": full}).status_code == 200
+    plain = client.get("/store/3?fields=id,name").headers["ETag"]
+    assert client.delete("/store/3", headers={"If-Match": plain}).status_code == 200
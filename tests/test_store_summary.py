@@ -0,0 +1,16 @@
+"""GET /store/<id>/summary reports the exact average price, from the counters or not."""
+
+import pytest
+
+
+@pytest.mark.parametrize("counters", [True, False])
+def test_average_price_is_not_rounded(app, client, counters):
+    app.config["CATALOG_COUNTERS_ENABLED"] = counters
+    client.post("/store", json={"name": "store"})
+    for item_id, price in enumerate((1.0, 1.0, 1.005), start=1):
+        client.put(f"/item/{item_id}", json={"name": f"item-{item_id}", "price": price, "store_id": 1},
+                   headers={"If-None-Match": "*"})
+    summary = client.get("/store/1/summary").get_json()
+    assert summary["item_count"] == 3
+    assert summary["avg_price"] == pytest.approx(3.005 / 3)
+    assert summary["avg_price"] != 1.0